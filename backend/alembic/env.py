@@ -12,7 +12,8 @@ from sqlalchemy import pool
 from alembic import context
 
 from app.db.base import Base
-from app.models import task, user  # 如有更多模型文件，也可一并导入
+from app.db.search_index import register_search_functions
+from app.models import task, user, chat_message, task_tombstone, chat_summary, chat_message_archive  # 如有更多模型文件，也可一并导入
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -73,6 +74,9 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
+        if connection.dialect.name == "sqlite":
+            # 全文索引触发器调用应用注册的 search_tokens 函数，迁移中写入任务或消息时同样需要
+            register_search_functions(connection.connection.driver_connection)
         context.configure(
             connection=connection, target_metadata=target_metadata
         )
@@ -0,0 +1,53 @@
+"""add composite indexes for hot task and chat queries
+
+Revision ID: 4f1c9a7d2e63
+Revises: b22884d9138b
+Create Date: 2026-10-17 10:12:41.218305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f1c9a7d2e63'
+down_revision: Union[str, None] = 'b22884d9138b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_tasks_user_id_due_date_id', 'tasks', ['user_id', 'due_date', 'id']),
+    ('ix_tasks_user_id_status_due_date', 'tasks', ['user_id', 'status', 'due_date']),
+    ('ix_tasks_user_id_status_type_due_date', 'tasks', ['user_id', 'status', 'type', 'due_date']),
+    ('ix_chat_messages_user_id_created_at', 'chat_messages', ['user_id', 'created_at']),
+]
+
+
+def _is_postgresql() -> bool:
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 表可能已由应用启动时的 create_all 创建了这些索引，因此使用 IF NOT EXISTS
+    if _is_postgresql():
+        # 在线上库中并发建索引，避免长时间锁住写入
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+            op.drop_index('ix_tasks_user_id', table_name='tasks', postgresql_concurrently=True, if_exists=True)
+    else:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True)
+        # 单列 user_id 索引已被复合索引的前缀覆盖
+        op.drop_index('ix_tasks_user_id', table_name='tasks', if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_tasks_user_id', 'tasks', ['user_id'], if_not_exists=True)
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
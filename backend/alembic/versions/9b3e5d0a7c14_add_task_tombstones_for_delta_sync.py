@@ -0,0 +1,48 @@
+"""add task tombstones and updated_at index for delta sync
+
+Revision ID: 9b3e5d0a7c14
+Revises: 4f1c9a7d2e63
+Create Date: 2026-10-17 11:02:09.540117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b3e5d0a7c14'
+down_revision: Union[str, None] = '4f1c9a7d2e63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'task_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_task_tombstones_user_id_deleted_at', 'task_tombstones', ['user_id', 'deleted_at'], if_not_exists=True)
+    if op.get_bind().dialect.name == 'sqlite':
+        # SQLite 的 INTEGER PRIMARY KEY 会复用最大的已删除ID，重建 tasks 表加上 AUTOINCREMENT，
+        # 否则墓碑中的ID可能指向新任务，增量同步会同时返回删除和新建
+        with op.batch_alter_table('tasks', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+    # 旧数据在插入时没有写 updated_at，用 created_at 回填，使增量同步只需比较 updated_at
+    op.execute("UPDATE tasks SET updated_at = created_at WHERE updated_at IS NULL")
+    op.create_index('ix_tasks_user_id_updated_at', 'tasks', ['user_id', 'updated_at'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tasks_user_id_updated_at', table_name='tasks', if_exists=True)
+    op.drop_index('ix_task_tombstones_user_id_deleted_at', table_name='task_tombstones', if_exists=True)
+    op.drop_table('task_tombstones')
+    # tasks 表保留 AUTOINCREMENT：与模型定义一致，且不影响旧版本代码
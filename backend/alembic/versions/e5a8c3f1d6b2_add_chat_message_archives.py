@@ -0,0 +1,49 @@
+"""add compressed chat message archive
+
+Revision ID: e5a8c3f1d6b2
+Revises: c7d41e8b2f90
+Create Date: 2026-10-17 19:40:12.530817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a8c3f1d6b2'
+down_revision: Union[str, None] = 'c7d41e8b2f90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 超过保留期的聊天消息按用户和日期压缩后移到这张表，chat_messages 只保留近期消息
+    op.create_table(
+        'chat_message_archives',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.String(length=10), nullable=False),
+        sa.Column('first_message_id', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=False),
+        sa.Column('first_created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_chat_message_archives_user_id_day', 'chat_message_archives', ['user_id', 'day'], if_not_exists=True)
+    # 归档任务按 (created_at, id) 取出超过保留期的消息，避免全表扫描
+    op.create_index('ix_chat_messages_created_at_id', 'chat_messages', ['created_at', 'id'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chat_messages_created_at_id', table_name='chat_messages', if_exists=True)
+    op.drop_index('ix_chat_message_archives_user_id_day', table_name='chat_message_archives', if_exists=True)
+    op.drop_table('chat_message_archives')
@@ -0,0 +1,52 @@
+"""add full-text search indexes for tasks and chat messages
+
+Revision ID: f2b7d4a9c1e8
+Revises: e5a8c3f1d6b2
+Create Date: 2026-10-17 20:31:05.284416
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.db.search_index import (
+    SEARCH_SOURCES, search_index_statements, sqlite_backfill_statement, register_search_functions,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b7d4a9c1e8'
+down_revision: Union[str, None] = 'e5a8c3f1d6b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    if dialect == "sqlite":
+        register_search_functions(bind.connection.driver_connection)
+    for table in SEARCH_SOURCES:
+        # SQLite：FTS5表和同步触发器；PostgreSQL：tsvector生成列（自动回填）和GIN索引
+        for statement in search_index_statements(dialect, table):
+            bind.exec_driver_sql(statement)
+        if dialect == "sqlite":
+            # 已有数据写入索引，之后的变更由触发器同步
+            bind.exec_driver_sql(sqlite_backfill_statement(table))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    for table in SEARCH_SOURCES:
+        if bind.dialect.name == "sqlite":
+            for suffix in ("insert", "delete", "update"):
+                bind.exec_driver_sql(f"DROP TRIGGER IF EXISTS {table}_fts_{suffix}")
+            bind.exec_driver_sql(f"DROP TABLE IF EXISTS {table}_fts")
+        elif bind.dialect.name == "postgresql":
+            bind.exec_driver_sql(f"DROP INDEX IF EXISTS ix_{table}_search_vector")
+            bind.exec_driver_sql(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
+    if bind.dialect.name == "postgresql":
+        bind.exec_driver_sql("DROP FUNCTION IF EXISTS search_tokens(text)")
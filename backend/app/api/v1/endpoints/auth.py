@@ -1,32 +1,25 @@
 from fastapi import APIRouter, status, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_db
 from app.schemas.user import UserCreate, UserLogin, UserResponse
 from app.services.user_service import UserService
 from app.core.security import create_access_token
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    existing = UserService.get_by_email(db, user.email)
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    existing = await UserService.get_by_email(db, user.email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    new_user = UserService.create_user(db, user.email, user.password)
+    new_user = await UserService.create_user(db, user.email, user.password)
     if not new_user:
         raise HTTPException(status_code=400, detail="Registration failed")
     return new_user
 
 @router.post("/login")
-def login_user(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = UserService.authenticate(db, user.email, user.password)
+async def login_user(user: UserLogin, db: AsyncSession = Depends(get_db)):
+    db_user = await UserService.authenticate(db, user.email, user.password)
     if not db_user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     access_token = create_access_token({"sub": str(db_user.id)})
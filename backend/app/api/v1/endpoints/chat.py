@@ -1,18 +1,53 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any, Union
-from sqlalchemy.orm import Session
+from typing import List, Optional, Dict, Any
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import get_db
-from app.services.ai_service import chat_with_ai, get_goal_assistant_system_prompt
+from app.services.ai_service import chat_with_ai, stream_chat_with_ai, get_goal_assistant_system_prompt
 from app.services.task_intent_service import parse_user_request
-from app.services.chat_message_service import ChatMessageService
+from app.services.chat_context_service import ChatContextService, chat_summarizer
+from app.services.chat_message_writer import chat_message_writer
+from app.services.provider_limiter import ProviderBusyError
+from app.services.provider_router import ProviderUnavailableError
+from app.core.config import settings
 from app.utils.logger import logger
-from app.models.user import User
-from app.utils.auth import get_current_user
+from app.utils.auth import AuthenticatedUser, get_current_user
+import asyncio
 import json
+import time
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+class SpeculationStats:
+    """
+    /chat 投机调用统计
+
+    started: 与意图分析并行发起的普通回复调用次数
+    used: 没有任务意图、投机回复被采用的次数
+    wasted: 识别出任务意图、投机回复被取消的次数（已产生的调用成本浪费）
+    intent_resolved_early: 意图在等待窗口内得出、未发起投机调用的次数
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.used = 0
+        self.wasted = 0
+        self.intent_resolved_early = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.CHAT_SPECULATIVE_COMPLETION,
+            "delay_ms": settings.CHAT_SPECULATIVE_DELAY_MS,
+            "started": self.started,
+            "used": self.used,
+            "wasted": self.wasted,
+            "wasted_rate": round(self.wasted / self.started, 4) if self.started else 0.0,
+            "intent_resolved_early": self.intent_resolved_early,
+        }
+
+speculation_stats = SpeculationStats()
+
 class ChatRequest(BaseModel):
     message: Optional[str] = None
     messages: Optional[List[Dict[str, str]]] = None
@@ -24,47 +59,106 @@ class ChatResponse(BaseModel):
     response: str
     task_intent: Optional[Dict[str, Any]] = None  # 任务意图结果
 
+async def build_chat_messages(
+    request: ChatRequest,
+    db: AsyncSession,
+    current_user: Optional[AuthenticatedUser]
+):
+    """
+    根据请求和历史记录构建发送给AI的消息列表
+
+    Returns:
+        (messages, user_message, summary)，user_message 为本次用户发送的最新消息，
+        summary 为早期对话的滚动摘要（没有时为None）
+    """
+    # 处理消息输入
+    if request.messages:
+        messages = request.messages
+        user_message = messages[-1]["content"] if messages and messages[-1]["role"] == "user" else None
+    elif request.message:
+        user_message = request.message
+        messages = [{"role": "user", "content": user_message}]
+    else:
+        raise HTTPException(status_code=400, detail="No message(s) provided.")
+    
+    summary = None
+    # 如果用户已登录且启用了历史记录（客户端自带完整消息列表时不读取历史）
+    if current_user and request.use_history and not request.messages:
+        # 在token预算内获取历史消息作为上下文
+        context = await ChatContextService.build_context(
+            db=db,
+            user_id=current_user.id,
+            new_message=user_message
+        )
+        if context.fold_before_id is not None:
+            # 放不下的旧消息在后台折叠进摘要，不阻塞本次请求
+            chat_summarizer.schedule(current_user.id, context.fold_before_id)
+        summary = context.summary
+        messages = context.messages + [{"role": "user", "content": user_message}]
+    return messages, user_message, summary
+
+def turn_messages(user_message: Optional[str], reply: str) -> List[Dict[str, str]]:
+    """
+    一轮对话中需要保存的消息：用户消息（如果有）和回复
+    """
+    messages = [{"role": "user", "content": user_message}] if user_message else []
+    messages.append({"role": "assistant", "content": reply})
+    return messages
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    编码一条Server-Sent Events消息
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def single_chunk(text: str):
+    """
+    将一段完整文本包装为只有一个片段的异步迭代器
+    """
+    yield text
+
 @router.post("/", response_model=ChatResponse)
-def chat(
+async def chat(
     request: ChatRequest, 
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[AuthenticatedUser] = Depends(get_current_user)
 ):
     try:
-        # 处理消息输入
-        if request.messages:
-            messages = request.messages
-            user_message = messages[-1]["content"] if messages and messages[-1]["role"] == "user" else None
-        elif request.message:
-            user_message = request.message
-            messages = [{"role": "user", "content": user_message}]
-        else:
-            raise HTTPException(status_code=400, detail="No message(s) provided.")
+        messages, user_message, summary = await build_chat_messages(request, db, current_user)
         
         # 获取系统提示
-        system_prompt = get_goal_assistant_system_prompt()
-        
-        # 如果用户已登录且启用了历史记录
-        context_messages = []
-        if current_user and request.use_history:
-            # 获取历史消息作为上下文
-            context_messages = ChatMessageService.get_messages_for_context(
-                db=db, 
-                user_id=current_user.id,
-                max_messages=20  # 最多使用20条历史消息
-            )
-            
-            # 将新消息添加到上下文中
-            if not request.messages:  # 只有单条消息时才需要手动添加
-                context_messages.append({"role": "user", "content": user_message})
-                
-            messages = context_messages if request.messages is None else messages
+        system_prompt = get_goal_assistant_system_prompt(summary)
         
         # 分析任务意图（如果需要）
         task_intent = None
+        completion_task = None
         if request.analyze_task_intent and current_user and user_message:
-            intent_result = parse_user_request(user_message, request.model_provider)
+            intent_task = asyncio.create_task(parse_user_request(user_message, request.model_provider))
+            try:
+                # 意图在等待窗口内（本地分类器或缓存命中）得出时不需要投机调用
+                await asyncio.wait({intent_task}, timeout=settings.CHAT_SPECULATIVE_DELAY_MS / 1000)
+                if not intent_task.done() and settings.CHAT_SPECULATIVE_COMPLETION:
+                    # 与意图分析并行生成普通回复，非任务消息不必等待两次串行的LLM延迟
+                    completion_task = asyncio.create_task(chat_with_ai(
+                        messages=messages,
+                        model_provider=request.model_provider,
+                        system_prompt=system_prompt
+                    ))
+                    speculation_stats.started += 1
+                elif intent_task.done():
+                    speculation_stats.intent_resolved_early += 1
+                intent_result = await intent_task
+            except BaseException:
+                intent_task.cancel()
+                if completion_task:
+                    completion_task.cancel()
+                raise
+
             if not intent_result.is_empty:
+                if completion_task:
+                    # 找到了任务意图，投机生成的回复作废
+                    completion_task.cancel()
+                    speculation_stats.wasted += 1
                 # 找到任务意图，返回
                 task_intent = intent_result.to_dict()
                 
@@ -74,19 +168,11 @@ def chat(
                 
                 # 保存用户消息和系统回复
                 if current_user:
-                    ChatMessageService.create_message(
-                        db=db,
-                        user_id=current_user.id,
-                        role="user",
-                        content=user_message,
-                        model_provider=request.model_provider
-                    )
-                    ChatMessageService.create_message(
-                        db=db,
-                        user_id=current_user.id,
-                        role="assistant",
-                        content=response_text,
-                        model_provider=request.model_provider
+                    await chat_message_writer.save(
+                        current_user.id,
+                        turn_messages(user_message, response_text),
+                        model_provider=request.model_provider,
+                        db=db
                     )
                 
                 return ChatResponse(
@@ -94,31 +180,25 @@ def chat(
                     task_intent=task_intent
                 )
             
-        # 没有找到任务意图或不需要分析，调用AI服务
-        ai_response = chat_with_ai(
-            messages=messages, 
-            model_provider=request.model_provider,
-            system_prompt=system_prompt
-        )
+        # 没有找到任务意图或不需要分析，使用投机调用的结果或调用AI服务
+        if completion_task:
+            speculation_stats.used += 1
+            ai_response = await completion_task
+        else:
+            ai_response = await chat_with_ai(
+                messages=messages, 
+                model_provider=request.model_provider,
+                system_prompt=system_prompt
+            )
         
         # 保存用户消息和AI回复
         if current_user:
             # 只保存最新的用户消息和AI回复，不保存整个历史
-            if user_message:
-                ChatMessageService.create_message(
-                    db=db,
-                    user_id=current_user.id,
-                    role="user",
-                    content=user_message,
-                    model_provider=request.model_provider
-                )
-            
-            ChatMessageService.create_message(
-                db=db,
-                user_id=current_user.id,
-                role="assistant",
-                content=ai_response,
-                model_provider=request.model_provider
+            await chat_message_writer.save(
+                current_user.id,
+                turn_messages(user_message, ai_response),
+                model_provider=request.model_provider,
+                db=db
             )
         
         # 检查AI返回的是否可能是任务操作（向后兼容）
@@ -127,10 +207,94 @@ def chat(
                 data = json.loads(ai_response)
                 if isinstance(data, dict) and "action" in data and "confirmation_prompt" in data:
                     task_intent = data
-            except:
+            except ValueError:
                 pass
         
         return ChatResponse(response=ai_response, task_intent=task_intent)
+    except (ProviderBusyError, ProviderUnavailableError):
+        # 由全局异常处理返回 503 和 Retry-After
+        raise
     except Exception as e:
         logger.error(f"[Chat Endpoint Error] {e}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/stream")
+async def chat_stream(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[AuthenticatedUser] = Depends(get_current_user)
+):
+    """
+    以Server-Sent Events流式返回AI回复
+
+    事件依次为若干 `chunk`（{"content": 文本片段}），最后是 `done`
+    （{"response": 完整回复, "task_intent": ...}）；出错时发送 `error`（{"detail": ...}）后结束。
+    第一个片段到达前出错时直接返回错误状态码：排队已满或提供商全部熔断时为 503。
+    流结束后才保存用户消息和完整的AI回复，中途失败的回复不会写入聊天记录。
+    """
+    started = time.perf_counter()
+    messages, user_message, summary = await build_chat_messages(request, db, current_user)
+    system_prompt = get_goal_assistant_system_prompt(summary)
+
+    # 有效的任务意图不需要调用聊天模型，直接以单个片段返回确认提示
+    task_intent = None
+    chunks = None
+    if request.analyze_task_intent and current_user and user_message:
+        intent_result = await parse_user_request(user_message, request.model_provider)
+        if not intent_result.is_empty:
+            task_intent = intent_result.to_dict()
+            chunks = single_chunk(intent_result.confirmation_prompt)
+
+    try:
+        if chunks is None:
+            chunks = stream_chat_with_ai(
+                messages=messages,
+                model_provider=request.model_provider,
+                system_prompt=system_prompt
+            )
+        # 排队许可在取第一个片段时才获取，响应开始前先取出第一个片段，
+        # 排队已满或提供商不可用时仍能返回 503，而不是在200的流中报错
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = None
+    except (ProviderBusyError, ProviderUnavailableError):
+        # 由全局异常处理返回 503 和 Retry-After
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"[Chat Stream Error] {e}")
+        raise HTTPException(status_code=502, detail="AI provider request failed")
+
+    async def event_stream():
+        parts = []
+        if first_chunk is not None:
+            logger.info(f"[Chat Stream] time to first token: {(time.perf_counter() - started) * 1000:.0f}ms")
+            parts.append(first_chunk)
+            yield format_sse("chunk", {"content": first_chunk})
+            try:
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    yield format_sse("chunk", {"content": chunk})
+            except Exception as e:
+                # 详细错误只写日志，不把提供商的内部信息发给客户端
+                logger.error(f"[Chat Stream Error] {e}")
+                yield format_sse("error", {"detail": "AI provider stream failed"})
+                return
+
+        ai_response = "".join(parts)
+        if current_user:
+            # 依赖注入的会话只在请求处理期间有效，流式响应中不传入会话，同步写入时使用独立会话
+            await chat_message_writer.save(
+                current_user.id,
+                turn_messages(user_message, ai_response),
+                model_provider=request.model_provider
+            )
+        logger.info(f"[Chat Stream] completed in {(time.perf_counter() - started) * 1000:.0f}ms, {len(parts)} chunks")
+        yield format_sse("done", {"response": ai_response, "task_intent": task_intent})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
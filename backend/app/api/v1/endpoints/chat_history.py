@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import datetime
+import json
 
 from app.db.session import get_db
+from app.schemas.delete_job import DeleteJobResponse
+from app.services.bulk_delete_service import bulk_deleter
 from app.services.chat_message_service import ChatMessageService
-from app.models.user import User
-from app.utils.auth import get_current_active_user
+from app.services.chat_message_writer import chat_message_writer
+from app.utils.auth import AuthenticatedUser, get_current_active_user
+from app.utils.pagination import encode_cursor, decode_cursor, parse_cursor_datetime
 
 router = APIRouter(prefix="/chat-history", tags=["chat history"])
 
@@ -19,71 +23,92 @@ class ChatMessageResponse(BaseModel):
     model_provider: Optional[str] = None
     
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class GroupedChatResponse(BaseModel):
     date: str
+    count: int  # 当天的消息总数，可能多于本页返回的消息
     messages: List[ChatMessageResponse]
 
 @router.get("/", response_model=List[GroupedChatResponse])
-def get_chat_history(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user),
-    days: int = Query(7, description="获取最近几天的聊天记录"),
-    limit: int = Query(200, description="每次获取的最大消息数量"),
+async def get_chat_history(
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+    days: int = Query(7, ge=1, le=366, description="每页覆盖的天数"),
+    limit: int = Query(200, ge=1, le=1000, description="每页最多返回的消息数量"),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 中的游标，用于加载更早的记录"),
 ):
     """
-    获取当前用户的聊天历史记录，按日期分组
+    获取当前用户的聊天历史记录，按日期分组，日期倒序
+
+    第一页为包括今天在内的最近 days 天；还有更早的记录时响应头带有 X-Next-Cursor，
+    传回 cursor 参数加载更早的 days 天。一天的消息超过 limit 时会跨页返回。
     """
-    # 计算开始日期
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    # 获取消息
-    messages = ChatMessageService.get_messages_by_user(
+    before = None
+    if cursor:
+        try:
+            created_at_value, last_id = decode_cursor(cursor, 2)
+            before_at = parse_cursor_datetime(created_at_value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if before_at is None or not isinstance(last_id, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        before = (before_at, last_id)
+
+    groups, next_cursor = await ChatMessageService.get_history_page(
         db=db,
         user_id=current_user.id,
+        days=days,
         limit=limit,
-        start_date=start_date
+        before=before
     )
-    
-    # 按日期分组
-    grouped_messages = ChatMessageService.group_messages_by_date(messages)
-    
-    # 构建响应
-    result = []
-    for date, msgs in grouped_messages.items():
-        result.append(GroupedChatResponse(
-            date=date,
-            messages=[ChatMessageResponse.from_orm(msg) for msg in msgs]
-        ))
-    
-    # 按日期排序
-    result.sort(key=lambda x: x.date, reverse=True)
-    
-    return result
+
+    # 查询结果已是可序列化的字典，直接编码，不再逐条构建模型
+    headers = {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = encode_cursor(*next_cursor)
+    return Response(content=json.dumps(groups, ensure_ascii=False), media_type="application/json", headers=headers)
 
 @router.delete("/{message_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_message(
+async def delete_message(
     message_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
 ):
     """
     删除单条聊天消息
     """
-    success = ChatMessageService.delete_message(db, message_id, current_user.id)
+    success = await ChatMessageService.delete_message(db, message_id, current_user.id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Message not found or not owned by current user"
         )
 
-@router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
-def clear_history(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user),
+@router.delete("/", response_model=DeleteJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def clear_history(
+    response: Response,
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
 ):
     """
     清空当前用户的所有聊天记录
+
+    在后台分批删除，立即返回删除任务；通过 Location 头中的地址查询进度
+    """
+    # 写后队列中尚未提交的消息先写入，避免清空后又出现
+    await chat_message_writer.flush()
+    job = await bulk_deleter.submit("chat_history", current_user.id)
+    response.headers["Location"] = f"{router.prefix}/jobs/{job.id}"
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}", response_model=DeleteJobResponse)
+async def get_clear_history_job(
+    job_id: str,
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+):
+    """
+    查询清空聊天记录任务的进度
+
+    任务只保存在受理它的进程中，查询不到（包括其他用户的任务）时 status 为 unknown
     """
-    ChatMessageService.clear_user_history(db, current_user.id) 
\ No newline at end of file
+    return bulk_deleter.describe(job_id, "chat_history", current_user.id)
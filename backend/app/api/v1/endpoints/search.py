@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from pydantic import BaseModel
+from datetime import datetime
+
+from app.db.session import get_db
+from app.services.search_service import SearchService, SEARCH_TYPES
+from app.utils.auth import AuthenticatedUser, get_current_active_user
+from app.utils.pagination import encode_cursor, decode_cursor
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+# 游标可以跳过的最多结果数，更深的分页没有实际意义且越来越慢
+MAX_SEARCH_OFFSET = 1000
+
+class SearchResult(BaseModel):
+    type: str  # task 或 message
+    id: int
+    text: str
+    score: float
+    created_at: Optional[datetime] = None
+    status: Optional[str] = None  # 任务状态
+    role: Optional[str] = None  # 消息角色
+
+@router.get("", response_model=List[SearchResult])
+async def search(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200, description="检索词，支持中文"),
+    type: Optional[str] = Query(None, pattern="^(task|message)$", description="只检索任务或消息，默认两者都检索"),
+    limit: int = Query(20, ge=1, le=100, description="每页结果数"),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 中的游标"),
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+):
+    """
+    在当前用户的任务和聊天消息中全文检索，按相关度排序
+
+    所有检索词都必须出现；中文按子串匹配，最后一个英文单词按前缀匹配。
+    还有更多结果时响应头带有 X-Next-Cursor。
+    """
+    offset = 0
+    if cursor:
+        try:
+            (offset,) = decode_cursor(cursor, 1)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if not isinstance(offset, int) or not 0 <= offset <= MAX_SEARCH_OFFSET:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    rows = await SearchService.search(
+        db,
+        current_user.id,
+        q,
+        types=[type] if type else list(SEARCH_TYPES),
+        limit=limit,
+        offset=offset,
+    )
+    if len(rows) > limit and offset + limit <= MAX_SEARCH_OFFSET:
+        response.headers["X-Next-Cursor"] = encode_cursor(offset + limit)
+    return [
+        SearchResult(
+            type=row["type"],
+            id=row["id"],
+            text=row["text"],
+            score=row["score"],
+            created_at=row["created_at"],
+            **{"status" if row["type"] == "task" else "role": row["extra"]},
+        )
+        for row in rows[:limit]
+    ]
@@ -1,34 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
-from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Query, Header
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, insert, delete, and_, or_
+from sqlalchemy import update as update_stmt
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_db
 from app.models.task import Task
-from app.schemas.task import TaskResponse, TaskCreate, TaskUpdate
+from app.schemas.task import TaskResponse, TaskCreate, TaskUpdate, TaskBatchRequest, TaskBatchResponse, TaskBatchResult, TaskChangesResponse
 from typing import List, Dict, Any, Optional
 from app.services.task_intent_service import parse_user_request, parse_query_intent, get_tasks_by_query, TaskIntent
+from app.services.task_cache import task_list_cache, get_task_list_version
+from app.services.bulk_delete_service import bulk_deleter
+from app.schemas.delete_job import DeleteJobResponse
+from app.services.task_sync_service import (
+    add_task_tombstones, prune_task_tombstones, get_task_changes, encode_sync_token, decode_sync_token
+)
+import itertools
 import json
 from datetime import datetime
 from app.utils.logger import logger
-from app.models.user import User
-from app.utils.auth import get_current_active_user
+from app.utils.auth import AuthenticatedUser, get_current_active_user
+from app.utils.cache import MISSING
+from app.utils.etag import compute_etag, etag_matches
+from app.utils.pagination import encode_cursor, decode_cursor, parse_cursor_datetime
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/tasks", tags=["tasks"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# 单次批量请求允许的最大操作数
+MAX_BATCH_OPERATIONS = 500
+
+# 可通过更新操作修改的任务字段
+UPDATABLE_TASK_FIELDS = ("status", "text", "due_date", "start_date", "end_date", "type")
+
+def get_task_validation_error(task_type, due_date, start_date, end_date) -> Optional[str]:
+    """
+    按任务类型校验日期字段，返回错误信息；校验通过时返回None
+    """
+    if task_type == "ddl" and not due_date:
+        return "DDL task requires due_date."
+    if task_type == "event" and (not start_date or not end_date):
+        return "Event task requires start_date and end_date."
+    return None
 
 @router.post("/", response_model=TaskResponse, status_code=status.HTTP_201_CREATED)
-def create_task(task: TaskCreate, db: Session = Depends(get_db)):
+async def create_task(task: TaskCreate, db: AsyncSession = Depends(get_db)):
     print(f"[create_task] start_date={task.start_date}, end_date={task.end_date}")
     # Validation based on type
-    if task.type == "ddl" and not task.due_date:
-        raise HTTPException(status_code=422, detail="DDL task requires due_date.")
-    if task.type == "event" and (not task.start_date or not task.end_date):
-        raise HTTPException(status_code=422, detail="Event task requires start_date and end_date.")
+    error = get_task_validation_error(task.type, task.due_date, task.start_date, task.end_date)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
     new_task = Task(
         user_id=task.user_id,
         text=task.text,
@@ -38,14 +58,16 @@ def create_task(task: TaskCreate, db: Session = Depends(get_db)):
         type=task.type or "todo"
     )
     db.add(new_task)
-    db.commit()
-    db.refresh(new_task)
+    await db.commit()
+    await db.refresh(new_task)
+    await task_list_cache.invalidate_user(new_task.user_id)
     return new_task
 
 @router.patch("/{task_id}", response_model=TaskResponse)
-def update_task_status(task_id: int, update: TaskUpdate, db: Session = Depends(get_db)):
+async def update_task_status(task_id: int, update: TaskUpdate, db: AsyncSession = Depends(get_db)):
     print(f"[update_task_status] start_date={update.start_date}, end_date={update.end_date}")
-    task = db.query(Task).filter(Task.id == task_id).first()
+    result = await db.execute(select(Task).filter(Task.id == task_id))
+    task = result.scalars().first()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     if update.status is not None:
@@ -61,31 +83,253 @@ def update_task_status(task_id: int, update: TaskUpdate, db: Session = Depends(g
     if update.type is not None:
         task.type = update.type
     # Validation based on type after update
-    if task.type == "ddl" and not task.due_date:
-        raise HTTPException(status_code=422, detail="DDL task requires due_date.")
-    if task.type == "event" and (not task.start_date or not task.end_date):
-        raise HTTPException(status_code=422, detail="Event task requires start_date and end_date.")
-    db.commit()
-    db.refresh(task)
+    error = get_task_validation_error(task.type, task.due_date, task.start_date, task.end_date)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
+    await db.commit()
+    await db.refresh(task)
+    await task_list_cache.invalidate_user(task.user_id)
     return task
 
 @router.get("/user/{user_id}", response_model=List[TaskResponse])
-def get_user_tasks(user_id: int, db: Session = Depends(get_db), status: str = None):
-    query = db.query(Task).filter(Task.user_id == user_id)
-    if status:
-        query = query.filter(Task.status == status)
-    tasks = query.order_by(Task.due_date).all()
-    return tasks
+async def get_user_tasks(
+    user_id: int,
+    db: AsyncSession = Depends(get_db),
+    status: str = None,
+    limit: int = Query(50, ge=1, le=200, description="每页任务数"),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 中的游标"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    获取用户任务列表，按 (due_date, id) 排序，没有截止日期的任务排在最后
+
+    支持基于游标的分页，以及基于 ETag / If-None-Match 的条件请求。
+    序列化后的页面按 ETag 缓存，ETag 由每次请求时查询的任务版本信息计算，多个worker之间也不会返回过期数据。
+    """
+    # ETag 每次都由数据库中的版本信息计算，不依赖进程内缓存是否已失效
+    version = await get_task_list_version(db, user_id)
+    etag = compute_etag(user_id, *version, status, limit, cursor)
+    headers = {"ETag": etag}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    cache_key = await task_list_cache.make_key(user_id, "user_tasks", etag)
+    cached = await task_list_cache.get(cache_key)
+    if cached is MISSING:
+        query = select(Task).filter(Task.user_id == user_id)
+        if status:
+            query = query.filter(Task.status == status)
+        if cursor:
+            try:
+                due_date_value, last_id = decode_cursor(cursor, 2)
+                last_due_date = parse_cursor_datetime(due_date_value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            if not isinstance(last_id, int):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            if last_due_date is None:
+                query = query.filter(Task.due_date.is_(None), Task.id > last_id)
+            else:
+                query = query.filter(or_(
+                    Task.due_date > last_due_date,
+                    and_(Task.due_date == last_due_date, Task.id > last_id),
+                    Task.due_date.is_(None),
+                ))
+        query = query.order_by(Task.due_date.asc().nulls_last(), Task.id).limit(limit + 1)
+
+        tasks = (await db.execute(query)).scalars().all()
+        next_cursor = None
+        if len(tasks) > limit:
+            tasks = tasks[:limit]
+            next_cursor = encode_cursor(tasks[-1].due_date, tasks[-1].id)
+        body = json.dumps(jsonable_encoder([TaskResponse.from_orm(task) for task in tasks])).encode("utf-8")
+        cached = (body, next_cursor)
+        await task_list_cache.set(cache_key, cached, size=len(body))
+
+    body, next_cursor = cached
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.delete("/{task_id}", status_code=204)
-def delete_task(task_id: int, db: Session = Depends(get_db)):
-    task = db.query(Task).filter(Task.id == task_id).first()
+async def delete_task(task_id: int, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(Task).filter(Task.id == task_id))
+    task = result.scalars().first()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    db.delete(task)
-    db.commit()
+    add_task_tombstones(db, [(task.id, task.user_id)])
+    await prune_task_tombstones(db, task.user_id)
+    await db.delete(task)
+    await db.commit()
+    await task_list_cache.invalidate_user(task.user_id)
     return Response(status_code=204)
 
+@router.delete("/user/{user_id}", response_model=DeleteJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def delete_user_tasks(
+    user_id: int,
+    response: Response,
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+):
+    """
+    删除当前用户的全部任务
+
+    在后台分批删除（每个任务都写入墓碑，增量同步的客户端会收到删除），立即返回删除任务；
+    通过 Location 头中的地址查询进度
+    """
+    if user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Cannot delete another user's tasks")
+    job = await bulk_deleter.submit("tasks", user_id)
+    response.headers["Location"] = f"{router.prefix}/delete-jobs/{job.id}"
+    return job.to_dict()
+
+@router.get("/delete-jobs/{job_id}", response_model=DeleteJobResponse)
+async def get_delete_tasks_job(
+    job_id: str,
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+):
+    """
+    查询删除当前用户全部任务的进度
+
+    任务只保存在受理它的进程中，查询不到（包括其他用户的任务）时 status 为 unknown
+    """
+    return bulk_deleter.describe(job_id, "tasks", current_user.id)
+
+@router.get("/changes", response_model=TaskChangesResponse)
+async def get_changes(
+    user_id: int = Query(...),
+    since: Optional[str] = Query(None, description="上次响应中的 sync_token，不传则全量同步"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    增量同步：返回自 since 以来创建或更新的任务，以及被删除的任务ID
+
+    客户端按ID覆盖写入 tasks、删除 deleted_ids，并保存新的 sync_token。
+    同一变更可能在相邻两次同步中重复出现，客户端应按ID幂等处理。
+    """
+    try:
+        since_time = decode_sync_token(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    tasks, deleted_ids, next_since, full_resync = await get_task_changes(db, user_id, since_time)
+    return TaskChangesResponse(
+        tasks=[TaskResponse.from_orm(task) for task in tasks],
+        deleted_ids=deleted_ids,
+        sync_token=encode_sync_token(next_since),
+        full_resync=full_resync,
+    )
+
+@router.post("/batch", response_model=TaskBatchResponse)
+async def batch_tasks(request: TaskBatchRequest, response: Response, db: AsyncSession = Depends(get_db)):
+    """
+    在一个事务中批量创建、更新和删除任务
+
+    每个操作使用与单条接口相同的校验规则，结果按请求顺序返回。
+    校验失败的操作会被跳过；atomic=True 时任一操作失败则整批不提交并返回422。
+    """
+    operations = request.operations
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BATCH_OPERATIONS} operations per batch.")
+
+    # 一次查询加载所有被更新或删除的任务
+    target_ids = {op.id for op in operations if op.op != "create" and op.id is not None}
+    existing: Dict[int, Dict[str, Any]] = {}
+    owners: Dict[int, int] = {}
+    if target_ids:
+        rows = await db.execute(select(Task).filter(Task.id.in_(target_ids)))
+        for task in rows.scalars():
+            existing[task.id] = {field: getattr(task, field) for field in UPDATABLE_TASK_FIELDS}
+            owners[task.id] = task.user_id
+
+    results: List[TaskBatchResult] = []
+    creates = []
+    updates: Dict[int, Dict[str, Any]] = {}
+    update_results: Dict[int, List[TaskBatchResult]] = {}
+    deletes = set()
+
+    for index, op in enumerate(operations):
+        result = TaskBatchResult(index=index, op=op.op, status_code=200, id=op.id)
+        results.append(result)
+
+        if op.op == "create":
+            if op.user_id is None or not op.text:
+                result.status_code, result.error = 422, "Create requires user_id and text."
+                continue
+            task_type = op.type or "todo"
+            error = get_task_validation_error(task_type, op.due_date, op.start_date, op.end_date)
+            if error:
+                result.status_code, result.error = 422, error
+                continue
+            creates.append((result, {
+                "user_id": op.user_id,
+                "text": op.text,
+                "status": op.status or "todo",
+                "type": task_type,
+                "due_date": op.due_date,
+                "start_date": op.start_date,
+                "end_date": op.end_date,
+            }))
+            continue
+
+        if op.id is None:
+            result.status_code, result.error = 422, f"{op.op.capitalize()} requires id."
+            continue
+        if op.id not in existing or op.id in deletes:
+            result.status_code, result.error = 404, "Task not found"
+            continue
+
+        if op.op == "delete":
+            deletes.add(op.id)
+            updates.pop(op.id, None)
+            result.status_code = 204
+            continue
+
+        # 同一任务的多次更新按顺序合并，并以合并后的值做校验
+        changes = {field: getattr(op, field) for field in UPDATABLE_TASK_FIELDS if getattr(op, field) is not None}
+        merged = {**existing[op.id], **changes}
+        error = get_task_validation_error(merged["type"], merged["due_date"], merged["start_date"], merged["end_date"])
+        if error:
+            result.status_code, result.error = 422, error
+            continue
+        existing[op.id] = merged
+        updates.setdefault(op.id, {}).update(changes)
+        update_results.setdefault(op.id, []).append(result)
+
+    if request.atomic and any(r.error for r in results):
+        response.status_code = 422
+        return TaskBatchResponse(committed=False, results=results)
+
+    # 批量执行：一条 INSERT ... RETURNING、按主键的批量 UPDATE、一条 DELETE
+    if creates:
+        created = await db.execute(
+            insert(Task).returning(Task, sort_by_parameter_order=True),
+            [values for _, values in creates],
+        )
+        for (result, _), task in zip(creates, created.scalars().all()):
+            result.status_code, result.id = 201, task.id
+            result.task = TaskResponse.from_orm(task)
+    if updates:
+        await db.execute(update_stmt(Task), [{"id": task_id, **changes} for task_id, changes in updates.items()])
+    if deletes:
+        add_task_tombstones(db, [(task_id, owners[task_id]) for task_id in deletes])
+        for owner_id in {owners[task_id] for task_id in deletes}:
+            await prune_task_tombstones(db, owner_id)
+        await db.execute(delete(Task).where(Task.id.in_(deletes)))
+    await db.commit()
+    await task_list_cache.invalidate_user(
+        *[values["user_id"] for _, values in creates],
+        *[owners[task_id] for task_id in itertools.chain(updates, deletes)],
+    )
+
+    if updates:
+        rows = await db.execute(
+            select(Task).filter(Task.id.in_(updates)).execution_options(populate_existing=True)
+        )
+        for task in rows.scalars():
+            for result in update_results[task.id]:
+                result.task = TaskResponse.from_orm(task)
+
+    return TaskBatchResponse(committed=True, results=results)
+
 # 添加这些Pydantic模型来约束请求结构
 class TaskIntentRequest(BaseModel):
     message: str
@@ -96,10 +340,10 @@ class ExecuteIntentRequest(BaseModel):
 
 # 修改analyze_task_intent端点
 @router.post("/intent")
-def analyze_task_intent(
+async def analyze_task_intent(
     request: TaskIntentRequest,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[AuthenticatedUser] = Depends(get_current_active_user)
 ):
     """
     分析用户消息中的任务意图
@@ -112,14 +356,16 @@ def analyze_task_intent(
             )
             
         # 解析用户消息中的任务意图
-        task_intent = parse_user_request(request.message, request.model_provider)
+        task_intent = await parse_user_request(request.message, request.model_provider)
         
         # 如果是查询意图，直接执行查询
         if task_intent.is_query:
-            # 解析查询参数
-            query_params = parse_query_intent(request.message, request.model_provider)
+            # 查询条件与意图在同一次调用中解析得到；旧格式缺少查询条件时才再次解析
+            query_params = task_intent.query_params
+            if query_params is None:
+                query_params = await parse_query_intent(request.message, request.model_provider)
             # 执行查询
-            tasks = get_tasks_by_query(current_user.id, query_params, db)
+            tasks = await get_tasks_by_query(current_user.id, query_params, db)
             # 转换为dict
             tasks_data = [
                 {
@@ -151,10 +397,10 @@ def analyze_task_intent(
 
 # 修改execute_task_intent端点
 @router.post("/execute_intent")
-def execute_task_intent(
+async def execute_task_intent(
     request: ExecuteIntentRequest,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[AuthenticatedUser] = Depends(get_current_active_user)
 ):
     """
     执行任务意图
@@ -195,8 +441,9 @@ def execute_task_intent(
                     logger.warning(f"Invalid due_date format: {due_date_str}")
             
             db.add(task)
-            db.commit()
-            db.refresh(task)
+            await db.commit()
+            await db.refresh(task)
+            await task_list_cache.invalidate_user(current_user.id)
             
             result["task"] = {
                 "id": task.id,
@@ -216,7 +463,10 @@ def execute_task_intent(
                 raise HTTPException(status_code=400, detail="No task ID provided")
             
             # 查找任务
-            task = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
+            task_result = await db.execute(
+                select(Task).filter(Task.id == task_id, Task.user_id == current_user.id)
+            )
+            task = task_result.scalars().first()
             if not task:
                 raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
             
@@ -240,8 +490,9 @@ def execute_task_intent(
                 else:
                     task.due_date = None
             
-            db.commit()
-            db.refresh(task)
+            await db.commit()
+            await db.refresh(task)
+            await task_list_cache.invalidate_user(current_user.id)
             
             result["task"] = {
                 "id": task.id,
@@ -261,14 +512,20 @@ def execute_task_intent(
                 raise HTTPException(status_code=400, detail="No task ID provided")
             
             # 查找任务
-            task = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
+            task_result = await db.execute(
+                select(Task).filter(Task.id == task_id, Task.user_id == current_user.id)
+            )
+            task = task_result.scalars().first()
             if not task:
                 raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
             
             # 删除任务
             task_text = task.text
-            db.delete(task)
-            db.commit()
+            add_task_tombstones(db, [(task.id, task.user_id)])
+            await prune_task_tombstones(db, task.user_id)
+            await db.delete(task)
+            await db.commit()
+            await task_list_cache.invalidate_user(current_user.id)
             
             result["message"] = f"已删除任务ID: {task_id} ({task_text})"
         
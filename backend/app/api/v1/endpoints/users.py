@@ -1,21 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_db
 from app.models.user import User
 from app.schemas.user import UserResponse
 
 router = APIRouter(prefix="/api/user", tags=["user"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/profile", response_model=UserResponse)
-def get_user_profile(user_id: int = Query(...), db: Session = Depends(get_db)):
-    user = db.query(User).get(user_id)
+async def get_user_profile(user_id: int = Query(...), db: AsyncSession = Depends(get_db)):
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -15,16 +15,129 @@ class Settings:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "dev-secret-key")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60 * 24))
+    AUTH_TOKEN_CACHE_SIZE: int = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 10000))
+    # 秒：停用或删除的用户最多在这段时间内仍能通过已缓存的令牌验证
+    AUTH_TOKEN_CACHE_TTL_SECONDS: float = float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", 30))
+
+    # Password hashing settings
+    # 密码哈希进程池大小（0 表示使用线程池）和最大排队数，排队已满时返回503
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
     
     # Database settings
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+
+    # Database connection pool settings
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))  # 秒，-1 表示不回收
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
     
+    # 大批量删除（清空聊天记录、删除用户全部任务）在后台分批执行
+    BULK_DELETE_BATCH_SIZE: int = int(os.getenv("BULK_DELETE_BATCH_SIZE", 500))  # 每个事务删除的最多行数
+    BULK_DELETE_PAUSE_MS: float = float(os.getenv("BULK_DELETE_PAUSE_MS", 10))  # 批次之间的暂停时间
+
+    # Task sync settings
+    TASK_TOMBSTONE_RETENTION_DAYS: int = int(os.getenv("TASK_TOMBSTONE_RETENTION_DAYS", 30))
+
+    # Task list cache settings
+    TASK_CACHE_ENABLED: bool = os.getenv("TASK_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    TASK_CACHE_BACKEND: str = os.getenv("TASK_CACHE_BACKEND", "memory")  # 可选值: "memory", "redis"
+    TASK_CACHE_REDIS_URL: str = os.getenv("TASK_CACHE_REDIS_URL", "redis://localhost:6379/0")
+    TASK_CACHE_TTL: float = float(os.getenv("TASK_CACHE_TTL", 300))
+    TASK_CACHE_MAX_ENTRIES: int = int(os.getenv("TASK_CACHE_MAX_ENTRIES", 2048))
+    TASK_CACHE_MAX_BYTES: int = int(os.getenv("TASK_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
     # API keys
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     
     # AI Model Configuration
-    DEFAULT_AI_MODEL: str = os.getenv("DEFAULT_AI_MODEL", "openai")  # 可选值: "openai", "gemini"
+    DEFAULT_AI_MODEL: str = os.getenv("DEFAULT_AI_MODEL", "openai")  # 可选值: "openai", "gemini", "local"
+    GEMINI_API_BASE: str = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta/models")
+
+    # 离线的本地模型提供商（压测和CI用），DEFAULT_AI_MODEL=local 时自动启用
+    LOCAL_LLM_ENABLED: bool = os.getenv("LOCAL_LLM_ENABLED", "false").lower() in ("1", "true", "yes")
+    LOCAL_LLM_LATENCY_DISTRIBUTION: str = os.getenv("LOCAL_LLM_LATENCY_DISTRIBUTION", "lognormal")  # fixed/uniform/normal/lognormal
+    LOCAL_LLM_LATENCY_MS: float = float(os.getenv("LOCAL_LLM_LATENCY_MS", 0))  # 延迟中位数
+    LOCAL_LLM_LATENCY_SPREAD: float = float(os.getenv("LOCAL_LLM_LATENCY_SPREAD", 0.5))
+    LOCAL_LLM_STREAM_CHUNK_MS: float = float(os.getenv("LOCAL_LLM_STREAM_CHUNK_MS", 0))
+    LOCAL_LLM_ERROR_RATE: float = float(os.getenv("LOCAL_LLM_ERROR_RATE", 0))
+    LOCAL_LLM_ERROR_STATUS: int = int(os.getenv("LOCAL_LLM_ERROR_STATUS", 503))
+    LOCAL_LLM_SEED: int = int(os.getenv("LOCAL_LLM_SEED", 42))
+
+    # 在调用LLM之前先用本地规则和小模型判断意图
+    LOCAL_INTENT_CLASSIFIER_ENABLED: bool = os.getenv("LOCAL_INTENT_CLASSIFIER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+    # /chat 在分析任务意图的同时并行生成普通回复：降低非任务消息的延迟，代价是任务消息多一次被取消的调用
+    CHAT_SPECULATIVE_COMPLETION: bool = os.getenv("CHAT_SPECULATIVE_COMPLETION", "true").lower() in ("1", "true", "yes")
+    # 先等待意图分析的毫秒数，期间得出结果（本地分类器、缓存命中）则不发起投机调用
+    CHAT_SPECULATIVE_DELAY_MS: float = float(os.getenv("CHAT_SPECULATIVE_DELAY_MS", 0))
+
+    # /chat 上下文：历史消息、摘要和本次消息共用的token预算；放不下的旧消息在后台折叠进每个用户的滚动摘要
+    CHAT_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 2000))
+    CHAT_CONTEXT_MAX_MESSAGES: int = int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", 50))  # 每次请求最多读取的历史消息数
+    CHAT_SUMMARY_ENABLED: bool = os.getenv("CHAT_SUMMARY_ENABLED", "true").lower() in ("1", "true", "yes")
+    CHAT_SUMMARY_MAX_TOKENS: int = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", 300))
+    CHAT_SUMMARY_BATCH: int = int(os.getenv("CHAT_SUMMARY_BATCH", 40))  # 每次折叠的最多消息数
+
+    # 聊天记录分层保留：超过 CHAT_ARCHIVE_AFTER_DAYS 天的消息定期按用户和日期压缩移入归档表
+    CHAT_ARCHIVE_ENABLED: bool = os.getenv("CHAT_ARCHIVE_ENABLED", "false").lower() in ("1", "true", "yes")
+    CHAT_ARCHIVE_AFTER_DAYS: int = int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", 90))
+    CHAT_ARCHIVE_CHUNK_SIZE: int = int(os.getenv("CHAT_ARCHIVE_CHUNK_SIZE", 1000))  # 每个事务归档的最多消息数
+    CHAT_ARCHIVE_INTERVAL_SECONDS: float = float(os.getenv("CHAT_ARCHIVE_INTERVAL_SECONDS", 3600))
+    CHAT_ARCHIVE_COMPRESSION_LEVEL: int = int(os.getenv("CHAT_ARCHIVE_COMPRESSION_LEVEL", 6))  # zlib压缩级别
+
+    # 聊天消息写后模式：后台worker把多个请求的消息合并成一条INSERT组提交，写入不再计入响应延迟
+    CHAT_WRITE_BEHIND_ENABLED: bool = os.getenv("CHAT_WRITE_BEHIND_ENABLED", "false").lower() in ("1", "true", "yes")
+    # buffered: 入队即返回，进程崩溃时可能丢失尚未提交的消息；commit: 等待所在批次提交后返回
+    CHAT_WRITE_DURABILITY: str = os.getenv("CHAT_WRITE_DURABILITY", "buffered")
+    CHAT_WRITE_BEHIND_MAX_PENDING: int = int(os.getenv("CHAT_WRITE_BEHIND_MAX_PENDING", 1000))  # 队列中最多等待的对话轮数，满时请求等待
+    # 每批最多写入的消息数（每条4个参数，默认值低于旧版SQLite单条语句999个参数的上限）
+    CHAT_WRITE_BEHIND_BATCH_SIZE: int = int(os.getenv("CHAT_WRITE_BEHIND_BATCH_SIZE", 200))
+    CHAT_WRITE_BEHIND_FLUSH_MS: float = float(os.getenv("CHAT_WRITE_BEHIND_FLUSH_MS", 20))  # 凑批的最长等待时间
+
+    # LLM provider routing: 主提供商超过p95仍未返回时向另一个提供商发送对冲请求，连续失败时熔断
+    LLM_HEDGING_ENABLED: bool = os.getenv("LLM_HEDGING_ENABLED", "true").lower() in ("1", "true", "yes")
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))  # 样本不足时按最大等待时间对冲
+    LLM_HEDGE_MAX_DELAY_MS: float = float(os.getenv("LLM_HEDGE_MAX_DELAY_MS", 10000))
+    LLM_LATENCY_WINDOW: int = int(os.getenv("LLM_LATENCY_WINDOW", 200))
+    LLM_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", 5))
+    LLM_BREAKER_COOLDOWN: float = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+
+    # LLM 准入控制：每个提供商的并发上限、每分钟请求数/token数（0为不限制）、等待队列和重试
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+    OPENAI_MAX_CONCURRENCY: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", LLM_MAX_CONCURRENCY))
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", LLM_MAX_CONCURRENCY))
+    OPENAI_RPM: float = float(os.getenv("OPENAI_RPM", 0))
+    OPENAI_TPM: float = float(os.getenv("OPENAI_TPM", 0))
+    GEMINI_RPM: float = float(os.getenv("GEMINI_RPM", 0))
+    GEMINI_TPM: float = float(os.getenv("GEMINI_TPM", 0))
+    LLM_ESTIMATED_OUTPUT_TOKENS: int = int(os.getenv("LLM_ESTIMATED_OUTPUT_TOKENS", 256))  # 计入TPM的预估输出长度
+    LLM_QUEUE_MAX: int = int(os.getenv("LLM_QUEUE_MAX", 100))
+    LLM_QUEUE_TIMEOUT: float = float(os.getenv("LLM_QUEUE_TIMEOUT", 10))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", 2))
+    LLM_RETRY_BASE_DELAY: float = float(os.getenv("LLM_RETRY_BASE_DELAY", 0.5))
+    LLM_RETRY_MAX_DELAY: float = float(os.getenv("LLM_RETRY_MAX_DELAY", 8))
+
+    # 合并相同的并发LLM请求，只向上游发送一次
+    LLM_SINGLE_FLIGHT_ENABLED: bool = os.getenv("LLM_SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+    # LLM intent/query parsing cache settings
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    LLM_CACHE_TTL: float = float(os.getenv("LLM_CACHE_TTL", 24 * 3600))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 4096))
+    LLM_CACHE_SQLITE_PATH: str = os.getenv("LLM_CACHE_SQLITE_PATH", "")  # 为空时不启用持久层
+    LLM_CACHE_SQLITE_MAX_ROWS: int = int(os.getenv("LLM_CACHE_SQLITE_MAX_ROWS", 100000))
+
+    # LLM HTTP client settings（进程内共享的连接池）
+    LLM_HTTP_MAX_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", 100))
+    LLM_HTTP_MAX_KEEPALIVE: int = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", 20))
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", 60))
+    LLM_HTTP_CONNECT_TIMEOUT: float = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", 5))
+    LLM_HTTP_READ_TIMEOUT: float = float(os.getenv("LLM_HTTP_READ_TIMEOUT", 30))  # 两次收到数据之间的最长间隔
+    LLM_HTTP2: bool = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
 
     # CORS settings
     BACKEND_CORS_ORIGINS: list = [
@@ -45,9 +158,15 @@ class Settings:
         """检查Gemini API是否可用"""
         return bool(self.GEMINI_API_KEY.strip())
     
+    def is_local_available(self) -> bool:
+        """检查本地模型是否启用"""
+        return self.LOCAL_LLM_ENABLED or self.DEFAULT_AI_MODEL == "local"
+    
     def get_available_ai_model(self) -> str:
         """获取可用的AI模型"""
-        if self.DEFAULT_AI_MODEL == "gemini" and self.is_gemini_available():
+        if self.DEFAULT_AI_MODEL == "local":
+            return "local"
+        elif self.DEFAULT_AI_MODEL == "gemini" and self.is_gemini_available():
             return "gemini"
         elif self.DEFAULT_AI_MODEL == "openai" and self.is_openai_available():
             return "openai"
@@ -55,7 +174,9 @@ class Settings:
             return "openai"
         elif self.is_gemini_available():
             return "gemini"
+        elif self.is_local_available():
+            return "local"
         else:
-            raise ValueError("No AI model available. Please set OPENAI_API_KEY or GEMINI_API_KEY in environment variables.")
+            raise ValueError("No AI model available. Please set OPENAI_API_KEY or GEMINI_API_KEY in environment variables, or DEFAULT_AI_MODEL=local.")
 
 settings = Settings()
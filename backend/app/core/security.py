@@ -1,8 +1,17 @@
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import logging
+import multiprocessing
+import os
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Password hashing
@@ -13,6 +22,112 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+class PasswordHasherBusyError(Exception):
+    """密码哈希队列已满，调用方应返回503"""
+
+class PasswordHasher:
+    """
+    在独立进程池中执行 bcrypt 哈希和校验
+
+    bcrypt 每次约消耗数百毫秒CPU，放在请求线程中会占满线程池并阻塞其它接口。
+    进程池可以利用多核；等待中的任务数超过 max_pending 时直接拒绝，
+    避免登录高峰时请求无限排队。workers=0 时退回线程池执行。
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        # submitted = pending + completed + failed + rejected
+        self.submitted = 0
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.pool_restarts = 0
+        self._executor = None
+
+    def configure(self, workers: int, max_pending: int) -> None:
+        self.shutdown()
+        self.workers = workers
+        self.max_pending = max_pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn 避免在已有事件循环和线程的进程中 fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def start(self) -> None:
+        """
+        预先启动工作进程，避免首个登录请求承担进程启动开销
+        """
+        if self.workers > 0:
+            executor = self._get_executor()
+            for _ in range(self.workers):
+                executor.submit(os.getpid)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, func, *args):
+        self.submitted += 1
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusyError("Password hashing queue is full")
+        self.pending += 1
+        try:
+            result = await self._execute(func, *args)
+        except BaseException:
+            # 包括取消：只有成功返回的调用计入 completed
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        return result
+
+    async def _execute(self, func, *args):
+        if self.workers <= 0:
+            return await run_in_threadpool(func, *args)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        except BrokenProcessPool:
+            # 工作进程异常退出时重建进程池并重试一次
+            logger.warning("Password hashing process pool broken, recreating")
+            self.pool_restarts += 1
+            self._executor = None
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "process" if self.workers > 0 else "thread",
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "pending": self.pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "pool_restarts": self.pool_restarts,
+        }
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+
 # JWT token
 
 def create_access_token(data: dict, expires_delta: int = None):
@@ -0,0 +1,101 @@
+from typing import Dict, List
+
+from sqlalchemy import event
+
+from app.utils.text_search import CJK_RANGES, WORD_RANGES, search_tokens
+
+# 建立全文索引的表：表名 -> 被索引的文本列
+SEARCH_SOURCES: Dict[str, str] = {
+    "tasks": "text",
+    "chat_messages": "content",
+}
+
+# PostgreSQL 中与 app.utils.text_search.search_tokens 相同的分词函数，供生成列调用
+PG_SEARCH_TOKENS_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION search_tokens(input text) RETURNS text
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+    result text[] := '{{}}';
+    term text;
+BEGIN
+    FOR term IN
+        SELECT m[1] FROM regexp_matches(lower(coalesce(input, '')), '[{CJK_RANGES}]+|[{WORD_RANGES}]+', 'g') AS m
+    LOOP
+        IF term ~ '^[{CJK_RANGES}]' AND length(term) > 1 THEN
+            FOR i IN 1 .. length(term) - 1 LOOP
+                result := result || substr(term, i, 2);
+            END LOOP;
+        ELSE
+            result := result || term;
+        END IF;
+    END LOOP;
+    RETURN array_to_string(result, ' ');
+END;
+$$
+"""
+
+def sqlite_statements(table: str, column: str) -> List[str]:
+    """
+    SQLite：FTS5 索引表 {table}_fts（rowid 与源表 id 相同），由触发器在增删改时同步
+
+    触发器调用应用注册的 search_tokens 函数分词，写入源表的连接都必须先调用 register_search_functions
+    """
+    fts = f"{table}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(user_id, tokens, tokenize = 'unicode61')",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, user_id, tokens) VALUES (new.id, new.user_id, search_tokens(new.{column}));
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+            DELETE FROM {fts} WHERE rowid = old.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column}, user_id ON {table} BEGIN
+            UPDATE {fts} SET user_id = new.user_id, tokens = search_tokens(new.{column}) WHERE rowid = old.id;
+        END""",
+    ]
+
+def postgresql_statements(table: str, column: str) -> List[str]:
+    """
+    PostgreSQL：由 search_tokens 生成的 tsvector 存储列和GIN索引，数据库自动保持同步
+    """
+    return [
+        PG_SEARCH_TOKENS_FUNCTION,
+        f"""ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', search_tokens({column}))) STORED""",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)",
+    ]
+
+def search_index_statements(dialect: str, table: str) -> List[str]:
+    column = SEARCH_SOURCES[table]
+    if dialect == "sqlite":
+        return sqlite_statements(table, column)
+    if dialect == "postgresql":
+        return postgresql_statements(table, column)
+    return []
+
+def sqlite_backfill_statement(table: str) -> str:
+    return (
+        f"INSERT INTO {table}_fts(rowid, user_id, tokens) "
+        f"SELECT id, user_id, search_tokens({SEARCH_SOURCES[table]}) FROM {table}"
+    )
+
+def register_search_functions(dbapi_connection, connection_record=None) -> None:
+    """
+    在SQLite连接上注册 search_tokens 函数（全文索引触发器依赖它）
+    """
+    dbapi_connection.create_function("search_tokens", 1, search_tokens, deterministic=True)
+
+def _create_search_index(target, connection, **kw) -> None:
+    for statement in search_index_statements(connection.dialect.name, target.name):
+        connection.exec_driver_sql(statement)
+
+def _drop_search_index(target, connection, **kw) -> None:
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {target.name}_fts")
+
+def attach_search_index(table) -> None:
+    """
+    随 create_all / drop_all 创建和删除表的全文索引
+    """
+    event.listen(table, "after_create", _create_search_index)
+    event.listen(table, "before_drop", _drop_search_index)
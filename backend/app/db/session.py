@@ -1,13 +1,57 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
-import os
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 import logging
+from app.core.config import settings
+from app.db.pool import InstrumentedAsyncQueuePool, get_pool_status
+from app.db.search_index import register_search_functions
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
-# 从环境变量获取数据库URL
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+# 从配置获取数据库URL
+DATABASE_URL = settings.DATABASE_URL
+
+def get_async_database_url(url: str) -> str:
+    """
+    将同步数据库URL转换为对应的异步驱动URL
+
+    sqlite:///... -> sqlite+aiosqlite:///...
+    postgres://... / postgresql://... -> postgresql+asyncpg://...
+    """
+    if url.startswith("sqlite+aiosqlite://") or url.startswith("postgresql+asyncpg://"):
+        return url
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    for prefix in ("postgres://", "postgresql://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            async_url = "postgresql+asyncpg://" + url[len(prefix):]
+            # asyncpg 不识别 libpq 的 sslmode 参数，改用 ssl
+            return async_url.replace("sslmode=", "ssl=")
+    return url
+
+def get_pool_options(url: str) -> dict:
+    """
+    根据配置生成连接池参数
+
+    内存SQLite使用单连接的 StaticPool，不支持队列池的大小参数
+    """
+    options = {
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    database = make_url(url).database
+    if url.startswith("sqlite") and (not database or database == ":memory:"):
+        return options
+    options.update({
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    })
+    return options
+
+ASYNC_DATABASE_URL = get_async_database_url(DATABASE_URL)
 
 # 根据数据库类型设置连接参数
 connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
@@ -16,26 +60,44 @@ connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite")
 db_type = "SQLite" if DATABASE_URL.startswith("sqlite") else "PostgreSQL"
 logger.info(f"Using {db_type} database")
 
-try:
-    # 创建数据库引擎
-    engine = create_engine(DATABASE_URL, connect_args=connect_args)
-    
-    # 创建会话工厂
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    
-    logger.info(f"Database connection established successfully")
-except Exception as e:
-    logger.error(f"Failed to create database engine: {e}")
-    # 如果连接失败，创建一个内存SQLite数据库作为回退选项
-    fallback_url = "sqlite:///:memory:"
-    logger.warning(f"Falling back to in-memory SQLite database")
-    engine = create_engine(fallback_url, connect_args={"check_same_thread": False})
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+pool_options = get_pool_options(DATABASE_URL)
+
+# 创建数据库引擎（同步引擎仅用于建表、迁移脚本和测试）
+# 配置错误时直接失败，而不是回退到内存数据库导致数据写入丢失
+engine = create_engine(DATABASE_URL, connect_args=connect_args, **pool_options)
+
+# 创建会话工厂
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# 创建异步引擎和异步会话工厂，供所有路由使用
+if "pool_size" in pool_options:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, **pool_options)
+else:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options)
+# SQLite 的全文索引触发器调用应用侧的分词函数，每个连接都要注册
+if DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", register_search_functions)
+    event.listen(async_engine.sync_engine, "connect", register_search_functions)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+logger.info(
+    f"Database engine configured (pool_size={pool_options.get('pool_size')}, "
+    f"max_overflow={pool_options.get('max_overflow')}, pre_ping={settings.DB_POOL_PRE_PING})"
+)
+
+def get_db_pool_status() -> dict:
+    """
+    获取异步引擎连接池的实时状态
+    """
+    return get_pool_status(async_engine.pool)
 
 # 数据库依赖项
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -1,14 +1,30 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.api.v1.endpoints.auth import router as auth_router
 from app.api.v1.endpoints.tasks import router as tasks_router
 from app.api.v1.endpoints.users import router as users_router
-from app.api.v1.endpoints.chat import router as chat_router
+from app.api.v1.endpoints.chat import router as chat_router, speculation_stats
 from app.api.v1.endpoints.chat_history import router as chat_history_router
+from app.api.v1.endpoints.search import router as search_router
 from app.db.base import Base
-from app.db.session import engine
+from app.db.session import engine, async_engine, get_db_pool_status
 from app.core.config import settings
+from app.core.security import password_hasher, PasswordHasherBusyError
+from app.services.task_cache import task_list_cache
+from app.services.http_client import close_http_client
+from app.services.llm_cache import llm_response_cache
+from app.services.intent_classifier import intent_classifier
+from app.services.chat_context_service import chat_summarizer
+from app.services.chat_message_writer import chat_message_writer
+from app.services.chat_archive_service import chat_archiver
+from app.services.bulk_delete_service import bulk_deleter
+from app.services.ai_service import get_available_providers, llm_single_flight
+from app.services.provider_router import provider_router, ProviderUnavailableError
+from app.services.provider_limiter import ProviderBusyError, get_limiter_stats
+from app.utils.auth import get_token_cache_stats
 import logging
+import math
 from sqlalchemy.exc import OperationalError
 
 # 配置日志
@@ -24,6 +40,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 浏览器端客户端需要读取分页游标和ETag
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 @app.on_event("startup")
@@ -39,12 +57,55 @@ def on_startup():
     except Exception as e:
         logger.error(f"An error occurred during startup: {e}")
         logger.warning("Application will start with potential issues.")
+    # 预热密码哈希进程池
+    password_hasher.start()
+    # 定期把超过保留期的聊天消息移入归档表
+    if settings.CHAT_ARCHIVE_ENABLED:
+        chat_archiver.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # 先写完写后队列中的聊天消息，再关闭异步引擎的连接池
+    await chat_message_writer.shutdown()
+    chat_archiver.stop()
+    bulk_deleter.stop()
+    await async_engine.dispose()
+    password_hasher.shutdown()
+    await close_http_client()
+
+@app.exception_handler(PasswordHasherBusyError)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusyError):
+    # 登录/注册高峰时快速失败，让客户端稍后重试，而不是占满所有worker
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Authentication service is busy, please retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(ProviderBusyError)
+async def provider_busy_handler(request: Request, exc: ProviderBusyError):
+    # LLM 提供商的本地排队已满或被上游限流，让客户端按 Retry-After 稍后重试
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+@app.exception_handler(ProviderUnavailableError)
+async def provider_unavailable_handler(request: Request, exc: ProviderUnavailableError):
+    # 所有提供商都被熔断，Retry-After 为最早结束冷却的熔断器的剩余时间
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
 
 app.include_router(auth_router)
 app.include_router(tasks_router)
 app.include_router(users_router)
 app.include_router(chat_router)
 app.include_router(chat_history_router)
+app.include_router(search_router)
 
 @app.get("/")
 def read_root():
@@ -53,3 +114,52 @@ def read_root():
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+@app.get("/health/db")
+def db_pool_status():
+    """
+    数据库连接池状态：已借出、空闲、溢出连接数和累计等待时间，以及后台分批删除的进度
+    """
+    return {**get_db_pool_status(), "bulk_deletes": bulk_deleter.stats()}
+
+@app.get("/health/auth")
+def password_hasher_status():
+    """
+    密码哈希进程池的排队和拒绝情况
+    """
+    return password_hasher.stats()
+
+@app.get("/health/chat")
+def chat_speculation_status():
+    """
+    /chat 投机调用的发起、采用和浪费次数，对话摘要的折叠次数，被合并的重复LLM请求数，聊天消息的批量写入情况，以及旧消息的归档情况
+    """
+    return {
+        **speculation_stats.snapshot(),
+        "summaries": chat_summarizer.stats(),
+        "single_flight": llm_single_flight.stats(),
+        "persistence": chat_message_writer.stats(),
+        "archive": chat_archiver.stats(),
+    }
+
+@app.get("/health/providers")
+def provider_status():
+    """
+    各AI提供商的延迟分位数、错误率、熔断器状态、对冲次数，以及准入控制的排队深度和等待时间
+    """
+    snapshot = provider_router.snapshot(get_available_providers())
+    for provider, admission in get_limiter_stats().items():
+        snapshot.setdefault(provider, {})["admission"] = admission
+    return snapshot
+
+@app.get("/health/cache")
+def cache_status():
+    """
+    缓存命中、未命中、淘汰计数和内存占用
+    """
+    return {
+        "task_lists": task_list_cache.stats(),
+        "auth_tokens": get_token_cache_stats(),
+        "llm_responses": llm_response_cache.stats(),
+        "local_intents": intent_classifier.stats(),
+    }
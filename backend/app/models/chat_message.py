@@ -1,6 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
-from app.db.base_class import Base
+from datetime import datetime
+from app.db.base import Base
+from app.db.search_index import attach_search_index
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -9,5 +11,16 @@ class ChatMessage(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     role = Column(String(50), nullable=False)  # 'user' 或 'assistant'
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    model_provider = Column(String(50), nullable=True)  # 使用的AI模型 
\ No newline at end of file
+    # 在Python端生成带微秒的时间，SQLite中与游标 (created_at, id) 的比较才能与存储格式一致
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+    model_provider = Column(String(50), nullable=True)  # 使用的AI模型
+
+    # get_messages_for_context / get_history_page：按用户过滤并按 created_at 排序
+    # archive_chunk：跨用户按 (created_at, id) 顺序取出超过保留期的消息
+    __table_args__ = (
+        Index("ix_chat_messages_user_id_created_at", "user_id", "created_at"),
+        Index("ix_chat_messages_created_at_id", "created_at", "id"),
+    )
+
+# 消息内容的全文索引（SQLite FTS5 / PostgreSQL tsvector），随建表一起创建
+attach_search_index(ChatMessage.__table__)
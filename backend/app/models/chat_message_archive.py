@@ -0,0 +1,27 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, ForeignKey, Index
+from app.db.base import Base
+
+class ChatMessageArchive(Base):
+    """
+    归档的旧聊天消息：每行是一个用户某一天的一段消息，payload 为zlib压缩的JSON Lines
+
+    一天的消息可能分成多段（每次归档最多处理一批消息）
+    """
+    __tablename__ = "chat_message_archives"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    day = Column(String(10), nullable=False)  # YYYY-MM-DD（UTC）
+    first_message_id = Column(Integer, nullable=False)
+    last_message_id = Column(Integer, nullable=False)
+    first_created_at = Column(DateTime(timezone=True), nullable=False)
+    last_created_at = Column(DateTime(timezone=True), nullable=False)
+    message_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+
+    # 按用户和日期范围读取归档段
+    __table_args__ = (
+        Index("ix_chat_message_archives_user_id_day", "user_id", "day"),
+    )
@@ -0,0 +1,14 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey
+from app.db.base import Base
+
+class ChatSummary(Base):
+    """每个用户一行的滚动对话摘要，汇总了 id <= last_message_id 的所有聊天消息"""
+    __tablename__ = "chat_summaries"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True)
+    summary = Column(Text, nullable=False, default="")
+    last_message_id = Column(Integer, nullable=False, default=0)
+    token_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
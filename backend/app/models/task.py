@@ -1,16 +1,36 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, func
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index, func
 from app.db.base import Base
+from app.db.search_index import attach_search_index
 
 class Task(Base):
     __tablename__ = "tasks"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     text = Column(String, nullable=False)
     due_date = Column(DateTime, nullable=True)
     status = Column(String, default="todo")  # todo, done, etc.
     type = Column(String, default="todo")  # todo, long_term, ...
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # 在应用侧生成，保留微秒精度，供ETag和增量同步判断变更
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
     start_date = Column(DateTime, nullable=True)
     end_date = Column(DateTime, nullable=True)
+
+    # 与热点查询形状匹配的复合索引，user_id 前缀同时覆盖外键查找
+    __table_args__ = (
+        # get_user_tasks：按用户列出并按 (due_date, id) 游标分页
+        Index("ix_tasks_user_id_due_date_id", "user_id", "due_date", "id"),
+        # get_user_tasks?status=...：按状态过滤并按 due_date 排序
+        Index("ix_tasks_user_id_status_due_date", "user_id", "status", "due_date"),
+        # get_tasks_by_query：按状态、类型过滤并按 due_date 范围查询
+        Index("ix_tasks_user_id_status_type_due_date", "user_id", "status", "type", "due_date"),
+        # /api/tasks/changes：按用户拉取某时间点之后更新的任务
+        Index("ix_tasks_user_id_updated_at", "user_id", "updated_at"),
+        # SQLite 默认会复用最大的已删除ID，AUTOINCREMENT 保证墓碑中的ID不会指向新任务
+        {"sqlite_autoincrement": True},
+    )
+
+# 任务文本的全文索引（SQLite FTS5 / PostgreSQL tsvector），随建表一起创建
+attach_search_index(Task.__table__)
@@ -0,0 +1,16 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, DateTime, Index
+from app.db.base import Base
+
+class TaskTombstone(Base):
+    """已删除任务的墓碑记录，供客户端增量同步删除操作"""
+    __tablename__ = "task_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_task_tombstones_user_id_deleted_at", "user_id", "deleted_at"),
+    )
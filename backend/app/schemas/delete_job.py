@@ -0,0 +1,16 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+class DeleteJobResponse(BaseModel):
+    id: str
+    kind: str  # chat_history / tasks
+    status: str  # queued / running / done / failed / unknown（本进程中没有该任务）
+    # 以下字段在 status 为 unknown 时为 None
+    deleted: Optional[int] = None  # 已删除的行数
+    total: Optional[int] = None  # 提交时需要删除的行数
+    batches: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 
 class TaskCreate(BaseModel):
@@ -31,4 +31,45 @@ class TaskResponse(BaseModel):
     updated_at: Optional[datetime]
 
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+class TaskBatchOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[int] = None  # update/delete 必需
+    user_id: Optional[int] = None  # create 必需
+    text: Optional[str] = None
+    status: Optional[str] = None
+    due_date: Optional[datetime] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    type: Optional[str] = None
+
+class TaskBatchRequest(BaseModel):
+    operations: List[TaskBatchOperation]
+    atomic: bool = False  # 为True时任一操作失败则整批不生效
+
+class TaskBatchResult(BaseModel):
+    index: int
+    op: str
+    status_code: int
+    id: Optional[int] = None
+    task: Optional[TaskResponse] = None
+    error: Optional[str] = None
+
+class TaskBatchResponse(BaseModel):
+    committed: bool
+    results: List[TaskBatchResult]
+
+class TaskChangesResponse(BaseModel):
+    tasks: List[TaskResponse]  # 自上次同步以来创建或更新的任务
+    deleted_ids: List[int]  # 自上次同步以来删除的任务ID
+    sync_token: str  # 下次请求时作为 since 传回
+    full_resync: bool = False  # 为True时客户端应以 tasks 替换本地全部数据
+
+class TaskQueryParams(BaseModel):
+    """任务查询条件，由意图解析得到"""
+    status: Literal["todo", "done", "all"] = "all"
+    type: Literal["todo", "ddl", "event", "longterm", "goal", "all"] = "all"
+    date_filter: Literal["today", "this_week", "this_month", "all"] = "all"
+    sort_by: Literal["due_date", "created_at"] = "due_date"
+    sort_order: Literal["asc", "desc"] = "asc"
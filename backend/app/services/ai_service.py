@@ -1,21 +1,32 @@
 from app.core.config import settings
-from app.services.openai_service import chat_with_openai
-from app.services.gemini_service import chat_with_gemini
+from app.services.openai_service import chat_with_openai, stream_chat_with_openai
+from app.services.gemini_service import chat_with_gemini, stream_chat_with_gemini
+from app.services.local_llm_service import chat_with_local, stream_chat_with_local
+from app.services.provider_router import provider_router
+from app.services.provider_limiter import get_provider_limiter
+from app.utils.tokens import count_messages_tokens
+from app.utils.single_flight import SingleFlight
+import hashlib
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
-def chat_with_ai(messages, model_provider=None, system_prompt=None):
+# 合并提供商和消息完全相同的并发请求（重试、双击、多个标签页同时发送）
+llm_single_flight = SingleFlight()
+
+def request_fingerprint(providers, messages, json_mode=False):
     """
-    与AI模型聊天的统一接口
-    
-    Args:
-        messages: 消息列表
-        model_provider: 模型提供商，可选"openai"或"gemini"，默认使用settings中的配置
-        system_prompt: 可选的系统提示，将会添加到消息列表开头
-    
-    Returns:
-        AI生成的回复
+    计算一次LLM请求的指纹：候选提供商、完整消息列表和输出模式都相同的请求视为同一请求
+    """
+    raw = json.dumps([providers, messages, json_mode], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def resolve_model_provider(model_provider=None):
+    """
+    确定实际使用的模型提供商
+
+    未指定时使用settings中的可用模型；指定的提供商未配置API Key时回退到另一个
     """
     # 如果未指定提供商，使用设置中的可用模型
     if not model_provider:
@@ -27,7 +38,9 @@ def chat_with_ai(messages, model_provider=None, system_prompt=None):
             raise
     
     # 检查指定的提供商是否可用
-    if model_provider == "openai" and not settings.is_openai_available():
+    if model_provider == "local" and not settings.is_local_available():
+        raise ValueError("Local model provider is disabled. Set LOCAL_LLM_ENABLED=true or DEFAULT_AI_MODEL=local.")
+    elif model_provider == "openai" and not settings.is_openai_available():
         logger.warning("OpenAI API key not set, trying Gemini")
         if settings.is_gemini_available():
             model_provider = "gemini"
@@ -39,27 +52,107 @@ def chat_with_ai(messages, model_provider=None, system_prompt=None):
             model_provider = "openai"
         else:
             raise ValueError("Gemini API key not set and no alternative available")
-    
-    # 准备消息列表，可能添加系统提示
+    return model_provider
+
+def get_available_providers():
+    """
+    可以参与路由的提供商列表
+
+    默认使用本地模型时只返回 local，压测不会对冲到真实的提供商；
+    没有配置任何API Key时才回退到已启用的本地模型。
+    """
+    if settings.DEFAULT_AI_MODEL == "local":
+        return ["local"]
+    providers = []
+    if settings.is_openai_available():
+        providers.append("openai")
+    if settings.is_gemini_available():
+        providers.append("gemini")
+    if not providers and settings.is_local_available():
+        providers.append("local")
+    return providers
+
+def prepare_messages(messages, system_prompt=None):
+    """
+    复制消息列表，必要时在开头添加系统提示
+    """
     processed_messages = messages.copy()
     
     # 如果提供了系统提示且第一条消息不是系统提示
     if system_prompt and (not messages or messages[0].get("role") != "system"):
         processed_messages.insert(0, {"role": "system", "content": system_prompt})
+    return processed_messages
+
+async def chat_with_ai(messages, model_provider=None, system_prompt=None, json_mode=False):
+    """
+    与AI模型聊天的统一接口
+    
+    Args:
+        messages: 消息列表
+        model_provider: 模型提供商，可选"openai"、"gemini"或"local"，默认使用settings中的配置
+        system_prompt: 可选的系统提示，将会添加到消息列表开头
+        json_mode: 为True时要求模型只输出一个JSON对象（结构化输出）
     
-    # 根据提供商选择相应的API
+    Returns:
+        AI生成的回复
+    """
+    # 调用方明确指定提供商时只使用该提供商；否则由路由器在可用提供商之间对冲和故障切换
+    candidates = None if model_provider else get_available_providers()
+    model_provider = resolve_model_provider(model_provider)
+    processed_messages = prepare_messages(messages, system_prompt)
+    # 计入TPM令牌桶的预估token数
+    estimated_tokens = count_messages_tokens(processed_messages) + settings.LLM_ESTIMATED_OUTPUT_TOKENS
+
+    async def call_provider(provider):
+        # 根据提供商选择相应的API，经过该提供商的并发/速率限制和重试
+        if provider == "openai":
+            call = lambda: chat_with_openai(processed_messages, json_mode=json_mode)
+        elif provider == "gemini":
+            call = lambda: chat_with_gemini(processed_messages, json_mode=json_mode)
+        elif provider == "local":
+            call = lambda: chat_with_local(processed_messages, json_mode=json_mode)
+        else:
+            raise ValueError(f"Unsupported model provider: {provider}")
+        return await get_provider_limiter(provider).run(call, tokens=estimated_tokens)
+
+    candidates = candidates or [model_provider]
+    if not settings.LLM_SINGLE_FLIGHT_ENABLED:
+        return await provider_router.call(model_provider, candidates, call_provider)
+    key = request_fingerprint([model_provider] + candidates, processed_messages, json_mode)
+    return await llm_single_flight.do(key, lambda: provider_router.call(model_provider, candidates, call_provider))
+
+def stream_chat_with_ai(messages, model_provider=None, system_prompt=None):
+    """
+    与AI模型流式聊天的统一接口
+
+    参数同 chat_with_ai。提供商在调用时立即确定（配置错误会直接抛出），
+    返回的异步迭代器按生成顺序产出文本片段。
+    """
+    candidates = None if model_provider else get_available_providers()
+    model_provider = resolve_model_provider(model_provider)
+    processed_messages = prepare_messages(messages, system_prompt)
+    # 流式调用不做对冲，但会跳过熔断器打开的提供商
+    model_provider = provider_router.pick(model_provider, candidates or [model_provider])
+    estimated_tokens = count_messages_tokens(processed_messages) + settings.LLM_ESTIMATED_OUTPUT_TOKENS
+
     if model_provider == "openai":
-        return chat_with_openai(processed_messages)
+        make_stream = lambda: stream_chat_with_openai(processed_messages)
     elif model_provider == "gemini":
-        return chat_with_gemini(processed_messages)
+        make_stream = lambda: stream_chat_with_gemini(processed_messages)
+    elif model_provider == "local":
+        make_stream = lambda: stream_chat_with_local(processed_messages)
     else:
         raise ValueError(f"Unsupported model provider: {model_provider}")
+    return get_provider_limiter(model_provider).stream(make_stream, tokens=estimated_tokens)
 
-def get_goal_assistant_system_prompt():
+def get_goal_assistant_system_prompt(summary=None):
     """
     获取目标助手的系统提示
+
+    Args:
+        summary: 可选的早期对话摘要，附加在系统提示末尾
     """
-    return (
+    prompt = (
         "You are a helpful goal planning assistant. "
         "When the user wants to add, update, or delete a todo/task, always reply with a JSON object in the following format: "
         "{\"action\": \"add_task|update_task|delete_task\", \"task\": { ... }, \"confirmation_prompt\": \"...\"}. "
@@ -67,4 +160,7 @@ def get_goal_assistant_system_prompt():
         "If the user replies '确认' (confirm), the action will be executed. If '取消' (cancel), do nothing. "
         "If the user's message is not a task operation, reply as usual. "
         "Remember the full conversation history until the user confirms or cancels an action."
-    ) 
\ No newline at end of file
+    )
+    if summary:
+        prompt += f"\n\nSummary of the earlier conversation with this user:\n{summary}"
+    return prompt
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.services.chat_message_service import ChatMessageService
+from app.services.task_cache import task_list_cache
+from app.services.task_sync_service import get_max_task_id, delete_user_tasks_batch
+
+logger = logging.getLogger(__name__)
+
+# 删除任务的类型 -> (获取 (最大ID, 总数) 的函数, 删除一批并返回条数的函数)
+_DeleteKind = Tuple[
+    Callable[[AsyncSession, int], Awaitable[Tuple[int, int]]],
+    Callable[[AsyncSession, int, int, int], Awaitable[int]],
+]
+DELETE_KINDS: Dict[str, _DeleteKind] = {
+    "chat_history": (ChatMessageService.get_max_message_id, ChatMessageService.delete_history_batch),
+    "tasks": (get_max_task_id, delete_user_tasks_batch),
+}
+
+class DeleteJob:
+    """
+    一次后台分批删除的进度
+    """
+
+    def __init__(self, kind: str, user_id: int, max_id: int, total: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.max_id = max_id  # 只删除提交时已存在的记录，之后新写入的不受影响
+        self.total = total
+        self.status = "queued"  # queued / running / done / failed（查询不到时为 unknown）
+        self.deleted = 0
+        self.batches = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "deleted": self.deleted,
+            "total": self.total,
+            "batches": self.batches,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+class BulkDeleter:
+    """
+    在后台分批删除用户的大量数据（清空聊天记录、删除全部任务）
+
+    每批最多删除 batch_size 条，单独提交，批次之间暂停 pause 秒，
+    不会长时间持有SQLite的写锁或PostgreSQL的行锁，其他用户的写入可以穿插进行。
+    一个worker按提交顺序逐个执行，同一用户同类的删除在完成前重复提交会返回同一个任务。
+    任务进度只保存在本进程内存中，只有受理任务的进程能查询到进度（见 describe）；
+    进程重启或任务失败后再次提交即可继续删除。
+    """
+
+    def __init__(self, batch_size: int = 500, pause: float = 0.01, max_jobs: int = 1000):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, DeleteJob]" = OrderedDict()
+        self._active: Dict[Tuple[str, int], DeleteJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.completed = 0
+        self.failed = 0
+        self.deleted_rows = 0
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        # 队列和worker绑定在当前事件循环上（测试中每个用例可能使用新的事件循环）
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._loop = loop
+            self._worker = loop.create_task(self._run(self._queue))
+            # 上一个事件循环中未完成的任务无法继续，需要重新提交
+            self._active.clear()
+        return self._queue
+
+    async def submit(self, kind: str, user_id: int) -> DeleteJob:
+        """
+        提交删除任务并立即返回
+        """
+        if kind not in DELETE_KINDS:
+            raise ValueError(f"Unsupported delete kind: {kind}")
+        queue = self._ensure_worker()
+        job = self._active.get((kind, user_id))
+        if job is not None:
+            return job
+
+        get_bounds, _ = DELETE_KINDS[kind]
+        async with AsyncSessionLocal() as db:
+            max_id, total = await get_bounds(db, user_id)
+        job = DeleteJob(kind, user_id, max_id, total)
+        self._active[(kind, user_id)] = job
+        self._jobs[job.id] = job
+        self._evict()
+        queue.put_nowait(job)
+        return job
+
+    def describe(self, job_id: str, kind: str, user_id: int) -> Dict[str, Any]:
+        """
+        查询用户的删除任务进度；本进程中没有该任务时返回 status 为 unknown 的结果
+
+        任务只保存在受理它的进程内存中：多worker部署时查询可能落到其他进程，任务也可能已被淘汰
+        或随进程重启丢失，这些情况与不存在的任务无法区分，因此不返回404。
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.kind != kind or job.user_id != user_id:
+            return {
+                "id": job_id,
+                "kind": kind,
+                "status": "unknown",
+                "deleted": None,
+                "total": None,
+                "batches": None,
+                "error": None,
+                "created_at": None,
+                "finished_at": None,
+            }
+        return job.to_dict()
+
+    def _evict(self) -> None:
+        # 只淘汰已完成的任务，进行中的任务始终可以查询
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[job_id]
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        while True:
+            job = await queue.get()
+            try:
+                await self._execute(job)
+            finally:
+                self._active.pop((job.kind, job.user_id), None)
+                queue.task_done()
+
+    async def _execute(self, job: DeleteJob) -> None:
+        _, delete_batch = DELETE_KINDS[job.kind]
+        job.status = "running"
+        try:
+            while True:
+                async with AsyncSessionLocal() as db:
+                    deleted = await delete_batch(db, job.user_id, job.max_id, self.batch_size)
+                if job.kind == "tasks":
+                    await task_list_cache.invalidate_user(job.user_id)
+                if not deleted:
+                    break
+                job.deleted += deleted
+                job.batches += 1
+                self.deleted_rows += deleted
+                # 批次之间让出数据库，其他请求的写入可以先执行
+                await asyncio.sleep(self.pause)
+            job.status = "done"
+            self.completed += 1
+            logger.info(f"Deleted {job.deleted} {job.kind} rows of user {job.user_id} in {job.batches} batches")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            self.failed += 1
+            logger.warning(f"Deleting {job.kind} of user {job.user_id} failed after {job.deleted} rows: {e}")
+        finally:
+            job.finished_at = datetime.utcnow()
+
+    async def join(self) -> None:
+        """
+        等待已提交的删除任务全部结束
+        """
+        worker = self._worker
+        if worker is not None and not worker.done() and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "active": len(self._active),
+            "completed": self.completed,
+            "failed": self.failed,
+            "deleted_rows": self.deleted_rows,
+            "batch_size": self.batch_size,
+        }
+
+bulk_deleter = BulkDeleter(
+    batch_size=settings.BULK_DELETE_BATCH_SIZE,
+    pause=settings.BULK_DELETE_PAUSE_MS / 1000,
+)
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta, time, timezone
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.chat_message import ChatMessage
+from app.models.chat_message_archive import ChatMessageArchive
+
+logger = logging.getLogger(__name__)
+
+def to_naive_utc(value: datetime) -> datetime:
+    """
+    统一为不带时区的UTC时间（SQLite返回无时区时间，PostgreSQL返回带时区时间）
+    """
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def encode_segment(messages: List[Dict[str, Any]]) -> bytes:
+    """
+    将消息编码为zlib压缩的JSON Lines
+    """
+    lines = "\n".join(json.dumps(message, ensure_ascii=False, separators=(",", ":")) for message in messages)
+    return zlib.compress(lines.encode("utf-8"), settings.CHAT_ARCHIVE_COMPRESSION_LEVEL)
+
+def decode_segment(payload: bytes) -> List[Dict[str, Any]]:
+    """
+    解码归档段，created_at 解析为不带时区的UTC时间
+    """
+    messages = []
+    for line in zlib.decompress(payload).decode("utf-8").split("\n"):
+        message = json.loads(line)
+        message["created_at"] = datetime.fromisoformat(message["created_at"])
+        messages.append(message)
+    return messages
+
+def _before(message: Dict[str, Any], before: Optional[Tuple[datetime, int]]) -> bool:
+    if before is None:
+        return True
+    return (message["created_at"], message["id"]) < (to_naive_utc(before[0]), before[1])
+
+class ChatArchiveService:
+    @staticmethod
+    async def latest_before(db: AsyncSession, user_id: int, before: Tuple[datetime, int]) -> Optional[datetime]:
+        """
+        早于游标的最新一条归档消息的时间（按段的时间范围估计，不会早于实际值）
+        """
+        result = await db.execute(
+            select(func.max(ChatMessageArchive.last_created_at))
+            .filter(ChatMessageArchive.user_id == user_id, ChatMessageArchive.first_created_at <= before[0])
+        )
+        latest = result.scalar()
+        if latest is None:
+            return None
+        return min(to_naive_utc(latest), to_naive_utc(before[0]))
+
+    @staticmethod
+    async def get_messages(
+        db: AsyncSession,
+        user_id: int,
+        start: datetime,
+        before: Optional[Tuple[datetime, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        读取 start 之后、游标之前的归档消息，每条带有所在日期 day
+        """
+        query = select(ChatMessageArchive.day, ChatMessageArchive.payload).filter(
+            ChatMessageArchive.user_id == user_id,
+            ChatMessageArchive.day >= to_naive_utc(start).strftime("%Y-%m-%d"),
+        )
+        if before is not None:
+            query = query.filter(ChatMessageArchive.first_created_at <= before[0])
+        result = await db.execute(query)
+
+        start = to_naive_utc(start)
+        messages = []
+        for day, payload in result.all():
+            for message in decode_segment(payload):
+                if message["created_at"] >= start and _before(message, before):
+                    message["day"] = day
+                    messages.append(message)
+        return messages
+
+    @staticmethod
+    async def has_messages_before(db: AsyncSession, user_id: int, day: str) -> bool:
+        result = await db.execute(
+            select(ChatMessageArchive.id)
+            .filter(ChatMessageArchive.user_id == user_id, ChatMessageArchive.day < day)
+            .limit(1)
+        )
+        return result.first() is not None
+
+    @staticmethod
+    async def get_day_counts(db: AsyncSession, user_id: int, first_day: str, last_day: str) -> Dict[str, int]:
+        result = await db.execute(
+            select(ChatMessageArchive.day, func.sum(ChatMessageArchive.message_count))
+            .filter(
+                ChatMessageArchive.user_id == user_id,
+                ChatMessageArchive.day >= first_day,
+                ChatMessageArchive.day <= last_day,
+            )
+            .group_by(ChatMessageArchive.day)
+        )
+        return {day: int(count) for day, count in result.all()}
+
+    @staticmethod
+    async def delete_message(db: AsyncSession, message_id: int, user_id: int) -> bool:
+        """
+        从归档段中删除单条消息（重写所在的段），不提交
+        """
+        result = await db.execute(
+            select(ChatMessageArchive).filter(
+                ChatMessageArchive.user_id == user_id,
+                ChatMessageArchive.first_message_id <= message_id,
+                ChatMessageArchive.last_message_id >= message_id,
+            )
+        )
+        for segment in result.scalars().all():
+            messages = decode_segment(segment.payload)
+            remaining = [message for message in messages if message["id"] != message_id]
+            if len(remaining) == len(messages):
+                continue
+            if not remaining:
+                await db.delete(segment)
+            else:
+                for message in remaining:
+                    message["created_at"] = message["created_at"].isoformat()
+                segment.payload = encode_segment(remaining)
+                segment.message_count = len(remaining)
+            return True
+        return False
+
+class ChatArchiver:
+    """
+    定期把超过保留期的聊天消息移入归档表
+
+    按整天归档：早于 (今天 - after_days) 零点的消息按 id 顺序每次处理 chunk_size 条，
+    按用户和日期压缩成段写入 chat_message_archives，并在同一事务中从 chat_messages 删除，
+    每个事务都很短，热表保持较小。多个进程同时归档时，删除行数不符的一方回滚。
+    """
+
+    def __init__(self, after_days: int = 90, chunk_size: int = 1000, interval: float = 3600):
+        self.after_days = after_days
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.archived_messages = 0
+        self.segments = 0
+        self.conflicts = 0
+        self.failures = 0
+        self.last_run_at: Optional[datetime] = None
+
+    def cutoff(self, now: Optional[datetime] = None) -> datetime:
+        now = now or datetime.utcnow()
+        return datetime.combine((now - timedelta(days=self.after_days)).date(), time.min)
+
+    async def archive_chunk(self, cutoff: datetime) -> int:
+        """
+        归档一批早于 cutoff 的消息，返回归档的条数
+        """
+        async with AsyncSessionLocal() as db:
+            # 沿 (created_at, id) 索引按时间顺序取出最早的一批，不扫描保留期内的消息
+            result = await db.execute(
+                select(
+                    ChatMessage.id, ChatMessage.user_id, ChatMessage.role, ChatMessage.content,
+                    ChatMessage.created_at, ChatMessage.model_provider,
+                )
+                .filter(ChatMessage.created_at < cutoff)
+                .order_by(ChatMessage.created_at, ChatMessage.id)
+                .limit(self.chunk_size)
+            )
+            rows = result.all()
+            if not rows:
+                return 0
+
+            def segment_key(row):
+                return row.user_id, to_naive_utc(row.created_at).strftime("%Y-%m-%d")
+
+            segments = []
+            for (user_id, day), group in groupby(sorted(rows, key=lambda r: (*segment_key(r), r.id)), key=segment_key):
+                group = list(group)
+                messages = [
+                    {
+                        "id": row.id,
+                        "role": row.role,
+                        "content": row.content,
+                        "created_at": to_naive_utc(row.created_at).isoformat(),
+                        "model_provider": row.model_provider,
+                    }
+                    for row in group
+                ]
+                segments.append(ChatMessageArchive(
+                    user_id=user_id,
+                    day=day,
+                    first_message_id=group[0].id,
+                    last_message_id=group[-1].id,
+                    first_created_at=min(to_naive_utc(row.created_at) for row in group),
+                    last_created_at=max(to_naive_utc(row.created_at) for row in group),
+                    message_count=len(group),
+                    payload=encode_segment(messages),
+                ))
+            db.add_all(segments)
+            ids = [row.id for row in rows]
+            deleted = await db.execute(delete(ChatMessage).where(ChatMessage.id.in_(ids)))
+            if deleted.rowcount != len(ids):
+                # 另一个进程已经归档了其中的部分消息
+                await db.rollback()
+                self.conflicts += 1
+                return 0
+            await db.commit()
+
+        self.archived_messages += len(rows)
+        self.segments += len(segments)
+        return len(rows)
+
+    async def archive_expired(self, now: Optional[datetime] = None) -> int:
+        """
+        分批归档所有超过保留期的消息，返回归档的总条数
+        """
+        cutoff = self.cutoff(now)
+        total = 0
+        while True:
+            archived = await self.archive_chunk(cutoff)
+            total += archived
+            if archived < self.chunk_size:
+                break
+            # 批次之间让出事件循环
+            await asyncio.sleep(0)
+        self.runs += 1
+        self.last_run_at = datetime.utcnow()
+        if total:
+            logger.info(f"Archived {total} chat messages older than {cutoff.date()}")
+        return total
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.archive_expired()
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Chat message archiving failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.CHAT_ARCHIVE_ENABLED,
+            "after_days": self.after_days,
+            "cutoff": self.cutoff().date().isoformat(),
+            "runs": self.runs,
+            "archived_messages": self.archived_messages,
+            "segments": self.segments,
+            "conflicts": self.conflicts,
+            "failures": self.failures,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
+
+chat_archiver = ChatArchiver(
+    after_days=settings.CHAT_ARCHIVE_AFTER_DAYS,
+    chunk_size=settings.CHAT_ARCHIVE_CHUNK_SIZE,
+    interval=settings.CHAT_ARCHIVE_INTERVAL_SECONDS,
+)
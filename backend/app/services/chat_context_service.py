@@ -0,0 +1,207 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.chat_message import ChatMessage
+from app.models.chat_summary import ChatSummary
+from app.services.ai_service import chat_with_ai
+from app.utils.tokens import count_message_tokens, count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+class ChatContext:
+    """
+    构建好的对话上下文
+
+    messages: 按时间顺序排列、符合token预算的最近消息（不含本次用户消息）
+    summary: 更早消息的滚动摘要，没有时为None
+    fold_before_id: 不为None时，id 小于该值且尚未汇总的消息需要折叠进摘要
+    """
+
+    def __init__(
+        self,
+        messages: List[Dict[str, str]],
+        summary: Optional[str],
+        tokens: int,
+        fold_before_id: Optional[int] = None,
+    ):
+        self.messages = messages
+        self.summary = summary
+        self.tokens = tokens
+        self.fold_before_id = fold_before_id
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and their goal planning assistant. "
+    "Update the previous summary with the new messages. Keep the user's goals, tasks, deadlines, preferences "
+    "and any open questions; drop greetings and small talk. Write in the language the user uses, "
+    "as plain text of at most {max_words} words. Reply with the updated summary only."
+)
+
+class ChatContextService:
+    @staticmethod
+    async def build_context(
+        db: AsyncSession,
+        user_id: int,
+        new_message: Optional[str] = None,
+        token_budget: Optional[int] = None,
+        max_messages: Optional[int] = None,
+    ) -> ChatContext:
+        """
+        在token预算内构建对话上下文
+
+        预算包括摘要、历史消息和本次用户消息。只读取摘要之后的消息（最多 max_messages 条），
+        从最新的一条开始向前保留，放不下的更早消息由 ChatSummarizer 在后台折叠进摘要。
+        """
+        token_budget = token_budget if token_budget is not None else settings.CHAT_CONTEXT_TOKEN_BUDGET
+        max_messages = max_messages if max_messages is not None else settings.CHAT_CONTEXT_MAX_MESSAGES
+
+        result = await db.execute(
+            select(ChatSummary.summary, ChatSummary.last_message_id, ChatSummary.token_count)
+            .filter(ChatSummary.user_id == user_id)
+        )
+        summary_row = result.first()
+        summary = summary_row.summary if summary_row and summary_row.summary else None
+        last_message_id = summary_row.last_message_id if summary_row else 0
+        used = (summary_row.token_count if summary else 0) + count_tokens(new_message or "")
+
+        result = await db.execute(
+            select(ChatMessage.id, ChatMessage.role, ChatMessage.content)
+            .filter(ChatMessage.user_id == user_id, ChatMessage.id > last_message_id)
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+            .limit(max_messages)
+        )
+        rows = result.all()
+
+        kept = []
+        fold_before_id = None
+        for row in rows:
+            message = {"role": row.role, "content": row.content}
+            tokens = count_message_tokens(message)
+            if used + tokens > token_budget:
+                # 这一条及更早的消息都放不下
+                fold_before_id = kept[-1][0] if kept else row.id + 1
+                break
+            used += tokens
+            kept.append((row.id, message))
+        else:
+            if len(rows) == max_messages and kept:
+                # 超出读取上限的更早消息同样需要折叠
+                fold_before_id = kept[-1][0]
+
+        kept.reverse()
+        return ChatContext(
+            messages=[message for _, message in kept],
+            summary=summary,
+            tokens=used,
+            fold_before_id=fold_before_id,
+        )
+
+class ChatSummarizer:
+    """
+    在后台把超出上下文预算的旧消息增量折叠进用户的摘要行
+
+    每次只把上次摘要之后的一批消息和旧摘要一起发给模型，不需要重新读取整个历史。
+    同一用户同时最多只有一个折叠任务。
+    """
+
+    def __init__(self):
+        self._running: Dict[int, asyncio.Task] = {}
+        self.folds = 0
+        self.folded_messages = 0
+        self.failures = 0
+
+    def schedule(self, user_id: int, before_id: int) -> Optional[asyncio.Task]:
+        if not settings.CHAT_SUMMARY_ENABLED or user_id in self._running:
+            return None
+        task = asyncio.create_task(self._fold_safely(user_id, before_id))
+        self._running[user_id] = task
+        task.add_done_callback(lambda _: self._running.pop(user_id, None))
+        return task
+
+    async def _fold_safely(self, user_id: int, before_id: int) -> None:
+        try:
+            await self.fold(user_id, before_id)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Failed to update chat summary for user {user_id}: {e}")
+
+    async def fold(self, user_id: int, before_id: int) -> int:
+        """
+        把 id 小于 before_id 且尚未汇总的消息（最多 CHAT_SUMMARY_BATCH 条）折叠进摘要，返回折叠的消息数
+        """
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ChatSummary.summary, ChatSummary.last_message_id).filter(ChatSummary.user_id == user_id)
+            )
+            summary_row = result.first()
+            previous = summary_row.summary if summary_row else ""
+            last_message_id = summary_row.last_message_id if summary_row else 0
+
+            result = await db.execute(
+                select(ChatMessage.id, ChatMessage.role, ChatMessage.content)
+                .filter(
+                    ChatMessage.user_id == user_id,
+                    ChatMessage.id > last_message_id,
+                    ChatMessage.id < before_id,
+                )
+                .order_by(ChatMessage.id)
+                .limit(settings.CHAT_SUMMARY_BATCH)
+            )
+            rows = result.all()
+            if not rows:
+                return 0
+
+            transcript = "\n".join(
+                f"{row.role}: {truncate_to_tokens(row.content, settings.CHAT_SUMMARY_MAX_TOKENS)}" for row in rows
+            )
+            prompt = f"Previous summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"
+            summary = await chat_with_ai(
+                [{"role": "user", "content": prompt}],
+                system_prompt=SUMMARY_SYSTEM_PROMPT.format(max_words=settings.CHAT_SUMMARY_MAX_TOKENS // 2),
+            )
+            summary = truncate_to_tokens(summary.strip(), settings.CHAT_SUMMARY_MAX_TOKENS)
+            values = {
+                "summary": summary,
+                "last_message_id": rows[-1].id,
+                "token_count": count_tokens(summary),
+            }
+
+            if summary_row is None:
+                db.add(ChatSummary(user_id=user_id, **values))
+            else:
+                # 只有摘要未被其他进程更新时才写入
+                result = await db.execute(
+                    update(ChatSummary)
+                    .where(ChatSummary.user_id == user_id, ChatSummary.last_message_id == last_message_id)
+                    .values(**values)
+                )
+                if result.rowcount == 0:
+                    return 0
+            try:
+                await db.commit()
+            except IntegrityError:
+                # 另一个进程同时创建了摘要行
+                await db.rollback()
+                return 0
+
+        self.folds += 1
+        self.folded_messages += len(rows)
+        logger.info(f"Folded {len(rows)} messages into chat summary for user {user_id}")
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.CHAT_SUMMARY_ENABLED,
+            "running": len(self._running),
+            "folds": self.folds,
+            "folded_messages": self.folded_messages,
+            "failures": self.failures,
+        }
+
+chat_summarizer = ChatSummarizer()
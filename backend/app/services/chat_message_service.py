@@ -1,12 +1,16 @@
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import select, delete, insert, func, cast, and_, or_, String
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.chat_message import ChatMessage
-from datetime import datetime, timedelta
+from app.models.chat_summary import ChatSummary
+from app.models.chat_message_archive import ChatMessageArchive
+from app.services.chat_archive_service import ChatArchiveService, to_naive_utc
+from datetime import datetime, timedelta, time
 
 class ChatMessageService:
     @staticmethod
-    def create_message(
-        db: Session, 
+    async def create_message(
+        db: AsyncSession, 
         user_id: int, 
         role: str, 
         content: str,
@@ -22,13 +26,39 @@ class ChatMessageService:
             model_provider=model_provider
         )
         db.add(message)
-        db.commit()
-        db.refresh(message)
+        await db.commit()
+        await db.refresh(message)
         return message
     
     @staticmethod
-    def get_messages_by_user(
-        db: Session, 
+    async def create_messages(
+        db: AsyncSession,
+        user_id: int,
+        messages: List[Dict[str, str]],
+        model_provider: Optional[str] = None
+    ) -> int:
+        """
+        用一条INSERT语句保存多条消息（例如一轮对话的用户消息和AI回复），只提交一次，返回保存的条数
+
+        messages 中每项包含 role 和 content，按列表顺序分配id
+        """
+        if not messages:
+            return 0
+        await db.execute(insert(ChatMessage).values([
+            {
+                "user_id": user_id,
+                "role": message["role"],
+                "content": message["content"],
+                "model_provider": message.get("model_provider", model_provider),
+            }
+            for message in messages
+        ]))
+        await db.commit()
+        return len(messages)
+
+    @staticmethod
+    async def get_messages_by_user(
+        db: AsyncSession, 
         user_id: int, 
         limit: int = 100,
         skip: int = 0,
@@ -37,16 +67,17 @@ class ChatMessageService:
         """
         获取用户的聊天历史记录
         """
-        query = db.query(ChatMessage).filter(ChatMessage.user_id == user_id)
+        query = select(ChatMessage).filter(ChatMessage.user_id == user_id)
         
         if start_date:
             query = query.filter(ChatMessage.created_at >= start_date)
             
-        return query.order_by(ChatMessage.created_at).offset(skip).limit(limit).all()
+        result = await db.execute(query.order_by(ChatMessage.created_at).offset(skip).limit(limit))
+        return list(result.scalars().all())
     
     @staticmethod
-    def get_messages_for_context(
-        db: Session, 
+    async def get_messages_for_context(
+        db: AsyncSession, 
         user_id: int, 
         max_messages: int = 20,
         hours_limit: int = 24
@@ -55,10 +86,13 @@ class ChatMessageService:
         获取供AI上下文使用的最近消息
         """
         time_threshold = datetime.utcnow() - timedelta(hours=hours_limit)
-        messages = db.query(ChatMessage).filter(
-            ChatMessage.user_id == user_id,
-            ChatMessage.created_at >= time_threshold
-        ).order_by(ChatMessage.created_at.desc()).limit(max_messages).all()
+        result = await db.execute(
+            select(ChatMessage).filter(
+                ChatMessage.user_id == user_id,
+                ChatMessage.created_at >= time_threshold
+            ).order_by(ChatMessage.created_at.desc()).limit(max_messages)
+        )
+        messages = list(result.scalars().all())
         
         # 反转排序，使最旧的消息先出现
         messages.reverse()
@@ -70,42 +104,167 @@ class ChatMessageService:
         ]
     
     @staticmethod
-    def group_messages_by_date(messages: List[ChatMessage]) -> Dict[str, List[ChatMessage]]:
+    async def get_history_page(
+        db: AsyncSession,
+        user_id: int,
+        days: int = 7,
+        limit: int = 200,
+        before: Optional[Tuple[datetime, int]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[datetime, int]]]:
         """
-        将消息按日期分组
+        按天分组获取一页聊天记录，返回 (分组列表, 下一页游标)
+
+        第一页覆盖包括今天在内的最近 days 天；before 为上一页游标 (created_at, id) 时，
+        覆盖早于游标的最近一条消息所在日期起向前 days 天，跳过没有消息的空档。
+        每页最多 limit 条消息，从最新的开始；日期分组和每天的消息总数在SQL中计算。
+        分组按日期倒序，组内消息按时间正序，count 为当天的消息总数（可能多于本页返回的条数）。
+        已归档的旧消息从归档表读取，与近期消息合并返回。
         """
-        grouped_messages = {}
-        
+        day = cast(func.date(ChatMessage.created_at), String)
+        filters = [ChatMessage.user_id == user_id]
+        if before is not None:
+            before_at, before_id = before
+            filters.append(or_(
+                ChatMessage.created_at < before_at,
+                and_(ChatMessage.created_at == before_at, ChatMessage.id < before_id),
+            ))
+            anchors = [
+                (await db.execute(select(func.max(ChatMessage.created_at)).filter(*filters))).scalar(),
+                await ChatArchiveService.latest_before(db, user_id, before),
+            ]
+            anchors = [to_naive_utc(anchor) for anchor in anchors if anchor is not None]
+            if not anchors:
+                return [], None
+            anchor = max(anchors)
+        else:
+            anchor = datetime.utcnow()
+        window_start = datetime.combine(anchor.date(), time.min) - timedelta(days=days - 1)
+
+        result = await db.execute(
+            select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at,
+                   ChatMessage.model_provider, day.label("day"))
+            .filter(*filters, ChatMessage.created_at >= window_start)
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+            .limit(limit + 1)
+        )
+        messages = [dict(row._mapping) for row in result.all()]
+        messages += await ChatArchiveService.get_messages(db, user_id, window_start, before)
+        messages.sort(key=lambda m: (to_naive_utc(m["created_at"]), m["id"]), reverse=True)
+
+        next_cursor = None
+        if len(messages) > limit:
+            messages = messages[:limit]
+            next_cursor = (messages[-1]["created_at"], messages[-1]["id"])
+        else:
+            older = await db.execute(
+                select(ChatMessage.id).filter(ChatMessage.user_id == user_id, ChatMessage.created_at < window_start).limit(1)
+            )
+            if older.first() is not None or await ChatArchiveService.has_messages_before(
+                db, user_id, window_start.strftime("%Y-%m-%d")
+            ):
+                # 窗口内的消息已全部返回，下一页从窗口开始之前继续
+                next_cursor = (window_start, 0)
+        if not messages:
+            return [], next_cursor
+
+        # 每天的消息总数（整天，不受游标和 limit 影响）
+        first_day = to_naive_utc(messages[-1]["created_at"]).date()
+        last_day = to_naive_utc(messages[0]["created_at"]).date()
+        counts = await db.execute(
+            select(day, func.count(ChatMessage.id))
+            .filter(
+                ChatMessage.user_id == user_id,
+                ChatMessage.created_at >= datetime.combine(first_day, time.min),
+                ChatMessage.created_at < datetime.combine(last_day, time.min) + timedelta(days=1),
+            )
+            .group_by(day)
+        )
+        day_counts = dict(counts.all())
+        archived_counts = await ChatArchiveService.get_day_counts(
+            db, user_id, first_day.isoformat(), last_day.isoformat()
+        )
+        for key, count in archived_counts.items():
+            day_counts[key] = day_counts.get(key, 0) + count
+
+        groups: List[Dict[str, Any]] = []
         for message in messages:
-            date_key = message.created_at.strftime("%Y-%m-%d")
-            if date_key not in grouped_messages:
-                grouped_messages[date_key] = []
-            grouped_messages[date_key].append(message)
-            
-        return grouped_messages
-    
+            message_day = message.pop("day")
+            if not groups or groups[-1]["date"] != message_day:
+                groups.append({"date": message_day, "count": day_counts.get(message_day, 0), "messages": []})
+            message["created_at"] = message["created_at"].isoformat()
+            groups[-1]["messages"].append(message)
+        for group in groups:
+            group["messages"].reverse()
+        return groups, next_cursor
+
     @staticmethod
-    def delete_message(db: Session, message_id: int, user_id: int) -> bool:
+    async def delete_message(db: AsyncSession, message_id: int, user_id: int) -> bool:
         """
-        删除单条消息
+        删除单条消息（近期消息或归档中的消息）
         """
-        message = db.query(ChatMessage).filter(
-            ChatMessage.id == message_id,
-            ChatMessage.user_id == user_id
-        ).first()
+        result = await db.execute(
+            select(ChatMessage).filter(
+                ChatMessage.id == message_id,
+                ChatMessage.user_id == user_id
+            )
+        )
+        message = result.scalars().first()
         
-        if not message:
+        if message:
+            await db.delete(message)
+        elif not await ChatArchiveService.delete_message(db, message_id, user_id):
+            # 近期消息和归档中都没有
             return False
             
-        db.delete(message)
-        db.commit()
+        await db.commit()
         return True
     
     @staticmethod
-    def clear_user_history(db: Session, user_id: int) -> int:
+    async def get_max_message_id(db: AsyncSession, user_id: int) -> Tuple[int, int]:
         """
-        清空用户所有聊天记录，返回删除的记录数
+        用户当前最大的消息ID和消息总数（包括归档），作为分批清空的边界和进度总量
         """
-        result = db.query(ChatMessage).filter(ChatMessage.user_id == user_id).delete()
-        db.commit()
-        return result 
\ No newline at end of file
+        result = await db.execute(
+            select(func.max(ChatMessage.id), func.count(ChatMessage.id)).filter(ChatMessage.user_id == user_id)
+        )
+        max_id, count = result.one()
+        archived = await db.execute(
+            select(func.max(ChatMessageArchive.last_message_id), func.sum(ChatMessageArchive.message_count))
+            .filter(ChatMessageArchive.user_id == user_id)
+        )
+        archived_max_id, archived_count = archived.one()
+        return max(max_id or 0, archived_max_id or 0), count + int(archived_count or 0)
+
+    @staticmethod
+    async def delete_history_batch(db: AsyncSession, user_id: int, max_id: int, batch_size: int) -> int:
+        """
+        删除用户 id 不大于 max_id 的一批聊天记录并提交，返回删除的消息数；返回0表示已清空
+
+        先删近期消息，再删归档段（每段计入其中的消息数），最后删除对话摘要。
+        """
+        result = await db.execute(
+            select(ChatMessage.id)
+            .filter(ChatMessage.user_id == user_id, ChatMessage.id <= max_id)
+            .limit(batch_size)
+        )
+        ids = result.scalars().all()
+        if ids:
+            await db.execute(delete(ChatMessage).where(ChatMessage.id.in_(ids)))
+            await db.commit()
+            return len(ids)
+
+        # 清空期间归档任务可能把消息移入归档，所以归档放在近期消息之后
+        result = await db.execute(
+            select(ChatMessageArchive.id, ChatMessageArchive.message_count)
+            .filter(ChatMessageArchive.user_id == user_id, ChatMessageArchive.first_message_id <= max_id)
+            .limit(batch_size)
+        )
+        segments = result.all()
+        if segments:
+            await db.execute(delete(ChatMessageArchive).where(ChatMessageArchive.id.in_([s.id for s in segments])))
+            await db.commit()
+            return sum(s.message_count for s in segments)
+
+        await db.execute(delete(ChatSummary).where(ChatSummary.user_id == user_id))
+        await db.commit()
+        return 0
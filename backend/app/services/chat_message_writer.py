@@ -0,0 +1,205 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.chat_message import ChatMessage
+from app.services.chat_message_service import ChatMessageService
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ("buffered", "commit")
+
+# 队列中的一轮对话：(user_id, messages, model_provider, 等待提交结果的future)
+_PendingTurn = Tuple[int, List[Dict[str, str]], Optional[str], Optional[asyncio.Future]]
+
+class ChatMessageWriter:
+    """
+    聊天消息的写后（write-behind）持久化
+
+    启用后请求只把一轮对话的消息放进有界队列，后台worker把多个请求的消息合并成一条INSERT、一次提交（组提交）：
+    - 队列最多 max_pending 轮对话，满时请求等待队列腾出空间（背压），内存占用有上限
+    - durability="buffered"：入队即返回，进程崩溃时可能丢失尚未提交的一批消息
+    - durability="commit"：等待所在批次提交后返回，不丢消息，提交开销仍由整批分摊
+    - 应用关闭时 shutdown() 写完队列中剩余的消息
+    未启用时 save() 在请求内用一条INSERT同步写入。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        durability: str = "buffered",
+        max_pending: int = 1000,
+        batch_size: int = 200,
+        flush_interval: float = 0.02,
+        max_attempts: int = 2,
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unsupported chat write durability: {durability}")
+        self.enabled = enabled
+        self.durability = durability
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.turns = 0
+        self.sync_writes = 0
+        self.batches = 0
+        self.written_messages = 0
+        self.max_batch = 0
+        self.failed_messages = 0
+        self.backpressure_waits = 0
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        # 队列和worker绑定在当前事件循环上（测试中每个用例可能使用新的事件循环）
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._loop = loop
+            self._worker = loop.create_task(self._run(self._queue))
+        return self._queue
+
+    async def save(
+        self,
+        user_id: int,
+        messages: List[Dict[str, str]],
+        model_provider: Optional[str] = None,
+        db: Optional[AsyncSession] = None,
+    ) -> None:
+        """
+        保存一轮对话的消息（按列表顺序）
+
+        同步写入时使用 db；db 为None时（例如流式响应结束后）使用独立会话。
+        """
+        if not messages:
+            return
+        self.turns += 1
+        if not self.enabled:
+            self.sync_writes += 1
+            if db is not None:
+                await ChatMessageService.create_messages(db, user_id, messages, model_provider)
+            else:
+                async with AsyncSessionLocal() as session:
+                    await ChatMessageService.create_messages(session, user_id, messages, model_provider)
+            return
+
+        queue = self._ensure_worker()
+        future = self._loop.create_future() if self.durability == "commit" else None
+        if queue.full():
+            self.backpressure_waits += 1
+        await queue.put((user_id, messages, model_provider, future))
+        if future is not None:
+            await future
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            count = len(batch[0][1])
+            # 在 flush_interval 内继续收集其他请求的消息，直到凑满一批
+            deadline = loop.time() + self.flush_interval
+            while count < self.batch_size:
+                if queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = queue.get_nowait()
+                batch.append(item)
+                count += len(item[1])
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _write(self, batch: List[_PendingTurn]) -> None:
+        rows = [
+            {
+                "user_id": user_id,
+                "role": message["role"],
+                "content": message["content"],
+                "model_provider": message.get("model_provider", model_provider),
+            }
+            for user_id, messages, model_provider, _ in batch
+            for message in messages
+        ]
+        error: Optional[Exception] = None
+        for attempt in range(self.max_attempts):
+            try:
+                async with AsyncSessionLocal() as session:
+                    await session.execute(insert(ChatMessage).values(rows))
+                    await session.commit()
+                error = None
+                break
+            except Exception as e:
+                error = e
+                logger.warning(f"Failed to write {len(rows)} chat messages (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(0.1 * (attempt + 1))
+
+        if error is None:
+            self.batches += 1
+            self.written_messages += len(rows)
+            self.max_batch = max(self.max_batch, len(rows))
+        else:
+            self.failed_messages += len(rows)
+            logger.error(f"Dropped {len(rows)} chat messages after {self.max_attempts} attempts: {error}")
+
+        for *_, future in batch:
+            if future is not None and not future.done():
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    async def flush(self) -> None:
+        """
+        等待队列中已有的消息全部写入（或写入失败）
+        """
+        worker = self._worker
+        if worker is not None and not worker.done() and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def shutdown(self) -> None:
+        """
+        写完剩余消息后停止后台worker
+        """
+        await self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "write_behind": self.enabled,
+            "durability": self.durability,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "max_pending": self.max_pending,
+            "turns": self.turns,
+            "sync_writes": self.sync_writes,
+            "batches": self.batches,
+            "written_messages": self.written_messages,
+            "avg_batch": round(self.written_messages / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "failed_messages": self.failed_messages,
+            "backpressure_waits": self.backpressure_waits,
+        }
+
+chat_message_writer = ChatMessageWriter(
+    enabled=settings.CHAT_WRITE_BEHIND_ENABLED,
+    durability=settings.CHAT_WRITE_DURABILITY,
+    max_pending=settings.CHAT_WRITE_BEHIND_MAX_PENDING,
+    batch_size=settings.CHAT_WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.CHAT_WRITE_BEHIND_FLUSH_MS / 1000,
+)
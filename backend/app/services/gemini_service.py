@@ -1,64 +1,78 @@
-import requests
+import httpx
 import json
 import logging
 from app.core.config import settings
+from app.services.http_client import get_http_client
+from app.services.provider_limiter import RETRYABLE_STATUS_CODES, TransientProviderError, parse_retry_after
 
 logger = logging.getLogger(__name__)
 
-def chat_with_gemini(messages, model="gemini-1.5-flash"):
+def build_gemini_request(messages, json_mode=False):
+    """
+    将OpenAI格式的消息列表转换为Gemini API请求体
+
+    json_mode 为True时要求Gemini以 application/json 输出
+    """
+    gemini_contents = []
+
+    for msg in messages:
+        # 处理系统消息 - Gemini不直接支持系统消息，将其转换为模型消息
+        if msg["role"] == "system":
+            role = "model"
+        else:
+            role = "user" if msg["role"] == "user" else "model"
+
+        gemini_contents.append({
+            "role": role,
+            "parts": [{"text": msg["content"]}]
+        })
+
+    logger.debug(f"Request contents (first 100 chars): {str(gemini_contents)[:100]}...")
+
+    generation_config = {
+        "temperature": 0.7,
+        "topK": 40,
+        "topP": 0.95,
+        "maxOutputTokens": 1024,
+    }
+    if json_mode:
+        generation_config["responseMimeType"] = "application/json"
+
+    return {
+        "contents": gemini_contents,
+        "generationConfig": generation_config
+    }
+
+def _check_api_key():
+    if not settings.GEMINI_API_KEY:
+        err_msg = "Gemini API Key is not set. Please set GEMINI_API_KEY environment variable."
+        logger.error(err_msg)
+        raise ValueError(err_msg)
+
+async def chat_with_gemini(messages, model="gemini-1.5-flash", json_mode=False):
     """
     使用Google Gemini API进行聊天
     
     Args:
         messages: 消息列表，每条消息应包含'role'和'content'
         model: Gemini模型名称
+        json_mode: 是否要求JSON输出
     
     Returns:
         生成的文本响应
     """
-    if not settings.GEMINI_API_KEY:
-        err_msg = "Gemini API Key is not set. Please set GEMINI_API_KEY environment variable."
-        logger.error(err_msg)
-        raise ValueError(err_msg)
+    _check_api_key()
         
     try:
-        # 构建Gemini API请求格式
-        gemini_contents = []
-        
-        for msg in messages:
-            # 处理系统消息 - Gemini不直接支持系统消息，将其转换为模型消息
-            if msg["role"] == "system":
-                role = "model"
-            else:
-                role = "user" if msg["role"] == "user" else "model"
-                
-            gemini_contents.append({
-                "role": role,
-                "parts": [{"text": msg["content"]}]
-            })
-        
-        # 记录请求信息
+        request_body = build_gemini_request(messages, json_mode=json_mode)
         logger.info(f"Sending request to Gemini API using model: {model}")
-        logger.debug(f"Request contents (first 100 chars): {str(gemini_contents)[:100]}...")
-        
-        # 创建请求体
-        request_body = {
-            "contents": gemini_contents,
-            "generationConfig": {
-                "temperature": 0.7,
-                "topK": 40,
-                "topP": 0.95,
-                "maxOutputTokens": 1024,
-            }
-        }
-        
-        # 发送请求到Gemini API
-        api_endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-        response = requests.post(
-            f"{api_endpoint}?key={settings.GEMINI_API_KEY}",
-            headers={"Content-Type": "application/json"},
+
+        # 通过共享连接池发送请求到Gemini API
+        api_endpoint = f"{settings.GEMINI_API_BASE}/{model}:generateContent"
+        response = await get_http_client().post(
+            api_endpoint,
+            params={"key": settings.GEMINI_API_KEY},
             json=request_body,
-            timeout=30  # 设置超时时间为30秒
         )
         
         if response.status_code == 200:
@@ -79,16 +93,79 @@ def chat_with_gemini(messages, model="gemini-1.5-flash"):
         else:
             error_msg = f"Gemini API error: {response.status_code}"
             logger.error(f"{error_msg} - {response.text}")
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                # 限流或服务端暂时不可用，由准入层退避重试
+                raise TransientProviderError(
+                    f"{error_msg} - {response.text}",
+                    status_code=response.status_code,
+                    retry_after=parse_retry_after(response.headers.get("Retry-After")),
+                )
             raise Exception(f"{error_msg} - {response.text}")
-    except requests.exceptions.Timeout:
+    except TransientProviderError:
+        raise
+    except httpx.ConnectTimeout as e:
+        error_msg = f"Timed out connecting to Gemini API: {str(e)}"
+        logger.error(error_msg)
+        raise TransientProviderError(error_msg)
+    except httpx.TimeoutException:
         error_msg = "Gemini API request timed out"
         logger.error(error_msg)
         raise Exception(error_msg)
-    except requests.exceptions.RequestException as e:
+    except httpx.RequestError as e:
         error_msg = f"Network error when calling Gemini API: {str(e)}"
         logger.error(error_msg)
-        raise Exception(error_msg)
+        raise TransientProviderError(error_msg)
     except Exception as e:
         error_msg = f"Failed to get Gemini response: {str(e)}"
         logger.error(error_msg)
-        raise Exception(error_msg) 
\ No newline at end of file
+        raise Exception(error_msg)
+
+async def stream_chat_with_gemini(messages, model="gemini-1.5-flash"):
+    """
+    使用Gemini streamGenerateContent 接口流式聊天
+
+    Args:
+        messages: 消息列表，每条消息应包含'role'和'content'
+        model: Gemini模型名称
+
+    Yields:
+        按生成顺序返回的文本片段
+    """
+    _check_api_key()
+
+    request_body = build_gemini_request(messages)
+    logger.info(f"Streaming request to Gemini API using model: {model}")
+
+    # alt=sse 让Gemini以SSE格式逐块返回；读超时针对相邻两块之间的间隔，而不是整个回复
+    api_endpoint = f"{settings.GEMINI_API_BASE}/{model}:streamGenerateContent"
+    try:
+        async with get_http_client().stream(
+            "POST",
+            api_endpoint,
+            params={"alt": "sse", "key": settings.GEMINI_API_KEY},
+            json=request_body,
+        ) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", errors="replace")
+                error_msg = f"Gemini API error: {response.status_code}"
+                logger.error(f"{error_msg} - {body}")
+                raise Exception(f"{error_msg} - {body}")
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[len("data:"):].strip())
+                candidates = data.get("candidates") or []
+                if not candidates:
+                    continue
+                for part in (candidates[0].get("content") or {}).get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
+    except httpx.TimeoutException:
+        error_msg = "Gemini API request timed out"
+        logger.error(error_msg)
+        raise Exception(error_msg)
+    except httpx.RequestError as e:
+        error_msg = f"Network error when calling Gemini API: {str(e)}"
+        logger.error(error_msg)
+        raise Exception(error_msg)
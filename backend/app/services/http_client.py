@@ -0,0 +1,59 @@
+import logging
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def get_llm_timeout() -> httpx.Timeout:
+    """
+    LLM请求的超时设置：连接超时较短，读超时针对相邻两次收到数据的间隔
+    """
+    return httpx.Timeout(
+        connect=settings.LLM_HTTP_CONNECT_TIMEOUT,
+        read=settings.LLM_HTTP_READ_TIMEOUT,
+        write=settings.LLM_HTTP_CONNECT_TIMEOUT,
+        pool=settings.LLM_HTTP_CONNECT_TIMEOUT,
+    )
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    获取进程内共享的异步HTTP客户端
+
+    连接在请求之间保持复用，避免每次调用都重新进行DNS解析、TCP和TLS握手。
+    安装了 h2 包（pip install httpx[http2]）且 LLM_HTTP2 开启时使用HTTP/2。
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = settings.LLM_HTTP2 and _http2_available()
+        _client = httpx.AsyncClient(
+            http2=http2,
+            timeout=get_llm_timeout(),
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        logger.info(f"LLM HTTP client created (http2={http2}, max_connections={settings.LLM_HTTP_MAX_CONNECTIONS})")
+    return _client
+
+async def close_http_client() -> None:
+    """
+    关闭共享客户端及其连接池，应在应用关闭时调用
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
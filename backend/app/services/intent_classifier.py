@@ -0,0 +1,302 @@
+import json
+import logging
+import math
+import re
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = Path(__file__).with_name("intent_model.json")
+
+# 本地分类器可以直接回答的标签；update/delete 需要定位具体任务，总是交给LLM
+LOCAL_LABELS = ("none", "add_task", "query_task")
+
+def normalize_text(text: str) -> str:
+    """
+    归一化消息：合并空白、统一大小写、去掉首尾标点
+    """
+    text = " ".join(text.split()).casefold()
+    return text.strip(" .!?,;:~。！？，；：～、")
+
+def extract_features(text: str) -> List[str]:
+    """
+    字符 1-3 gram 特征，同时适用于中文和英文；英文额外加入整词特征
+    """
+    text = f"^{normalize_text(text)}$"
+    features = []
+    for n in (1, 2, 3):
+        features.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    features.extend(f"w:{word}" for word in re.findall(r"[a-z']+", text))
+    return features
+
+class NaiveBayesIntentModel:
+    """
+    多项式朴素贝叶斯意图模型
+
+    由 scripts/train_intent_classifier.py 离线训练，权重保存在 intent_model.json 中，
+    推理只需查表求和，不依赖第三方库。
+    """
+
+    def __init__(self, labels: List[str], log_priors: Dict[str, float],
+                 log_likelihoods: Dict[str, Dict[str, float]], log_unseen: Dict[str, float]):
+        self.labels = labels
+        self.log_priors = log_priors
+        self.log_likelihoods = log_likelihoods
+        self.log_unseen = log_unseen
+
+    @classmethod
+    def train(cls, samples: List[Tuple[str, str]], alpha: float = 0.5) -> "NaiveBayesIntentModel":
+        counts: Dict[str, Counter] = {}
+        label_counts: Counter = Counter()
+        for text, label in samples:
+            label_counts[label] += 1
+            counts.setdefault(label, Counter()).update(extract_features(text))
+        vocabulary = set()
+        for counter in counts.values():
+            vocabulary.update(counter)
+        labels = sorted(label_counts)
+        total = sum(label_counts.values())
+        log_priors = {label: math.log(label_counts[label] / total) for label in labels}
+        log_likelihoods = {}
+        log_unseen = {}
+        for label in labels:
+            denominator = sum(counts[label].values()) + alpha * (len(vocabulary) + 1)
+            log_likelihoods[label] = {
+                feature: round(math.log((count + alpha) / denominator), 4)
+                for feature, count in counts[label].items()
+            }
+            log_unseen[label] = math.log(alpha / denominator)
+        return cls(labels, log_priors, log_likelihoods, log_unseen)
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        scores = {}
+        features = extract_features(text)
+        for label in self.labels:
+            likelihoods = self.log_likelihoods[label]
+            unseen = self.log_unseen[label]
+            scores[label] = self.log_priors[label] + sum(likelihoods.get(f, unseen) for f in features)
+        best = max(scores.values())
+        exp_scores = {label: math.exp(score - best) for label, score in scores.items()}
+        total = sum(exp_scores.values())
+        return {label: value / total for label, value in exp_scores.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "labels": self.labels,
+            "log_priors": self.log_priors,
+            "log_likelihoods": self.log_likelihoods,
+            "log_unseen": self.log_unseen,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "NaiveBayesIntentModel":
+        return cls(data["labels"], data["log_priors"], data["log_likelihoods"], data["log_unseen"])
+
+def load_model(path: Path = MODEL_PATH) -> Optional[NaiveBayesIntentModel]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return NaiveBayesIntentModel.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Intent model unavailable, using rules only: {e}")
+        return None
+
+# ---- 规则 ----
+
+_SMALL_TALK = re.compile(
+    r"^(你好|您好|嗨|哈喽|早|早安|早上好|中午好|下午好|晚上好|晚安|谢谢|谢谢你|谢谢啦|多谢|感谢|好的|好|好吧|行|嗯|嗯嗯|哦|哈哈+|"
+    r"再见|拜拜|拜拜啦|收到|明白了|知道了|没事了|不用了|ok|okay|"
+    r"hi|hello|hello there|hey|hey there|yo|good (morning|afternoon|evening|night)|thanks|thank you|thanks (a lot|so much)|thx|ty|"
+    r"ok thanks|cool|great|nice|alright|bye|goodbye|see you|see ya|lol|got it|sounds good|never mind|that's all|good job)"
+    r"(呀|啊|啦|哦|!|~)*$"
+)
+
+# 这些词意味着修改或删除已有任务，需要LLM定位任务
+_MUTATION_WORDS = re.compile(
+    r"删|移除|去掉|清除|取消|不要|修改|更新|改成|改为|改到|推迟|提前|标记|完成了|做完了|"
+    r"\b(delete|remove|erase|drop|cancel|get rid|mark|update|change|rename|move|postpone|push|set|done with)\b"
+)
+
+# 出现这些日期表达时规则无法可靠换算，交给LLM
+_UNHANDLED_DATE = re.compile(
+    r"周[一二三四五六日天]|星期|礼拜|下周|下个月|下月|月底|年底|\d+\s*[月号日点]|[上下]午|晚上|早上|中午|"
+    r"\b(next|monday|tuesday|wednesday|thursday|friday|saturday|sunday|weekend|tonight|morning|evening|noon|"
+    r"am|pm|jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\b|\d+[/:-]\d+"
+)
+
+# 相对日期词及其前面的 "due/by" 等介词一起去掉
+_RELATIVE_DAYS = [
+    (re.compile(r"大后天"), 3),
+    (re.compile(r"(?:\b(?:due|by|on)\s+)?(?:后天|\bthe day after tomorrow\b)"), 2),
+    (re.compile(r"(?:\b(?:due|by|on)\s+)?(?:明天|明日|\btomorrow\b)"), 1),
+    (re.compile(r"(?:\b(?:due|by|on)\s+)?(?:今天|今日|\btoday\b)"), 0),
+]
+
+_ADD_PATTERNS = [
+    re.compile(r"^(?:请|帮我|麻烦)?(?:添加|新增|创建|新建|加)(?:一个|一项|个)?(?:新的)?(?:任务|待办事项|待办|目标)\s*[:：,，]?\s*(?P<text>.+)$"),
+    re.compile(r"^(?:请|帮我)?(?:添加|新增|创建|加)(?:一个|个)?(?P<text>.+?)(?:的)?(?:任务|待办)$"),
+    re.compile(r"^(?:请)?提醒我(?P<text>.+)$"),
+    re.compile(r"^(?:帮我)?记(?:一)?下(?P<text>.+)$"),
+    re.compile(r"^(?:please |can you |could you )?(?:add|create|make|new)(?: a| an)?(?: new)? (?:task|todo|to-do|reminder|goal)(?: to| called| for)?\s*:?\s*(?P<text>.+)$"),
+    re.compile(r"^(?:please )?remind me to (?P<text>.+)$"),
+    re.compile(r"^new (?:task|todo)\s*:?\s*(?P<text>.+)$"),
+]
+
+_QUERY_PATTERNS = [
+    re.compile(r"(显示|查看|列出|看看|看一下|查一下|给我看).*(任务|待办|目标|要做)"),
+    re.compile(r"(我有|有)(哪些|什么|多少).*(任务|待办|要做|目标)"),
+    re.compile(r"(任务|待办|目标)(有哪些|列表|清单)"),
+    re.compile(r"(今天|这周|本周|这个月|本月).*(要做什么|有什么要做|有什么任务|有哪些任务|有哪些待办)"),
+    re.compile(r"还有(哪些|什么)没(做|完成)"),
+    re.compile(r"^(?:show|list|display|view)(?: me)?(?: all)?(?: my| the)? .*(?:tasks|todos|to-dos|goals|list)\b"),
+    re.compile(r"^what(?:'s| is| are)? (?:due|left|on my list)"),
+    re.compile(r"^what (?:are )?my (?:tasks|todos|goals)"),
+    re.compile(r"^what do i (?:still )?(?:have|need) to do"),
+    re.compile(r"^what do i have (?:today|this week|this month)"),
+    re.compile(r"^which tasks (?:are|were) "),
+]
+
+_QUERY_NOISE = re.compile(r"[?？]$")
+
+def _today() -> date:
+    return datetime.now().date()
+
+def _extract_due_date(text: str, today: date) -> Tuple[str, Optional[str]]:
+    """
+    从任务文本中提取相对日期，返回 (去掉日期词后的文本, ISO日期或None)
+    """
+    due_date = None
+    for pattern, days in _RELATIVE_DAYS:
+        if pattern.search(text):
+            due_date = datetime.combine(today + timedelta(days=days), datetime.min.time()).isoformat()
+            text = pattern.sub(" ", text)
+            break
+    text = re.sub(r"\b(due|by|on|for)\s*$", "", text.strip())
+    text = re.sub(r"^(要|把|to)\s*", "", text.strip())
+    text = re.sub(r"^(截止|到期)的?|(截止|到期)的?$", "", text.strip())
+    text = text.strip(" ,，:：的")
+    return " ".join(text.split()), due_date
+
+def _extract_query_params(text: str) -> Dict[str, str]:
+    params = {"status": "all", "type": "all", "date_filter": "all", "sort_by": "due_date", "sort_order": "asc"}
+    if re.search(r"未完成|没完成|没做|还有|待完成|unfinished|pending|left|still|not done|incomplete", text):
+        params["status"] = "todo"
+    elif re.search(r"已完成|完成的|做完的|completed|finished|done", text):
+        params["status"] = "done"
+    if re.search(r"目标|goals?\b", text):
+        params["type"] = "goal"
+    if re.search(r"今天|今日|today", text):
+        params["date_filter"] = "today"
+    elif re.search(r"这周|本周|这个星期|this week", text):
+        params["date_filter"] = "this_week"
+    elif re.search(r"这个月|本月|this month", text):
+        params["date_filter"] = "this_month"
+    return params
+
+def _query_prompt(params: Dict[str, str]) -> str:
+    period = {"today": "今天", "this_week": "本周", "this_month": "本月"}.get(params["date_filter"], "")
+    status = {"todo": "未完成的", "done": "已完成的"}.get(params["status"], "")
+    kind = "目标" if params["type"] == "goal" else "任务"
+    return f"以下是{period}{status}{kind}："
+
+class LocalIntent:
+    """本地分类结果"""
+
+    def __init__(self, action: str, task: Dict[str, Any], confirmation_prompt: Optional[str], source: str):
+        self.action = action
+        self.task = task
+        self.confirmation_prompt = confirmation_prompt
+        self.source = source
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"action": self.action, "task": self.task, "confirmation_prompt": self.confirmation_prompt}
+
+class IntentClassifier:
+    """
+    LLM之前的本地意图预分类器
+
+    只回答确定的情况：寒暄/闲聊（非任务）、格式简单的添加和查询命令；
+    修改、删除、含复杂日期或模型与规则不一致的消息返回 None，交给LLM处理。
+    """
+
+    def __init__(self, model: Optional[NaiveBayesIntentModel], none_threshold: float = 0.97, agree_threshold: float = 0.3):
+        self.model = model
+        self.none_threshold = none_threshold
+        self.agree_threshold = agree_threshold
+        self.answered: Counter = Counter()
+        self.deferred = 0
+
+    def _model_agrees(self, text: str, label: str) -> bool:
+        if self.model is None:
+            return True
+        return self.model.predict_proba(text).get(label, 0.0) >= self.agree_threshold
+
+    def classify(self, message: str, today: Optional[date] = None) -> Optional[LocalIntent]:
+        """
+        返回本地分类结果；不确定时返回 None
+        """
+        text = normalize_text(message)
+        if not text:
+            return LocalIntent("none", {}, None, "rule")
+        if _SMALL_TALK.match(text):
+            return LocalIntent("none", {}, None, "rule")
+        if _MUTATION_WORDS.search(text):
+            return None
+
+        today = today or _today()
+        for pattern in _ADD_PATTERNS:
+            match = pattern.match(text)
+            if not match:
+                continue
+            if _UNHANDLED_DATE.search(text) or not self._model_agrees(text, "add_task"):
+                return None
+            # 保留原始大小写的任务文本
+            original = " ".join(message.split()).strip(" .!?,;:~。！？，；：～、")
+            task_text = original[match.start("text"):match.end("text")] if len(original) == len(text) else match.group("text")
+            task_text, due_date = _extract_due_date(task_text, today)
+            if not task_text or len(task_text) > 60:
+                return None
+            task: Dict[str, Any] = {"text": task_text}
+            if due_date:
+                task["due_date"] = due_date
+            return LocalIntent("add_task", task, f"是否要添加任务「{task_text}」？", "rule")
+
+        if not _UNHANDLED_DATE.search(text):
+            query_text = _QUERY_NOISE.sub("", text)
+            if any(pattern.search(query_text) for pattern in _QUERY_PATTERNS) and self._model_agrees(text, "query_task"):
+                params = _extract_query_params(query_text)
+                return LocalIntent("query_task", params, _query_prompt(params), "rule")
+
+        if self.model is not None and len(text) <= 40:
+            probabilities = self.model.predict_proba(text)
+            if probabilities.get("none", 0.0) >= self.none_threshold and not re.search(
+                r"任务|待办|提醒|截止|目标|日程|task|todo|remind|deadline|due|goal|schedule", text
+            ):
+                return LocalIntent("none", {}, None, "model")
+        return None
+
+    def classify_and_count(self, message: str) -> Optional[LocalIntent]:
+        """
+        与 classify 相同，同时记录本地回答和交给LLM的次数
+        """
+        result = self.classify(message)
+        if result is None:
+            self.deferred += 1
+        else:
+            self.answered[result.action] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        answered = sum(self.answered.values())
+        total = answered + self.deferred
+        return {
+            "model_loaded": self.model is not None,
+            "answered_locally": answered,
+            "deferred_to_llm": self.deferred,
+            "local_rate": round(answered / total, 4) if total else 0.0,
+            "by_action": dict(self.answered),
+        }
+
+intent_classifier = IntentClassifier(load_model())
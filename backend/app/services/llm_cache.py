@@ -0,0 +1,226 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.utils.cache import LRUCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+def normalize_message(message: str) -> str:
+    """
+    归一化用户消息：合并连续空白并统一大小写
+    """
+    return " ".join(message.split()).casefold()
+
+def utc_today() -> date:
+    """
+    当前的UTC日期；请求中附带的日期和按天缓存的结果都以它为准
+    """
+    return datetime.utcnow().date()
+
+def _seconds_until_end_of(day: date) -> float:
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time())
+    return (end - datetime.utcnow()).total_seconds()
+
+class SQLiteLLMCacheStore:
+    """
+    LLM 响应缓存的持久层，使用本地SQLite文件，进程重启后仍然有效
+
+    所有方法都是阻塞的，由 LLMResponseCache 放到线程池中调用。
+    """
+
+    def __init__(self, path: str, max_rows: int):
+        self.path = path
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_llm_response_cache_expires_at ON llm_response_cache (expires_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[tuple]:
+        """
+        查找未过期的条目，返回 (value, expires_at)
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT value, expires_at FROM llm_response_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+            self._writes += 1
+            # 定期清理过期条目，并在超出行数上限时删除最早过期的条目
+            if self._writes % 256 == 0:
+                self._prune()
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_response_cache")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _prune(self) -> None:
+        self._conn.execute("DELETE FROM llm_response_cache WHERE expires_at <= ?", (time.time(),))
+        self._conn.execute(
+            "DELETE FROM llm_response_cache WHERE key IN ("
+            "SELECT key FROM llm_response_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+
+class LLMResponseCache:
+    """
+    LLM 意图/查询解析结果的缓存
+
+    键由用途、提供商、系统提示和归一化后的用户消息组成。请求中带有当前日期（传入 day，
+    如"明天截止"要被解析成绝对日期）时结果只在当天有效：键中额外包含日期，且过期时间不超过
+    当天（UTC）结束；其余结果可跨天复用。
+    内存层为 LRU + TTL；配置 LLM_CACHE_SQLITE_PATH 后增加一个SQLite持久层。
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        enabled: bool = True,
+        store: Optional[SQLiteLLMCacheStore] = None,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self._memory = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.store = store
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def _make_key(namespace: str, provider: str, system_prompt: str, message: str, day: Optional[date]) -> str:
+        raw = json.dumps(
+            [namespace, provider, system_prompt, normalize_message(message), day.isoformat() if day else None],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(
+        self, namespace: str, provider: str, system_prompt: str, message: str, day: Optional[date] = None
+    ) -> Any:
+        """
+        查找缓存的LLM响应，未命中时返回 MISSING
+        """
+        if not self.enabled:
+            return MISSING
+        key = self._make_key(namespace, provider, system_prompt, message, day)
+        value = self._memory.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+
+        if self.store is not None:
+            try:
+                row = await run_in_threadpool(self.store.get, key)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"LLM cache store read failed: {e}")
+                row = None
+            if row is not None:
+                value, expires_at = row
+                # 提升到内存层
+                self._memory.set(key, value, ttl=min(self.ttl, expires_at - time.time()))
+                self.hits += 1
+                self.persistent_hits += 1
+                return value
+
+        self.misses += 1
+        return MISSING
+
+    async def set(
+        self, namespace: str, provider: str, system_prompt: str, message: str, response: str, day: Optional[date] = None
+    ) -> None:
+        """
+        缓存一次成功的LLM响应
+        """
+        if not self.enabled:
+            return
+        ttl = self.ttl
+        if day is not None:
+            ttl = min(ttl, _seconds_until_end_of(day))
+            if ttl <= 0:
+                # 请求期间已经跨过了UTC零点，结果不再有效
+                return
+        key = self._make_key(namespace, provider, system_prompt, message, day)
+        self._memory.set(key, response, ttl=ttl)
+        if self.store is not None:
+            try:
+                await run_in_threadpool(self.store.set, key, response, ttl)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"LLM cache store write failed: {e}")
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        memory_stats = self._memory.stats()
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": memory_stats["entries"],
+            "evictions": memory_stats["evictions"],
+            "expirations": memory_stats["expirations"],
+            "persistent": self.store is not None,
+            "errors": self.errors,
+        }
+
+def create_llm_response_cache() -> LLMResponseCache:
+    """
+    根据配置创建缓存；持久层打开失败时只使用内存层
+    """
+    store = None
+    if settings.LLM_CACHE_ENABLED and settings.LLM_CACHE_SQLITE_PATH:
+        try:
+            store = SQLiteLLMCacheStore(settings.LLM_CACHE_SQLITE_PATH, max_rows=settings.LLM_CACHE_SQLITE_MAX_ROWS)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache store unavailable, using memory only: {e}")
+    return LLMResponseCache(
+        max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+        ttl=settings.LLM_CACHE_TTL,
+        enabled=settings.LLM_CACHE_ENABLED,
+        store=store,
+    )
+
+llm_response_cache = create_llm_response_cache()
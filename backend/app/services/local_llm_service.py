@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.intent_classifier import intent_classifier
+from app.services.provider_limiter import RETRYABLE_STATUS_CODES, TransientProviderError
+
+logger = logging.getLogger(__name__)
+
+# 离线的本地模型提供商：不访问网络，回复由消息内容决定，用于压测和CI。
+# 延迟分布、流式分块间隔和错误注入率都可以通过 LOCAL_LLM_* 配置。
+
+_REPLIES = [
+    "Break the goal into one small step you can finish today.",
+    "Progress beats perfection: pick the next task and start for ten minutes.",
+    "Write down why this goal matters to you, then schedule the first step.",
+    "Review what you finished this week and choose one thing to improve.",
+    "Set a clear deadline and tell someone about it to stay accountable.",
+]
+
+_ADD_PATTERN = re.compile(r"^\s*(?:add|create|new)\s+(?:a\s+)?(?:task\s*)?[:：]?\s*(.+)$|^\s*(?:添加|新建|新增)(?:任务)?[:：]?\s*(.+)$", re.IGNORECASE)
+_QUERY_PATTERN = re.compile(r"(?:show|list|what|which|查看|查询|显示|列出).*(?:task|goal|任务|目标)|(?:task|goal|任务|目标).*(?:有哪些|是什么)", re.IGNORECASE)
+_DELETE_PATTERN = re.compile(r"(?:delete|remove|删除|删掉)\D*(\d+)", re.IGNORECASE)
+_COMPLETE_PATTERN = re.compile(r"(?:complete|finish|mark|完成)\D*(\d+)", re.IGNORECASE)
+
+# 延迟和错误注入使用固定种子的随机数，相同配置下每次运行的序列相同
+_rng = random.Random(settings.LOCAL_LLM_SEED)
+
+def _fingerprint(messages: List[Dict[str, str]]) -> int:
+    raw = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return int(hashlib.sha256(raw.encode("utf-8")).hexdigest(), 16)
+
+def _last_user_message(messages: List[Dict[str, str]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message.get("content", "")
+    return ""
+
+def sample_latency(rng: random.Random = _rng) -> float:
+    """
+    按 LOCAL_LLM_LATENCY_DISTRIBUTION 抽取一次调用的延迟（秒）
+
+    LOCAL_LLM_LATENCY_MS 为中位数，LOCAL_LLM_LATENCY_SPREAD 为离散程度：
+    uniform 为上下浮动的比例，normal 为标准差与中位数之比，lognormal 为对数标准差（长尾）。
+    """
+    median = settings.LOCAL_LLM_LATENCY_MS / 1000
+    spread = settings.LOCAL_LLM_LATENCY_SPREAD
+    distribution = settings.LOCAL_LLM_LATENCY_DISTRIBUTION
+    if median <= 0 or distribution == "fixed":
+        return max(median, 0.0)
+    if distribution == "uniform":
+        return rng.uniform(median * max(1 - spread, 0), median * (1 + spread))
+    if distribution == "normal":
+        return max(rng.gauss(median, median * spread), 0.0)
+    if distribution == "lognormal":
+        return median * rng.lognormvariate(0, spread)
+    raise ValueError(f"Unsupported local latency distribution: {distribution}")
+
+def sample_error(rng: random.Random = _rng) -> Optional[Exception]:
+    """
+    按 LOCAL_LLM_ERROR_RATE 抽取本次调用要注入的错误，状态码由 LOCAL_LLM_ERROR_STATUS 指定
+    """
+    if settings.LOCAL_LLM_ERROR_RATE <= 0 or rng.random() >= settings.LOCAL_LLM_ERROR_RATE:
+        return None
+    status_code = settings.LOCAL_LLM_ERROR_STATUS
+    error_msg = f"Local LLM injected error: {status_code}"
+    if status_code in RETRYABLE_STATUS_CODES:
+        return TransientProviderError(error_msg, status_code=status_code, retry_after=1.0 if status_code == 429 else None)
+    return Exception(error_msg)
+
+def _query_params(text: str) -> Dict[str, Any]:
+    """
+    按关键词确定查询条件，未提到的字段使用默认值
+    """
+    lowered = text.lower()
+    params = {"status": "all", "type": "all", "date_filter": "all", "sort_by": "due_date", "sort_order": "asc"}
+    if "today" in lowered or "今天" in text:
+        params["date_filter"] = "today"
+    elif "week" in lowered or "本周" in text or "这周" in text:
+        params["date_filter"] = "this_week"
+    elif "month" in lowered or "本月" in text or "这个月" in text:
+        params["date_filter"] = "this_month"
+    if "done" in lowered or "completed" in lowered or "已完成" in text:
+        params["status"] = "done"
+    elif "todo" in lowered or "pending" in lowered or "未完成" in text:
+        params["status"] = "todo"
+    if "goal" in lowered or "目标" in text:
+        params["type"] = "goal"
+    return params
+
+def _intent_payload(text: str) -> Dict[str, Any]:
+    """
+    用本地意图分类器生成结构化意图JSON；分类器不确定时用简单规则识别添加、查询、删除和完成操作
+    """
+    local = intent_classifier.classify(text)
+    if local is not None:
+        if local.action == "query_task":
+            return {"action": "query_task", "task": {}, "query": local.task, "confirmation_prompt": local.confirmation_prompt or ""}
+        return {"action": local.action, "task": local.task, "query": None, "confirmation_prompt": local.confirmation_prompt or ""}
+
+    match = _ADD_PATTERN.match(text)
+    if match:
+        task_text = (match.group(1) or match.group(2)).strip()
+        return {"action": "add_task", "task": {"text": task_text}, "query": None, "confirmation_prompt": f"是否要添加任务「{task_text}」？"}
+    if _QUERY_PATTERN.search(text):
+        return {"action": "query_task", "task": {}, "query": _query_params(text), "confirmation_prompt": "以下是查询到的任务："}
+    match = _DELETE_PATTERN.search(text)
+    if match:
+        task_id = int(match.group(1))
+        return {"action": "delete_task", "task": {"id": task_id}, "query": None, "confirmation_prompt": f"是否要删除任务 {task_id}？"}
+    match = _COMPLETE_PATTERN.search(text)
+    if match:
+        task_id = int(match.group(1))
+        return {
+            "action": "update_task",
+            "task": {"id": task_id, "status": "done"},
+            "query": None,
+            "confirmation_prompt": f"是否要将任务 {task_id} 标记为已完成？",
+        }
+    return {"action": "none", "task": {}, "query": None, "confirmation_prompt": ""}
+
+def generate_local_reply(messages: List[Dict[str, str]], json_mode: bool = False) -> str:
+    """
+    根据消息内容确定性地生成回复
+
+    json_mode 下返回意图JSON（查询解析请求只返回查询条件），否则返回一段固定模板的文本回复。
+    """
+    text = _last_user_message(messages)
+    if json_mode:
+        if text.startswith("查询:"):
+            # parse_query_intent 的请求：已知是查询，只返回查询条件
+            query_text = text[len("查询:"):].strip()
+            payload = _intent_payload(query_text)
+            return json.dumps(payload["query"] or _query_params(query_text), ensure_ascii=False)
+        return json.dumps(_intent_payload(text), ensure_ascii=False)
+
+    reply = _REPLIES[_fingerprint(messages) % len(_REPLIES)]
+    snippet = " ".join(text.split())[:60]
+    return f"{reply} (local reply to: {snippet})" if snippet else reply
+
+async def chat_with_local(messages, json_mode=False):
+    """
+    本地模型聊天：等待抽样得到的延迟后返回确定性的回复（或注入的错误）
+    """
+    # 先抽取延迟和错误再等待，使随机序列与并发调度无关
+    latency, error = sample_latency(), sample_error()
+    await asyncio.sleep(latency)
+    if error is not None:
+        logger.warning(str(error))
+        raise error
+    return generate_local_reply(messages, json_mode=json_mode)
+
+async def stream_chat_with_local(messages):
+    """
+    本地模型流式聊天：首个片段在抽样延迟后返回，之后按 LOCAL_LLM_STREAM_CHUNK_MS 间隔逐词返回
+    """
+    latency, error = sample_latency(), sample_error()
+    await asyncio.sleep(latency)
+    if error is not None:
+        logger.warning(str(error))
+        raise error
+    words = generate_local_reply(messages).split(" ")
+    for index, word in enumerate(words):
+        if index:
+            await asyncio.sleep(settings.LOCAL_LLM_STREAM_CHUNK_MS / 1000)
+        yield word if index == len(words) - 1 else word + " "
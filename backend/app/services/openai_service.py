@@ -1,11 +1,56 @@
 import openai
 from app.core.config import settings
+from app.services.http_client import get_llm_timeout
+from app.services.provider_limiter import RETRYABLE_STATUS_CODES, TransientProviderError, parse_retry_after
 
-client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+_client = None
 
-def chat_with_openai(messages, model="gpt-3.5-turbo"):
-    response = client.chat.completions.create(
+def get_openai_client() -> openai.AsyncOpenAI:
+    """
+    获取进程内共享的OpenAI客户端
+
+    首次调用时才创建，未配置 OPENAI_API_KEY 时导入本模块不会失败。
+    AsyncOpenAI 内部维护自己的连接池；重试由 ai_service 的准入层统一处理。
+    """
+    global _client
+    if _client is None:
+        _client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY, timeout=get_llm_timeout(), max_retries=0)
+    return _client
+
+async def chat_with_openai(messages, model="gpt-3.5-turbo", json_mode=False):
+    options = {"response_format": {"type": "json_object"}} if json_mode else {}
+    try:
+        response = await get_openai_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            **options
+        )
+    except openai.APIStatusError as e:
+        if e.status_code in RETRYABLE_STATUS_CODES:
+            raise TransientProviderError(
+                f"OpenAI API error: {e.status_code} - {e.message}",
+                status_code=e.status_code,
+                retry_after=parse_retry_after(e.response.headers.get("retry-after")),
+            ) from e
+        raise
+    except openai.APITimeoutError:
+        raise
+    except openai.APIConnectionError as e:
+        raise TransientProviderError(f"Network error when calling OpenAI API: {e}") from e
+    return response.choices[0].message.content
+
+async def stream_chat_with_openai(messages, model="gpt-3.5-turbo"):
+    """
+    使用 stream=True 流式获取回复，按生成顺序逐段返回文本
+    """
+    stream = await get_openai_client().chat.completions.create(
         model=model,
-        messages=messages
+        messages=messages,
+        stream=True
     )
-    return response.choices[0].message.content 
\ No newline at end of file
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        content = chunk.choices[0].delta.content
+        if content:
+            yield content
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 这些状态码表示上游暂时不可用，可以退避后重试
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class TransientProviderError(Exception):
+    """
+    可重试的上游错误：限流（429）、服务端错误、超时或网络错误
+
+    retry_after 为上游通过 Retry-After 要求的等待秒数
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class ProviderBusyError(Exception):
+    """本地排队已满或在截止时间前没有获得调用许可"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析 Retry-After 头（秒数或HTTP日期），无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+class TokenBucket:
+    """
+    令牌桶：容量为每分钟配额，按 rate_per_minute / 60 每秒匀速补充；rate 为0时不限制
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.tokens = rate_per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        还需等待多少秒才能取出 amount 个令牌（超过容量的请求按容量计算）
+        """
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        if self.capacity > 0:
+            self.tokens -= min(amount, self.capacity)
+
+class ProviderLimiter:
+    """
+    单个提供商的准入控制
+
+    - 最多 max_concurrency 个请求同时调用上游
+    - 请求数和token数分别受每分钟令牌桶（RPM/TPM）限制
+    - 等待许可的请求最多 max_queue 个，且最多等待 queue_timeout 秒，超出时抛出 ProviderBusyError
+    - 可重试的上游错误按指数退避加随机抖动重试；上游返回 Retry-After 时，
+      该提供商的所有新请求都暂停到指定时间之后
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 16,
+        rpm: float = 0,
+        tpm: float = 0,
+        max_queue: int = 100,
+        queue_timeout: float = 10.0,
+        max_retries: int = 2,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 8.0,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _busy(self, message: str) -> ProviderBusyError:
+        retry_after = max(self.paused_until - time.monotonic(), 1.0)
+        return ProviderBusyError(f"AI provider {self.name} is busy: {message}", retry_after=retry_after)
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """
+        等待调用许可（并发名额和令牌桶），成功后必须调用 release()
+
+        可以立即获得许可的请求不进入等待队列
+        """
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        queued = False
+
+        def enter_queue() -> None:
+            nonlocal queued
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise self._busy("wait queue is full")
+            queued = True
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        try:
+            if self._semaphore.locked():
+                enter_queue()
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    raise self._busy("no free slot before the deadline")
+            else:
+                await self._semaphore.acquire()
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = max(
+                        self.paused_until - now,
+                        self._requests.wait_time(1, now),
+                        self._tokens.wait_time(tokens, now),
+                    )
+                    if wait <= 0:
+                        self._requests.take(1)
+                        self._tokens.take(tokens)
+                        break
+                    if now + wait > deadline:
+                        self.timeouts += 1
+                        raise self._busy("rate limit would be exceeded before the deadline")
+                    if not queued:
+                        enter_queue()
+                    await asyncio.sleep(wait)
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            if queued:
+                self.queued -= 1
+            waited = time.monotonic() - start
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.admitted += 1
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        第 attempt 次重试前的等待秒数：有 Retry-After 时以其为准并加少量抖动，否则为全抖动指数退避
+        """
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.retry_base_delay)
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+
+    async def run(self, call: Callable[[], Awaitable[Any]], tokens: int = 0) -> Any:
+        """
+        在准入控制下调用 call()，可重试的错误最多重试 max_retries 次
+        """
+        attempt = 0
+        while True:
+            await self.acquire(tokens)
+            try:
+                return await call()
+            except TransientProviderError as e:
+                if e.status_code == 429:
+                    self.rate_limited += 1
+                if e.retry_after is not None:
+                    self.pause(e.retry_after)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt, e.retry_after)
+                logger.warning(f"AI provider {self.name} transient error ({e}), retrying in {delay:.2f}s")
+            finally:
+                self.release()
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def stream(self, make_stream: Callable[[], AsyncIterator[str]], tokens: int = 0) -> AsyncIterator[str]:
+        """
+        在准入控制下流式调用，整个流期间占用一个并发名额（流式调用不重试）
+        """
+        await self.acquire(tokens)
+        try:
+            async for chunk in make_stream():
+                yield chunk
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "max_queue_depth": self.max_queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "total_wait_seconds": round(self.total_wait_seconds, 4),
+            "max_wait_seconds": round(self.max_wait_seconds, 4),
+            "avg_wait_seconds": round(self.total_wait_seconds / self.admitted, 4) if self.admitted else 0.0,
+            "paused_for_seconds": round(max(self.paused_until - time.monotonic(), 0.0), 2),
+        }
+
+_limiters: Dict[str, ProviderLimiter] = {}
+
+def get_provider_limiter(provider: str) -> ProviderLimiter:
+    """
+    获取提供商的准入控制器；并发数和RPM/TPM按 <PROVIDER>_MAX_CONCURRENCY / _RPM / _TPM 配置
+    """
+    if provider not in _limiters:
+        prefix = provider.upper()
+        _limiters[provider] = ProviderLimiter(
+            provider,
+            max_concurrency=getattr(settings, f"{prefix}_MAX_CONCURRENCY", settings.LLM_MAX_CONCURRENCY),
+            rpm=getattr(settings, f"{prefix}_RPM", 0),
+            tpm=getattr(settings, f"{prefix}_TPM", 0),
+            max_queue=settings.LLM_QUEUE_MAX,
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+            max_retries=settings.LLM_MAX_RETRIES,
+            retry_base_delay=settings.LLM_RETRY_BASE_DELAY,
+            retry_max_delay=settings.LLM_RETRY_MAX_DELAY,
+        )
+    return _limiters[provider]
+
+def get_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {provider: limiter.stats() for provider, limiter in _limiters.items()}
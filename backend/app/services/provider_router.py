@@ -0,0 +1,293 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.provider_limiter import ProviderBusyError
+
+logger = logging.getLogger(__name__)
+
+class ProviderUnavailableError(Exception):
+    """所有候选提供商的熔断器都处于打开状态"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    单个提供商的熔断器
+
+    closed: 正常调用；连续失败达到阈值后转为 open
+    open: 冷却期内直接跳过该提供商；冷却结束后转为 half_open
+    half_open: 只放行一个探测请求，成功则恢复 closed，失败则重新 open
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def is_open(self) -> bool:
+        """
+        不占用探测名额地检查熔断器是否仍在冷却期内
+        """
+        return self.state == "open" and time.monotonic() - self.opened_at < self.cooldown
+
+    def reopens_in(self) -> float:
+        """
+        距离冷却结束（可以再次探测）的秒数，未打开时为0
+        """
+        if self.state != "open":
+            return 0.0
+        return max(self.opened_at + self.cooldown - time.monotonic(), 0.0)
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                logger.warning(f"Circuit opened after {self.consecutive_failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        # 探测请求被取消（例如对冲请求先返回）时，既不算成功也不算失败
+        self._probe_in_flight = False
+
+class ProviderStats:
+    """最近 window 次调用的延迟和成功/失败记录"""
+
+    def __init__(self, window: int):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+        self.hedges_started = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def record(self, latency: Optional[float], ok: bool) -> None:
+        self.calls += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.failures += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(int(len(ordered) * q), len(ordered) - 1)
+        return ordered[index]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+class ProviderRouter:
+    """
+    按延迟和错误率路由LLM请求
+
+    - 跳过熔断器打开的提供商，主提供商不可用时直接使用备用提供商
+    - 主提供商超过自身p95延迟仍未返回时，向备用提供商发送对冲请求，先成功的结果生效，另一个被取消
+    - 主提供商失败时立即改用备用提供商
+    样本不足 hedge_min_samples 时以 hedge_max_delay 作为对冲等待时间。
+    """
+
+    def __init__(
+        self,
+        hedging_enabled: bool = True,
+        hedge_min_samples: int = 20,
+        hedge_max_delay: float = 10.0,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+        window: int = 200,
+    ):
+        self.hedging_enabled = hedging_enabled
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_delay = hedge_max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.window = window
+        self._stats: Dict[str, ProviderStats] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def stats(self, provider: str) -> ProviderStats:
+        if provider not in self._stats:
+            self._stats[provider] = ProviderStats(self.window)
+        return self._stats[provider]
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self._breakers:
+            self._breakers[provider] = CircuitBreaker(self.failure_threshold, self.cooldown)
+        return self._breakers[provider]
+
+    def hedge_delay(self, provider: str) -> float:
+        stats = self.stats(provider)
+        p95 = stats.percentile(0.95)
+        if p95 is None or len(stats.latencies) < self.hedge_min_samples:
+            return self.hedge_max_delay
+        return min(p95, self.hedge_max_delay)
+
+    def _unavailable(self, ordered: List[str]) -> ProviderUnavailableError:
+        # 最早结束冷却的提供商决定客户端的重试时间；半开探测进行中时按1秒
+        retry_after = min(self.breaker(p).reopens_in() for p in ordered) or 1.0
+        return ProviderUnavailableError(
+            f"All AI providers are unavailable: {', '.join(ordered)}",
+            retry_after=retry_after,
+        )
+
+    def select(self, primary: str, candidates: List[str]) -> List[str]:
+        """
+        返回本次可以尝试的提供商，主提供商在前；仍在冷却期内的提供商被跳过
+
+        这里只检查状态、不占用半开探测名额，真正发起调用前才调用 allow()
+        """
+        ordered = [primary] + [p for p in candidates if p != primary]
+        available = [p for p in ordered if not self.breaker(p).is_open()]
+        if not available:
+            raise self._unavailable(ordered)
+        return available
+
+    def pick(self, primary: str, candidates: List[str]) -> str:
+        """
+        选择一个熔断器未打开的提供商（用于流式调用，不参与统计）
+        """
+        return self.select(primary, candidates)[0]
+
+    async def _timed(self, provider: str, call: Callable[[str], Awaitable[Any]]) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await call(provider)
+        except (asyncio.CancelledError, ProviderBusyError):
+            # 被取消或本地排队已满都不代表提供商故障
+            self.breaker(provider).release_probe()
+            raise
+        except Exception:
+            self.stats(provider).record(None, ok=False)
+            self.breaker(provider).record_failure()
+            raise
+        self.stats(provider).record(time.perf_counter() - start, ok=True)
+        self.breaker(provider).record_success()
+        return result
+
+    async def call(self, primary: str, candidates: List[str], call: Callable[[str], Awaitable[Any]]) -> Any:
+        """
+        调用 call(provider)，返回第一个成功的结果；全部失败时抛出最后一个异常
+        """
+        order = self.select(primary, candidates)
+
+        def take() -> Optional[str]:
+            # 发起调用时才占用熔断器名额，没有用到的备用提供商不会占住半开探测
+            while order:
+                provider = order.pop(0)
+                if self.breaker(provider).allow():
+                    return provider
+            return None
+
+        first = take()
+        if first is None:
+            raise self._unavailable([primary] + [p for p in candidates if p != primary])
+        loop = asyncio.get_running_loop()
+        hedge_at = loop.time() + self.hedge_delay(first) if self.hedging_enabled and order else None
+        pending: Dict[asyncio.Task, str] = {}
+        last_error: Optional[BaseException] = None
+        hedged = False
+
+        def start(provider: str) -> None:
+            pending[asyncio.ensure_future(self._timed(provider, call))] = provider
+
+        start(first)
+        try:
+            while pending:
+                timeout = None
+                if hedge_at is not None and order:
+                    timeout = max(hedge_at - loop.time(), 0)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 主提供商超过p95仍未返回，发送对冲请求
+                    hedge_at = None
+                    provider = take()
+                    if provider is None:
+                        continue
+                    self.stats(first).hedges_started += 1
+                    logger.info(f"Hedging slow {first} request to {provider}")
+                    start(provider)
+                    hedged = True
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        if provider != first and hedged:
+                            self.stats(first).hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"AI provider {provider} failed: {last_error}")
+                if not pending:
+                    # 失败（包括本地排队已满的 ProviderBusyError）后立即改用下一个备用提供商
+                    provider = take()
+                    if provider is not None:
+                        self.stats(first).failovers += 1
+                        start(provider)
+                        hedge_at = None
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self, providers: List[str]) -> Dict[str, Any]:
+        result = {}
+        for provider in providers:
+            stats = self.stats(provider)
+            breaker = self.breaker(provider)
+            p50, p95 = stats.percentile(0.5), stats.percentile(0.95)
+            result[provider] = {
+                "state": breaker.state,
+                "consecutive_failures": breaker.consecutive_failures,
+                "times_opened": breaker.times_opened,
+                "calls": stats.calls,
+                "failures": stats.failures,
+                "error_rate": round(stats.error_rate, 4),
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "hedge_delay_ms": round(self.hedge_delay(provider) * 1000, 1),
+                "hedges_started": stats.hedges_started,
+                "hedge_wins": stats.hedge_wins,
+                "failovers": stats.failovers,
+            }
+        return result
+
+provider_router = ProviderRouter(
+    hedging_enabled=settings.LLM_HEDGING_ENABLED,
+    hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+    hedge_max_delay=settings.LLM_HEDGE_MAX_DELAY_MS / 1000,
+    failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+    cooldown=settings.LLM_BREAKER_COOLDOWN,
+    window=settings.LLM_LATENCY_WINDOW,
+)
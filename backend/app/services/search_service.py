@@ -0,0 +1,76 @@
+from typing import Any, Dict, List
+
+from sqlalchemy import DateTime, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.utils.text_search import fts5_match_query, tsquery
+
+SEARCH_TYPES = ("task", "message")
+
+# 每种结果对应的源表和返回的列
+_SOURCES = {
+    "task": ("tasks", "text", "status"),
+    "message": ("chat_messages", "content", "role"),
+}
+
+def _sqlite_query(kind: str) -> str:
+    table, column, extra = _SOURCES[kind]
+    # bm25 越小越相关；user_id 列只用于过滤，权重为0
+    return f"""
+        SELECT '{kind}' AS type, s.id, s.{column} AS text, s.{extra} AS extra, s.created_at,
+               -bm25({table}_fts, 0.0, 1.0) AS score
+        FROM {table}_fts JOIN {table} s ON s.id = {table}_fts.rowid
+        WHERE {table}_fts MATCH :match
+        ORDER BY bm25({table}_fts, 0.0, 1.0), s.id
+        LIMIT :limit
+    """
+
+def _postgresql_query(kind: str) -> str:
+    table, column, extra = _SOURCES[kind]
+    return f"""
+        SELECT '{kind}' AS type, s.id, s.{column} AS text, s.{extra} AS extra, s.created_at,
+               ts_rank(s.search_vector, q) AS score
+        FROM {table} s, to_tsquery('simple', :query) q
+        WHERE s.user_id = :user_id AND s.search_vector @@ q
+        ORDER BY score DESC, s.id
+        LIMIT :limit
+    """
+
+class SearchService:
+    @staticmethod
+    async def search(
+        db: AsyncSession,
+        user_id: int,
+        query: str,
+        types: List[str],
+        limit: int = 20,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        在用户的任务和聊天消息中全文检索，按相关度排序，返回第 offset 条起的最多 limit + 1 条结果
+
+        SQLite 使用 FTS5（bm25），PostgreSQL 使用 tsvector GIN 索引（ts_rank）。
+        多种类型时各自取前 offset + limit + 1 条后按分数合并。
+        """
+        dialect = db.bind.dialect.name
+        if dialect == "sqlite":
+            expression = fts5_match_query(query)
+            # 用户ID作为索引列参与匹配，只在该用户的文档中检索
+            params = {"match": f'user_id : "{user_id}" AND tokens : ({expression})'}
+            build = _sqlite_query
+        elif dialect == "postgresql":
+            expression = tsquery(query)
+            params = {"query": expression, "user_id": user_id}
+            build = _postgresql_query
+        else:
+            raise ValueError(f"Full-text search is not supported on {dialect}")
+        if not expression:
+            return []
+
+        params["limit"] = offset + limit + 1
+        results = []
+        for kind in types:
+            rows = await db.execute(text(build(kind)).columns(created_at=DateTime(timezone=True)), params)
+            results.extend(dict(row._mapping) for row in rows)
+        results.sort(key=lambda r: (-r["score"], r["type"], r["id"]))
+        return results[offset:offset + limit + 1]
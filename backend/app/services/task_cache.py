@@ -0,0 +1,230 @@
+import itertools
+import logging
+import pickle
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.task import Task
+from app.utils.cache import LRUCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+async def get_task_list_version(db: AsyncSession, user_id: int) -> Tuple[Any, ...]:
+    """
+    用户任务的版本信息：任何新增、修改或删除都会改变其中至少一项
+
+    每次读取都查询数据库（走 user_id 前缀索引），缓存键和ETag都包含它，
+    所以即使其他worker的写操作没有使本进程的缓存失效，也不会返回过期结果。
+    """
+    result = await db.execute(
+        select(
+            func.count(Task.id),
+            func.max(Task.id),
+            func.max(Task.created_at),
+            func.max(Task.updated_at),
+        ).filter(Task.user_id == user_id)
+    )
+    return tuple(result.one())
+
+class TaskCacheBackend(ABC):
+    """
+    任务列表缓存的存储后端接口
+
+    失效采用"代数"方案：每个用户有一个代数，缓存键中包含读取时的代数；
+    写操作提交后递增代数，旧条目不再可达，由LRU/TTL自然淘汰。
+    这样共享后端（如Redis）也只需一次INCR即可精确失效某个用户的全部列表。
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Any:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, size: int) -> None:
+        ...
+
+    @abstractmethod
+    async def get_generation(self, user_id: int) -> int:
+        ...
+
+    @abstractmethod
+    async def bump_generation(self, user_id: int) -> None:
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+class MemoryTaskCacheBackend(TaskCacheBackend):
+    """进程内 LRU + TTL 后端"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl, max_bytes=max_bytes)
+        # 用户代数表同样有上限；被淘汰用户的代数回落到 _floor，
+        # _floor 不小于任何已分配的代数，因此不会重新命中失效前的条目
+        self._generations: "OrderedDict[int, int]" = OrderedDict()
+        self._max_generations = max_entries * 4
+        self._counter = itertools.count(1)
+        self._floor = 0
+
+    async def get(self, key: str) -> Any:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any, size: int) -> None:
+        self._cache.set(key, value, size=size)
+
+    async def get_generation(self, user_id: int) -> int:
+        return self._generations.get(user_id, self._floor)
+
+    async def bump_generation(self, user_id: int) -> None:
+        self._generations[user_id] = next(self._counter)
+        self._generations.move_to_end(user_id)
+        while len(self._generations) > self._max_generations:
+            self._generations.popitem(last=False)
+            self._floor = next(self._counter)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        stats["tracked_users"] = len(self._generations)
+        return stats
+
+class RedisTaskCacheBackend(TaskCacheBackend):
+    """
+    Redis 后端，供多个worker共享缓存
+
+    需要安装 redis 包（pip install redis），内存上限由Redis的 maxmemory 策略控制。
+    代数键不设过期时间，Redis 应使用 volatile-* 淘汰策略，避免代数被淘汰后回到旧值。
+    """
+
+    def __init__(self, url: str, ttl: float, prefix: str = "taskcache"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("TASK_CACHE_BACKEND=redis requires the 'redis' package") from e
+        self._client = redis.from_url(url)
+        self._ttl = max(int(ttl), 1)
+        self._prefix = prefix
+
+    async def get(self, key: str) -> Any:
+        raw = await self._client.get(f"{self._prefix}:v:{key}")
+        return MISSING if raw is None else pickle.loads(raw)
+
+    async def set(self, key: str, value: Any, size: int) -> None:
+        await self._client.set(f"{self._prefix}:v:{key}", pickle.dumps(value), ex=self._ttl)
+
+    async def get_generation(self, user_id: int) -> int:
+        raw = await self._client.get(f"{self._prefix}:gen:{user_id}")
+        return int(raw) if raw is not None else 0
+
+    async def bump_generation(self, user_id: int) -> None:
+        await self._client.incr(f"{self._prefix}:gen:{user_id}")
+
+class TaskListCache:
+    """
+    按用户和过滤条件缓存任务列表的读穿透缓存
+
+    用法：
+        version = await get_task_list_version(db, user_id)
+        key = await task_list_cache.make_key(user_id, "user_tasks", version, status, limit, cursor)
+        value = await task_list_cache.get(key)
+        if value is MISSING:
+            value = ...  # 查询数据库
+            await task_list_cache.set(key, value, size)
+
+    键中的版本信息来自数据库，保证多个worker使用各自的内存后端时也不会读到其他worker写入前的数据；
+    代数使本进程（或共享的Redis）中的旧条目尽快不可达。
+    make_key 必须在查询数据库之前调用，invalidate_user 必须在写事务提交之后调用，
+    这样与写操作并发的读取只会把旧数据写到已失效的代数下。
+    """
+
+    def __init__(self, backend: TaskCacheBackend, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    async def make_key(self, user_id: int, *parts: Hashable) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            generation = await self.backend.get_generation(user_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Task cache unavailable: {e}")
+            return None
+        return f"{user_id}:{generation}:" + "|".join(str(p) for p in parts)
+
+    async def get(self, key: Optional[str]) -> Any:
+        if key is None:
+            return MISSING
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Task cache read failed: {e}")
+            return MISSING
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: Optional[str], value: Any, size: int = 1) -> None:
+        if key is None:
+            return
+        try:
+            await self.backend.set(key, value, size)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Task cache write failed: {e}")
+
+    async def invalidate_user(self, *user_ids: int) -> None:
+        """
+        使指定用户的所有缓存列表失效，应在写事务提交后调用
+        """
+        if not self.enabled:
+            return
+        for user_id in set(user_ids):
+            try:
+                await self.backend.bump_generation(user_id)
+                self.invalidations += 1
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Task cache invalidation failed for user {user_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        stats = {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+        backend_stats = self.backend.stats()
+        for name in ("entries", "bytes", "evictions", "expirations", "tracked_users"):
+            if name in backend_stats:
+                stats[name] = backend_stats[name]
+        return stats
+
+def create_task_cache_backend() -> TaskCacheBackend:
+    """
+    根据配置创建缓存后端
+    """
+    if settings.TASK_CACHE_BACKEND == "redis":
+        return RedisTaskCacheBackend(settings.TASK_CACHE_REDIS_URL, ttl=settings.TASK_CACHE_TTL)
+    return MemoryTaskCacheBackend(
+        max_entries=settings.TASK_CACHE_MAX_ENTRIES,
+        max_bytes=settings.TASK_CACHE_MAX_BYTES,
+        ttl=settings.TASK_CACHE_TTL,
+    )
+
+task_list_cache = TaskListCache(create_task_cache_backend(), enabled=settings.TASK_CACHE_ENABLED)
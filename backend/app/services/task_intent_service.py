@@ -1,14 +1,20 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import json
 import logging
 from typing import Dict, List, Optional, Any, Union
 
+from app.core.config import settings
 from app.services.ai_service import chat_with_ai
+from app.services.intent_classifier import intent_classifier
+from app.services.llm_cache import llm_response_cache, utc_today
+from app.services.task_cache import task_list_cache, get_task_list_version
 from app.models.task import Task
-from app.db.session import get_db
-from sqlalchemy.orm import Session
-from sqlalchemy.sql.expression import and_, or_
-from sqlalchemy import desc
+from app.schemas.task import TaskResponse, TaskQueryParams
+from app.utils.cache import MISSING
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.expression import and_
+from sqlalchemy import desc, select
 
 logger = logging.getLogger(__name__)
 
@@ -23,18 +29,29 @@ class TaskIntentType:
 class TaskIntent:
     """任务意图数据类"""
     
-    def __init__(self, intent_type: str, task_data: Dict[str, Any], confirmation_prompt: Optional[str] = None):
+    def __init__(
+        self,
+        intent_type: str,
+        task_data: Dict[str, Any],
+        confirmation_prompt: Optional[str] = None,
+        query_params: Optional[Dict[str, Any]] = None
+    ):
         self.intent_type = intent_type
         self.task_data = task_data
         self.confirmation_prompt = confirmation_prompt or "确认执行此操作？"
+        # 查询意图的查询条件，与意图在同一次解析中得到
+        self.query_params = query_params
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
-        return {
+        data = {
             "action": self.intent_type,
             "task": self.task_data,
             "confirmation_prompt": self.confirmation_prompt
         }
+        if self.query_params is not None:
+            data["query"] = self.query_params
+        return data
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'TaskIntent':
@@ -42,12 +59,15 @@ class TaskIntent:
         return cls(
             intent_type=data.get("action", TaskIntentType.NONE),
             task_data=data.get("task", {}),
-            confirmation_prompt=data.get("confirmation_prompt")
+            confirmation_prompt=data.get("confirmation_prompt"),
+            query_params=data.get("query")
         )
     
     @property
     def is_empty(self) -> bool:
         """是否为空意图"""
+        if self.intent_type == TaskIntentType.QUERY:
+            return False
         return self.intent_type == TaskIntentType.NONE or not self.task_data
     
     @property
@@ -70,9 +90,177 @@ class TaskIntent:
         """是否为删除意图"""
         return self.intent_type == TaskIntentType.DELETE
 
-def parse_user_request(user_message: str, model_provider: Optional[str] = None) -> TaskIntent:
+WEEKDAYS = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
+
+def current_date_context(today: date) -> str:
+    """
+    当前日期说明，附加在系统提示后，让模型把"明天"、"下周五"等相对日期解析为绝对日期
+    """
+    return f"今天是 {today.isoformat()}（{WEEKDAYS[today.weekday()]}）。"
+
+async def cached_chat(
+    namespace: str,
+    system_prompt: str,
+    user_message: str,
+    user_content: str,
+    model_provider: Optional[str],
+    json_mode: bool = False,
+    date_context: bool = False
+) -> str:
+    """
+    带缓存的单轮LLM调用
+
+    缓存键只包含归一化后的 user_message，user_content 是实际发送给模型的内容。
+    date_context=True 时在系统提示后附加当前的UTC日期，结果只在当天缓存，两者使用同一个日期。
+    未指定 model_provider 时由路由器在提供商之间对冲和故障切换，缓存不区分实际返回结果的提供商
+    （键中为 auto）；明确指定的提供商单独缓存。
+    """
+    provider = model_provider or "auto"
+    day = utc_today() if date_context else None
+    response = await llm_response_cache.get(namespace, provider, system_prompt, user_message, day=day)
+    if response is not MISSING:
+        return response
+    response = await chat_with_ai(
+        messages=[
+            {"role": "system", "content": f"{system_prompt}\n\n{current_date_context(day)}" if day else system_prompt},
+            {"role": "user", "content": user_content}
+        ],
+        model_provider=model_provider,
+        json_mode=json_mode
+    )
+    await llm_response_cache.set(
+        namespace, provider, system_prompt, user_message, response, day=day
+    )
+    return response
+
+STRUCTURED_INTENT_PROMPT = """你是一个任务管理助手。分析用户消息，只返回一个JSON对象，格式如下：
+{"action": "add_task|update_task|delete_task|query_task|none", "task": { 任务属性 }, "query": { 查询条件 } 或 null, "confirmation_prompt": "..."}
+
+对于add_task: task包含text(必需)、due_date(ISO格式，可选)、type(todo/goal，可选)
+对于update_task: task包含id(必需)，以及text、due_date、status、type中的任意属性
+对于delete_task: task包含id(必需)
+对于query_task: task为{}，query包含status(todo/done/all)、type(todo/goal/all)、date_filter(today/this_week/this_month/all)、sort_by(due_date/created_at)、sort_order(asc/desc)
+不是任务操作时: action为"none"，task为{}
+
+非query_task时query为null。confirmation_prompt应清晰描述操作；查询时描述查询结果，如"以下是今天到期的任务："。"""
+
+DEFAULT_QUERY_PARAMS = {
+    "status": "all",
+    "type": "all",
+    "date_filter": "all",
+    "sort_by": "due_date",
+    "sort_order": "asc"
+}
+
+# 模型常见的非规范取值 -> 规范取值
+_ACTION_ALIASES = {
+    "add": TaskIntentType.CREATE, "create": TaskIntentType.CREATE, "create_task": TaskIntentType.CREATE,
+    "update": TaskIntentType.UPDATE, "edit": TaskIntentType.UPDATE, "complete_task": TaskIntentType.UPDATE,
+    "delete": TaskIntentType.DELETE, "remove": TaskIntentType.DELETE, "remove_task": TaskIntentType.DELETE,
+    "query": TaskIntentType.QUERY, "list": TaskIntentType.QUERY, "list_tasks": TaskIntentType.QUERY,
+    "search": TaskIntentType.QUERY, "show": TaskIntentType.QUERY,
+    "": TaskIntentType.NONE, "null": TaskIntentType.NONE, "chat": TaskIntentType.NONE,
+}
+
+_QUERY_VALUE_ALIASES = {
+    "status": {"completed": "done", "finished": "done", "pending": "todo", "unfinished": "todo",
+               "incomplete": "todo", "open": "todo", "any": "all"},
+    "type": {"task": "todo", "tasks": "todo", "goals": "goal", "any": "all"},
+    "date_filter": {"week": "this_week", "month": "this_month", "none": "all", "any": "all"},
+    "sort_by": {"due": "due_date", "deadline": "due_date", "created": "created_at"},
+    "sort_order": {"ascending": "asc", "descending": "desc"},
+}
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """
+    从模型回复中取出JSON对象，兼容 ```json 代码块和前后多余的文字
+    """
+    if not text:
+        return None
+    candidates = [text.strip()]
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        candidates.append(text[start:end + 1])
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+def repair_query_params(raw: Any) -> Dict[str, Any]:
+    """
+    校验并修复查询条件：统一大小写、映射常见别名，非法取值回退到默认值
+    """
+    params = dict(DEFAULT_QUERY_PARAMS)
+    if not isinstance(raw, dict):
+        return params
+    for field in params:
+        value = raw.get(field)
+        if not isinstance(value, str):
+            continue
+        value = value.strip().lower().replace(" ", "_")
+        value = _QUERY_VALUE_ALIASES[field].get(value, value)
+        params[field] = value
+    try:
+        return TaskQueryParams(**params).model_dump()
+    except ValidationError as e:
+        for error in e.errors():
+            field = error["loc"][0]
+            params[field] = DEFAULT_QUERY_PARAMS[field]
+        return params
+
+def repair_intent_payload(data: Dict[str, Any]) -> TaskIntent:
+    """
+    将结构化输出校验、修复为 TaskIntent；无法修复的操作降级为空意图
+    """
+    action = data.get("action")
+    action = str(action).strip().lower() if action is not None else ""
+    action = _ACTION_ALIASES.get(action, action)
+    if action not in (TaskIntentType.CREATE, TaskIntentType.UPDATE, TaskIntentType.DELETE, TaskIntentType.QUERY):
+        return TaskIntent(TaskIntentType.NONE, {})
+
+    task = data.get("task")
+    task = dict(task) if isinstance(task, dict) else {}
+    prompt = data.get("confirmation_prompt")
+    prompt = prompt if isinstance(prompt, str) and prompt.strip() else None
+
+    if action == TaskIntentType.QUERY:
+        # 兼容把查询条件放在 task 中的旧格式
+        raw_query = data.get("query") if isinstance(data.get("query"), dict) else task
+        return TaskIntent(action, {}, prompt, query_params=repair_query_params(raw_query))
+
+    if action == TaskIntentType.CREATE:
+        text = task.get("text") or task.get("title") or task.get("name")
+        if not isinstance(text, str) or not text.strip():
+            return TaskIntent(TaskIntentType.NONE, {})
+        task["text"] = text.strip()
+        task.pop("title", None)
+        task.pop("name", None)
+    else:
+        # 修改和删除必须能定位到具体任务
+        try:
+            task["id"] = int(task.get("id"))
+        except (TypeError, ValueError):
+            return TaskIntent(TaskIntentType.NONE, {})
+
+    due_date = task.get("due_date")
+    if due_date is not None:
+        try:
+            datetime.fromisoformat(str(due_date).replace("Z", "+00:00"))
+        except ValueError:
+            logger.warning(f"Dropping invalid due_date from intent: {due_date}")
+            task.pop("due_date")
+    return TaskIntent(action, task, prompt)
+
+async def parse_user_request(user_message: str, model_provider: Optional[str] = None) -> TaskIntent:
     """
     解析用户请求，提取任务意图
+
+    一次结构化输出调用同时得到操作类型、任务内容和查询条件，
+    查询意图的查询条件保存在 TaskIntent.query_params 中，无需再调用 parse_query_intent。
     
     Args:
         user_message: 用户消息
@@ -81,48 +269,34 @@ def parse_user_request(user_message: str, model_provider: Optional[str] = None)
     Returns:
         TaskIntent对象
     """
-    system_prompt = """你是一个任务管理助手。
-如果用户想要添加、更新或删除任务，请以JSON对象形式回应，格式如下：
-{"action": "add_task|update_task|delete_task|query_task", "task": { 任务属性 }, "confirmation_prompt": "..."}
+    # 寒暄和简单的添加/查询命令由本地分类器直接回答，不确定的才调用LLM
+    if settings.LOCAL_INTENT_CLASSIFIER_ENABLED:
+        local = intent_classifier.classify_and_count(user_message)
+        if local is not None:
+            if local.action == "none":
+                return TaskIntent(TaskIntentType.NONE, {})
+            if local.action == TaskIntentType.QUERY:
+                return TaskIntent(local.action, {}, local.confirmation_prompt, query_params=local.task)
+            return TaskIntent.from_dict(local.to_dict())
 
-对于add_task: 包含text(必需)、due_date(ISO格式，可选)、type(todo/goal，可选)
-对于update_task: 包含id(必需)，以及text、due_date、status、type中的任意属性
-对于delete_task: 包含id(必需)
-对于query_task: 包含过滤条件，如status(todo/done/all)、type(todo/goal/all)、date_filter(today/this_week/this_month/all)
-
-confirmation_prompt应清晰描述操作。
-如果不是任务操作请求，请直接回复普通文本。"""
-    
     try:
-        # 调用AI服务解析用户意图
-        response = chat_with_ai(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            model_provider=model_provider
+        # 调用AI服务，以JSON模式解析用户意图
+        response = await cached_chat(
+            "structured_intent", STRUCTURED_INTENT_PROMPT, user_message, user_message, model_provider,
+            json_mode=True, date_context=True
         )
-        
-        # 尝试解析为JSON
-        try:
-            data = json.loads(response)
-            if isinstance(data, dict) and "action" in data:
-                logger.info(f"Successfully parsed task intent: {data['action']}")
-                return TaskIntent.from_dict(data)
-        except json.JSONDecodeError:
-            # 不是JSON，表示不是任务操作
+        data = extract_json_object(response)
+        if data is None:
             logger.debug("Response is not a valid JSON, not a task operation")
-            pass
-        except Exception as e:
-            logger.error(f"Error parsing task intent: {e}")
-            
-        # 未能解析出任务意图，返回空意图
-        return TaskIntent(TaskIntentType.NONE, {})
+            return TaskIntent(TaskIntentType.NONE, {})
+        intent = repair_intent_payload(data)
+        logger.info(f"Parsed task intent: {intent.intent_type}")
+        return intent
     except Exception as e:
         logger.error(f"Error processing user request: {e}")
         return TaskIntent(TaskIntentType.NONE, {})
 
-def parse_query_intent(query_text: str, model_provider: Optional[str] = None) -> Dict[str, Any]:
+async def parse_query_intent(query_text: str, model_provider: Optional[str] = None) -> Dict[str, Any]:
     """
     解析查询意图，提取查询参数
     
@@ -141,47 +315,32 @@ def parse_query_intent(query_text: str, model_provider: Optional[str] = None) ->
 - sort_by: due_date/created_at
 - sort_order: asc/desc"""
     
+    if settings.LOCAL_INTENT_CLASSIFIER_ENABLED:
+        local = intent_classifier.classify(query_text)
+        if local is not None and local.action == TaskIntentType.QUERY:
+            return local.task
+
     try:
         # 调用AI服务解析查询参数
-        response = chat_with_ai(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"查询: {query_text}"}
-            ],
-            model_provider=model_provider
-        )
+        response = await cached_chat("query", system_prompt, query_text, f"查询: {query_text}", model_provider, json_mode=True)
         
-        # 尝试解析为JSON
-        try:
-            data = json.loads(response)
-            if isinstance(data, dict):
-                logger.info("Successfully parsed query parameters")
-                return data
-        except json.JSONDecodeError:
-            logger.warning(f"Failed to parse query parameters: {response}")
-            
-        # 默认查询参数
-        return {
-            "status": "all",
-            "type": "all",
-            "date_filter": "all",
-            "sort_by": "due_date",
-            "sort_order": "asc"
-        }
+        data = extract_json_object(response)
+        if data is not None:
+            logger.info("Successfully parsed query parameters")
+            return repair_query_params(data.get("query") if isinstance(data.get("query"), dict) else data)
+        logger.warning(f"Failed to parse query parameters: {response}")
+        return dict(DEFAULT_QUERY_PARAMS)
     except Exception as e:
         logger.error(f"Error parsing query intent: {e}")
-        return {
-            "status": "all",
-            "type": "all",
-            "date_filter": "all",
-            "sort_by": "due_date",
-            "sort_order": "asc"
-        }
+        return dict(DEFAULT_QUERY_PARAMS)
 
-def get_tasks_by_query(user_id: int, query_params: Dict[str, Any], db: Session) -> List[Task]:
+async def get_tasks_by_query(user_id: int, query_params: Dict[str, Any], db: AsyncSession) -> List[TaskResponse]:
     """
     根据查询参数获取任务
     
+    结果按用户和查询参数缓存；相对日期过滤（today/this_week/this_month）
+    的缓存键包含当天日期，避免跨天返回过期结果。
+    
     Args:
         user_id: 用户ID
         query_params: 查询参数
@@ -191,7 +350,23 @@ def get_tasks_by_query(user_id: int, query_params: Dict[str, Any], db: Session)
         任务列表
     """
     try:
-        query = db.query(Task).filter(Task.user_id == user_id)
+        date_filter = query_params.get("date_filter")
+        cache_key = await task_list_cache.make_key(
+            user_id,
+            "query",
+            await get_task_list_version(db, user_id),
+            query_params.get("status"),
+            query_params.get("type"),
+            date_filter,
+            datetime.now().date() if date_filter and date_filter != "all" else None,
+            query_params.get("sort_by", "due_date"),
+            query_params.get("sort_order", "asc"),
+        )
+        cached = await task_list_cache.get(cache_key)
+        if cached is not MISSING:
+            return cached
+
+        query = select(Task).filter(Task.user_id == user_id)
         
         # 状态过滤
         status = query_params.get("status")
@@ -204,7 +379,6 @@ def get_tasks_by_query(user_id: int, query_params: Dict[str, Any], db: Session)
             query = query.filter(Task.type == task_type)
         
         # 日期过滤
-        date_filter = query_params.get("date_filter")
         if date_filter and date_filter != "all":
             today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
             
@@ -247,7 +421,10 @@ def get_tasks_by_query(user_id: int, query_params: Dict[str, Any], db: Session)
             else:
                 query = query.order_by(Task.created_at)
         
-        return query.all()
+        result = await db.execute(query)
+        tasks = [TaskResponse.from_orm(task) for task in result.scalars().all()]
+        await task_list_cache.set(cache_key, tasks, size=sum(256 + len(task.text) for task in tasks) or 1)
+        return tasks
     except Exception as e:
         logger.error(f"Error fetching tasks by query: {e}")
         # 发生错误时，返回空列表
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.task import Task
+from app.models.task_tombstone import TaskTombstone
+from app.utils.pagination import encode_cursor, decode_cursor, parse_cursor_datetime
+
+logger = logging.getLogger(__name__)
+
+# 同步窗口的回看时间：覆盖在令牌生成前写入 updated_at、但之后才提交的事务
+SYNC_SAFETY_WINDOW = timedelta(seconds=5)
+
+def encode_sync_token(since: datetime) -> str:
+    """
+    生成不透明的同步令牌
+    """
+    return encode_cursor(since)
+
+def decode_sync_token(token: str) -> datetime:
+    """
+    解析同步令牌，格式不正确时抛出 ValueError
+    """
+    (value,) = decode_cursor(token, 1)
+    return parse_cursor_datetime(value)
+
+def add_task_tombstones(db: AsyncSession, deleted: Iterable[Tuple[int, int]]) -> None:
+    """
+    为被删除的任务写入墓碑记录（与删除操作在同一事务中提交）
+
+    Args:
+        db: 数据库会话
+        deleted: (task_id, user_id) 列表
+    """
+    now = datetime.utcnow()
+    db.add_all([
+        TaskTombstone(task_id=task_id, user_id=user_id, deleted_at=now)
+        for task_id, user_id in deleted
+    ])
+
+async def prune_task_tombstones(db: AsyncSession, user_id: int) -> None:
+    """
+    清理超过保留期的墓碑记录
+    """
+    horizon = datetime.utcnow() - timedelta(days=settings.TASK_TOMBSTONE_RETENTION_DAYS)
+    await db.execute(
+        delete(TaskTombstone).where(TaskTombstone.user_id == user_id, TaskTombstone.deleted_at < horizon)
+    )
+
+async def get_max_task_id(db: AsyncSession, user_id: int) -> Tuple[int, int]:
+    """
+    用户当前最大的任务ID和任务总数，作为分批删除的边界和进度总量
+    """
+    result = await db.execute(select(func.max(Task.id), func.count(Task.id)).filter(Task.user_id == user_id))
+    max_id, count = result.one()
+    return max_id or 0, count
+
+async def delete_user_tasks_batch(db: AsyncSession, user_id: int, max_id: int, batch_size: int) -> int:
+    """
+    删除用户 id 不大于 max_id 的一批任务（写入墓碑）并提交，返回删除的任务数；返回0表示已删完
+    """
+    result = await db.execute(
+        select(Task.id).filter(Task.user_id == user_id, Task.id <= max_id).limit(batch_size)
+    )
+    ids = result.scalars().all()
+    if not ids:
+        await prune_task_tombstones(db, user_id)
+        await db.commit()
+        return 0
+    add_task_tombstones(db, [(task_id, user_id) for task_id in ids])
+    await db.execute(delete(Task).where(Task.id.in_(ids)))
+    await db.commit()
+    return len(ids)
+
+async def get_task_changes(
+    db: AsyncSession,
+    user_id: int,
+    since: Optional[datetime] = None
+) -> Tuple[List[Task], List[int], datetime, bool]:
+    """
+    获取某时间点之后创建/更新的任务以及被删除的任务ID
+
+    Args:
+        db: 数据库会话
+        user_id: 用户ID
+        since: 上次同步时间，为None时返回全部任务
+
+    Returns:
+        (任务列表, 已删除任务ID列表, 下次同步时间, 是否为全量同步)
+    """
+    # 先取当前时间作为下次同步的起点，之后写入的变更会在下一次同步中返回
+    next_since = datetime.utcnow()
+
+    # 令牌早于墓碑保留期时，无法保证删除记录完整，要求客户端全量同步
+    horizon = next_since - timedelta(days=settings.TASK_TOMBSTONE_RETENTION_DAYS)
+    full_resync = since is None or since < horizon
+
+    query = select(Task).filter(Task.user_id == user_id)
+    deleted_ids: List[int] = []
+    if not full_resync:
+        window_start = since - SYNC_SAFETY_WINDOW
+        query = query.filter(Task.updated_at >= window_start)
+        rows = await db.execute(
+            select(TaskTombstone.task_id).filter(
+                TaskTombstone.user_id == user_id,
+                TaskTombstone.deleted_at >= window_start
+            )
+        )
+        deleted_ids = sorted(set(rows.scalars().all()))
+
+    result = await db.execute(query.order_by(Task.updated_at, Task.id))
+    tasks = list(result.scalars().all())
+    # SQLite 可能复用已删除任务的ID，此时以现存任务为准
+    changed_ids = {task.id for task in tasks}
+    deleted_ids = [task_id for task_id in deleted_ids if task_id not in changed_ids]
+    logger.debug(f"Task changes for user {user_id}: {len(tasks)} changed, {len(deleted_ids)} deleted")
+    return tasks, deleted_ids, next_since, full_resync
@@ -1,28 +1,32 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import User
-from app.core.security import hash_password, verify_password
+from app.core.security import password_hasher
 from sqlalchemy.exc import IntegrityError
 
 class UserService:
     @staticmethod
-    def get_by_email(db: Session, email: str):
-        return db.query(User).filter(User.email == email).first()
+    async def get_by_email(db: AsyncSession, email: str):
+        result = await db.execute(select(User).filter(User.email == email))
+        return result.scalars().first()
 
     @staticmethod
-    def create_user(db: Session, email: str, password: str):
-        user = User(email=email, password_hash=hash_password(password))
+    async def create_user(db: AsyncSession, email: str, password: str):
+        # bcrypt 是CPU密集型操作，交给独立的进程池执行
+        password_hash = await password_hasher.hash(password)
+        user = User(email=email, password_hash=password_hash)
         db.add(user)
         try:
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
             return user
         except IntegrityError:
-            db.rollback()
+            await db.rollback()
             return None
 
     @staticmethod
-    def authenticate(db: Session, email: str, password: str):
-        user = UserService.get_by_email(db, email)
-        if user and verify_password(password, user.password_hash):
+    async def authenticate(db: AsyncSession, email: str, password: str):
+        user = await UserService.get_by_email(db, email)
+        if user and await password_hasher.verify(password, user.password_hash):
             return user
         return None
@@ -1,16 +1,73 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import Optional
-from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import hashlib
+import itertools
+import time
 
 from app.db.session import get_db
 from app.models.user import User
 from app.core.config import settings
+from app.utils.cache import LRUCache, MISSING
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/token", auto_error=False)
 
+class AuthenticatedUser:
+    """
+    已验证的用户身份
+
+    只包含鉴权所需的字段，不绑定数据库会话，可在请求之间缓存
+    """
+    __slots__ = ("id", "email", "is_active")
+
+    def __init__(self, id: int, email: str, is_active: bool = True):
+        self.id = id
+        self.email = email
+        self.is_active = is_active
+
+# 令牌 -> 已验证用户 的缓存
+# 会话事件只能感知本进程ORM对用户的修改，Core语句和其他worker的修改要等条目过期，
+# 所以有效期设得很短（默认30秒），这也是停用或删除的用户仍能通过验证的最长时间
+token_cache = LRUCache(max_entries=settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.AUTH_TOKEN_CACHE_TTL_SECONDS)
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def invalidate_user_tokens(user_id: int) -> int:
+    """
+    删除某个用户的所有缓存令牌，返回删除数量
+    """
+    return token_cache.remove_where(lambda key, principal: principal.id == user_id)
+
+def get_token_cache_stats() -> Dict[str, Any]:
+    """
+    令牌缓存的命中、未命中和淘汰计数
+    """
+    return token_cache.stats()
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    # 记录本事务中被修改或删除的用户，提交后再使其令牌缓存失效
+    changed = {
+        obj.id for obj in itertools.chain(session.dirty, session.deleted)
+        if isinstance(obj, User) and obj.id is not None
+    }
+    if changed:
+        session.info.setdefault("changed_user_ids", set()).update(changed)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate_user_tokens(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("changed_user_ids", None)
+
 def decode_token(token: str) -> dict:
     """
     解码JWT令牌
@@ -23,33 +80,50 @@ def decode_token(token: str) -> dict:
     except JWTError:
         return {}
 
-async def get_current_user(token: Optional[str] = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Optional[User]:
+async def get_current_user(token: Optional[str] = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Optional[AuthenticatedUser]:
     """
     获取当前用户
-    
-    如果令牌无效或没有提供令牌，返回None
+
+    如果令牌无效或没有提供令牌，返回None。
+    验证结果按令牌缓存，命中时既不解码JWT也不查询数据库。
     """
     if not token:
         return None
-        
+
+    key = _token_key(token)
+    principal = token_cache.get(key)
+    if principal is not MISSING:
+        return principal
+
     payload = decode_token(token)
     user_id = payload.get("sub")
-    
+
     if not user_id:
         return None
-        
+
     try:
         user_id = int(user_id)
     except (ValueError, TypeError):
         return None
-        
-    user = db.query(User).filter(User.id == user_id).first()
-    return user
 
-async def get_current_active_user(current_user: Optional[User] = Depends(get_current_user)) -> User:
+    result = await db.execute(select(User.id, User.email).filter(User.id == user_id))
+    row = result.first()
+    if not row:
+        return None
+
+    principal = AuthenticatedUser(id=row.id, email=row.email)
+    # 缓存时间取较短的 AUTH_TOKEN_CACHE_TTL_SECONDS，且不超过令牌的剩余有效期
+    ttl = settings.AUTH_TOKEN_CACHE_TTL_SECONDS
+    exp = payload.get("exp")
+    if exp is not None:
+        ttl = min(ttl, float(exp) - time.time())
+    token_cache.set(key, principal, ttl=ttl)
+    return principal
+
+async def get_current_active_user(current_user: Optional[AuthenticatedUser] = Depends(get_current_user)) -> AuthenticatedUser:
     """
     获取当前活跃用户
-    
+
     如果用户未登录或不活跃，抛出异常
     """
     if not current_user:
@@ -58,11 +132,11 @@ async def get_current_active_user(current_user: Optional[User] = Depends(get_cur
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+
     if not current_user.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Inactive user"
         )
-        
-    return current_user 
\ No newline at end of file
+
+    return current_user
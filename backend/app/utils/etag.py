@@ -0,0 +1,28 @@
+import hashlib
+from typing import Any, Optional
+
+def compute_etag(*parts: Any) -> str:
+    """
+    根据版本信息计算弱ETag
+
+    parts 应能唯一描述响应内容的版本，例如行数、最大更新时间以及查询参数
+    """
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    判断 If-None-Match 请求头是否与当前ETag匹配（弱比较）
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
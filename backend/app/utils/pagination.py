@@ -0,0 +1,40 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional
+
+def encode_cursor(*values: Any) -> str:
+    """
+    将排序键编码为不透明的游标字符串
+
+    datetime 会被转换为ISO格式，其它值需可JSON序列化
+    """
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    解码游标字符串，返回排序键列表
+
+    游标格式不正确时抛出 ValueError，由调用方转换为400错误
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+def parse_cursor_datetime(value: Optional[str]) -> Optional[datetime]:
+    """
+    解析游标中的日期时间值，格式不正确时抛出 ValueError
+    """
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
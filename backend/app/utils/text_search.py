@@ -0,0 +1,64 @@
+import re
+from typing import List, Tuple
+
+# 全文检索的分词规则，SQLite（search_tokens 函数）和PostgreSQL（同名的 plpgsql 函数）必须保持一致：
+# - 转为小写
+# - 连续的中日韩字符按相邻两个字切分（二元组），单个字符保留为一个词
+# - 连续的字母和数字为一个词，其余字符都是分隔符
+CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+WORD_RANGES = "0-9a-z\u00c0-\u024f\u0370-\u03ff\u0400-\u04ff"
+
+_TERM_PATTERN = re.compile(f"([{CJK_RANGES}]+)|([{WORD_RANGES}]+)")
+
+def _cjk_tokens(run: str) -> List[str]:
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+def split_terms(text: str) -> List[Tuple[bool, List[str]]]:
+    """
+    把文本切分为检索词，返回 (是否为中日韩字符, 词列表) 的列表
+
+    中日韩字符的一段连续文字对应一组二元组，字母数字词对应一个词
+    """
+    terms = []
+    for match in _TERM_PATTERN.finditer((text or "").lower()):
+        cjk, word = match.groups()
+        terms.append((True, _cjk_tokens(cjk)) if cjk else (False, [word]))
+    return terms
+
+def search_tokens(text: str) -> str:
+    """
+    生成写入全文索引的词序列（空格分隔）
+    """
+    return " ".join(token for _, tokens in split_terms(text) for token in tokens)
+
+def fts5_match_query(text: str) -> str:
+    """
+    构建 SQLite FTS5 的 MATCH 表达式，所有检索词都必须出现
+
+    中日韩文字作为短语匹配（相邻二元组连续出现，等价于子串匹配），单个汉字和最后一个单词按前缀匹配。
+    没有可检索的词时返回空字符串。
+    """
+    terms = split_terms(text)
+    parts = []
+    for index, (cjk, tokens) in enumerate(terms):
+        phrase = '"' + " ".join(tokens) + '"'
+        if (cjk and len(tokens[0]) == 1) or (not cjk and index == len(terms) - 1):
+            phrase += " *"
+        parts.append(phrase)
+    return " AND ".join(parts)
+
+def tsquery(text: str) -> str:
+    """
+    构建 PostgreSQL to_tsquery('simple', ...) 的查询，语义与 fts5_match_query 相同
+    """
+    terms = split_terms(text)
+    parts = []
+    for index, (cjk, tokens) in enumerate(terms):
+        prefix = (cjk and len(tokens[0]) == 1) or (not cjk and index == len(terms) - 1)
+        lexemes = [f"'{token}'" for token in tokens]
+        if prefix:
+            lexemes[-1] += ":*"
+        parts.append(lexemes[0] if len(lexemes) == 1 else "(" + " <-> ".join(lexemes) + ")")
+    return " & ".join(parts)
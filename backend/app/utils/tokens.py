@@ -0,0 +1,58 @@
+import math
+import re
+from typing import Any, Dict, List
+
+# 每条消息在提示中的固定开销（角色标记、分隔符）
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# 中日韩字符大致每个字符一个token，其余文本约四个字符一个token
+_CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+_MISSING_ENCODING = object()
+_encoding: Any = _MISSING_ENCODING
+
+def _get_encoding():
+    """
+    安装了 tiktoken 时使用 cl100k_base 精确计数，否则返回None并使用估算
+    """
+    global _encoding
+    if _encoding is _MISSING_ENCODING:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """
+    计算文本的token数
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message.get("content", "")) + MESSAGE_TOKEN_OVERHEAD
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    截断文本使其不超过 max_tokens 个token
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+def count_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_message_tokens(message) for message in messages)
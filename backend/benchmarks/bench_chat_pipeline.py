@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+聊天和意图分析全流程基准测试（离线的本地模型，不需要API Key和网络）
+
+多个已登录用户并发调用 POST /chat/（analyze_task_intent=true），消息混合了普通聊天、
+添加任务和查询任务，统计每秒请求数、延迟分位数和错误数。模型延迟按
+--distribution / --latency-ms / --spread 抽样，--error-rate 注入上游错误。
+
+Usage:
+    python benchmarks/bench_chat_pipeline.py [--requests N] [--concurrency 1 8 32]
+        [--latency-ms 300] [--distribution lognormal] [--spread 0.5] [--error-rate 0.0] [--stream]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="数据库URL，默认使用临时SQLite文件")
+    parser.add_argument("--requests", type=int, default=300, help="每轮请求总数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="并发用户数")
+    parser.add_argument("--latency-ms", type=float, default=300, help="模型延迟中位数（毫秒）")
+    parser.add_argument("--distribution", default="lognormal", choices=["fixed", "uniform", "normal", "lognormal"])
+    parser.add_argument("--spread", type=float, default=0.5, help="延迟离散程度")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入的上游错误比例")
+    parser.add_argument("--stream", action="store_true", help="使用 POST /chat/stream")
+    return parser.parse_args()
+
+
+args = parse_args()
+if args.database_url:
+    os.environ["DATABASE_URL"] = args.database_url
+else:
+    tmp_dir = tempfile.mkdtemp(prefix="bench_chat_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+os.environ["DEFAULT_AI_MODEL"] = "local"
+os.environ["LOCAL_LLM_LATENCY_MS"] = str(args.latency_ms)
+os.environ["LOCAL_LLM_LATENCY_DISTRIBUTION"] = args.distribution
+os.environ["LOCAL_LLM_LATENCY_SPREAD"] = str(args.spread)
+os.environ["LOCAL_LLM_ERROR_RATE"] = str(args.error_rate)
+# 基准测试关注整条链路，关闭LLM响应缓存，避免重复的消息直接命中
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+import httpx  # noqa: E402
+
+from app.db.base import Base  # noqa: E402
+from app.db.session import async_engine, engine  # noqa: E402
+from app.main import app  # noqa: E402
+
+PASSWORD = "benchpassword123"
+MESSAGES = [
+    "How can I stay motivated to exercise every morning?",
+    "add finish the quarterly report",
+    "what tasks are due this week",
+    "I keep procrastinating on my thesis, any advice?",
+    "添加任务：整理书桌",
+    "查看今天的任务",
+    "Give me a tip for planning my week.",
+    "delete task 3",
+]
+
+
+async def register_users(client: httpx.AsyncClient, count: int):
+    headers = []
+    for i in range(count):
+        email = f"bench_{time.time_ns()}_{i}@example.com"
+        response = await client.post("/api/auth/register", json={"email": email, "password": PASSWORD})
+        response.raise_for_status()
+        response = await client.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+        response.raise_for_status()
+        headers.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+    return headers
+
+
+async def run_round(total: int, concurrency: int):
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+    path = "/chat/stream" if args.stream else "/chat/"
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        users = await register_users(client, concurrency)
+
+        async def worker(headers):
+            nonlocal errors
+            for n in remaining:
+                body = {"message": f"{MESSAGES[n % len(MESSAGES)]} #{n}", "analyze_task_intent": True}
+                start = time.perf_counter()
+                response = await client.post(path, json=body, headers=headers)
+                if response.status_code != 200 or "event: error" in response.text:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(headers) for headers in users))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(q):
+        return latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1000 if latencies else 0.0
+
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "errors": errors,
+    }
+
+
+async def main():
+    # 注入错误和重试的日志会淹没结果输出
+    logging.disable(logging.WARNING)
+    Base.metadata.create_all(bind=engine)
+
+    print(
+        f"model latency: {args.distribution} median {args.latency_ms:.0f}ms spread {args.spread}  "
+        f"error rate: {args.error_rate}  requests/round: {args.requests}  endpoint: {'/chat/stream' if args.stream else '/chat/'}"
+    )
+    print(f"{'users':>5} | {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for concurrency in args.concurrency:
+        result = await run_round(args.requests, concurrency)
+        print(
+            f"{concurrency:>5} | {result['rps']:>8.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+            f"{result['p99_ms']:>8.1f} {result['errors']:>6}"
+        )
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        chat_stats = (await client.get("/health/chat")).json()
+    print(f"speculative completions: started {chat_stats['started']}, used {chat_stats['used']}, wasted {chat_stats['wasted']}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
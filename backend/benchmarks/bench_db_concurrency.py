@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+并发请求吞吐量基准测试：同步Session（线程池） vs AsyncSession
+
+对比旧版 `def get_user_tasks`（同步Session，由anyio线程池执行）与当前异步路由
+在相同数据库上的并发吞吐量。
+
+Usage:
+    python benchmarks/bench_db_concurrency.py [--database-url URL] [--requests N] [--concurrency C]
+
+默认使用临时SQLite文件；传入 postgresql://... 可对PostgreSQL进行测试。
+SQLite的写入和文件锁是串行的，线程池饱和的差异在PostgreSQL等网络数据库上更明显。
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="数据库URL，默认使用临时SQLite文件")
+    parser.add_argument("--requests", type=int, default=2000, help="每轮请求总数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64, 256], help="并发客户端数")
+    parser.add_argument("--tasks", type=int, default=50, help="为测试用户预置的任务数")
+    parser.add_argument("--threadpool", type=int, default=40, help="anyio线程池大小（FastAPI默认40）")
+    return parser.parse_args()
+
+
+args = parse_args()
+tmp_dir = None
+if args.database_url:
+    os.environ["DATABASE_URL"] = args.database_url
+else:
+    tmp_dir = tempfile.mkdtemp(prefix="bench_db_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+import anyio.to_thread  # noqa: E402
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.db.base import Base  # noqa: E402
+from app.db.session import SessionLocal, async_engine, engine  # noqa: E402
+from app.main import app as async_app  # noqa: E402
+from app.models.task import Task  # noqa: E402
+from app.models.user import User  # noqa: E402
+
+
+def build_sync_app() -> FastAPI:
+    """重建旧版同步路由，作为基线"""
+    sync_app = FastAPI()
+
+    def get_sync_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @sync_app.get("/api/tasks/user/{user_id}")
+    def get_user_tasks(user_id: int, db: Session = Depends(get_sync_db)):
+        tasks = db.query(Task).filter(Task.user_id == user_id).order_by(Task.due_date).all()
+        return [{"id": t.id, "text": t.text, "status": t.status} for t in tasks]
+
+    return sync_app
+
+
+def seed(task_count: int) -> int:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = User(email=f"bench_{time.time_ns()}@example.com", password_hash="x")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        db.add_all([Task(user_id=user.id, text=f"task {i}") for i in range(task_count)])
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+async def run_round(app, user_id: int, total: int, concurrency: int):
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    remaining = iter(range(total))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            for _ in remaining:
+                start = time.perf_counter()
+                response = await client.get(f"/api/tasks/user/{user_id}")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = args.threadpool
+    user_id = seed(args.tasks)
+    sync_app = build_sync_app()
+
+    print(f"Database: {engine.url.get_backend_name()}  requests/round: {args.requests}  threadpool: {args.threadpool}")
+    print(f"{'concurrency':>11} | {'sync req/s':>10} {'p50 ms':>8} {'p95 ms':>8} | {'async req/s':>11} {'p50 ms':>8} {'p95 ms':>8} | speedup")
+    for concurrency in args.concurrency:
+        before = await run_round(sync_app, user_id, args.requests, concurrency)
+        after = await run_round(async_app, user_id, args.requests, concurrency)
+        print(
+            f"{concurrency:>11} | {before['rps']:>10.0f} {before['p50_ms']:>8.1f} {before['p95_ms']:>8.1f} | "
+            f"{after['rps']:>11.0f} {after['p50_ms']:>8.1f} {after['p95_ms']:>8.1f} | {after['rps'] / before['rps']:.2f}x"
+        )
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+LLM HTTP客户端基准测试：每次新建连接的 requests.post vs 共享连接池的异步客户端
+
+在本地启动一个模拟Gemini generateContent 接口的桩服务器，分别测量：
+  - 旧实现：每次调用 requests.post（不复用连接），在线程池中执行
+  - 新实现：await chat_with_gemini，通过进程内共享的 httpx.AsyncClient 复用连接
+
+回环地址上的TCP握手几乎没有开销，也没有DNS和TLS，因此桩服务器在每个新连接上
+额外等待 --connect-delay 毫秒，模拟到真实API的握手往返时间（TLS 1.3 下约为 2-3 个RTT）。
+
+Usage:
+    python benchmarks/bench_llm_client.py [--calls N] [--concurrency 1 8 32] [--connect-delay MS] [--server-delay MS]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200, help="每轮调用次数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="并发调用数")
+    parser.add_argument("--connect-delay", type=float, default=60.0, help="每个新连接的模拟握手耗时（毫秒）")
+    parser.add_argument("--server-delay", type=float, default=20.0, help="每次请求的模拟生成耗时（毫秒）")
+    return parser.parse_args()
+
+
+args = parse_args()
+
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    """模拟Gemini generateContent 接口，支持HTTP/1.1 keep-alive"""
+
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，不关闭Nagle会与客户端的延迟ACK叠加出约40ms的额外延迟
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        # 每个新连接只执行一次，模拟DNS/TCP/TLS握手的往返耗时
+        time.sleep(args.connect_delay / 1000)
+        super().setup()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        time.sleep(args.server_delay / 1000)
+        body = json.dumps({"candidates": [{"content": {"parts": [{"text": "stub reply"}]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认的 listen backlog 只有5，高并发下新建连接会被重置
+    request_queue_size = 1024
+
+
+server = StubServer(("127.0.0.1", 0), StubGeminiHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+os.environ["GEMINI_API_KEY"] = "bench"
+os.environ["GEMINI_API_BASE"] = f"http://127.0.0.1:{server.server_port}/v1beta/models"
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+import anyio.to_thread  # noqa: E402
+import requests  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.services.gemini_service import build_gemini_request, chat_with_gemini  # noqa: E402
+from app.services.http_client import close_http_client  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Give me a motivational quote."}]
+
+
+def unpooled_call():
+    """旧实现：不使用Session，每次调用都新建连接"""
+    response = requests.post(
+        f"{settings.GEMINI_API_BASE}/gemini-1.5-flash:generateContent?key={settings.GEMINI_API_KEY}",
+        headers={"Content-Type": "application/json"},
+        json=build_gemini_request(MESSAGES),
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+
+
+async def run_round(call, total: int, concurrency: int):
+    latencies = []
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "cps": total / elapsed,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    async def before():
+        return await anyio.to_thread.run_sync(unpooled_call)
+
+    async def after():
+        return await chat_with_gemini(MESSAGES)
+
+    print(f"connect delay: {args.connect_delay:.0f}ms  server delay: {args.server_delay:.0f}ms  calls/round: {args.calls}")
+    print(f"{'concurrency':>11} | {'requests call/s':>15} {'mean ms':>8} {'p95 ms':>8} | {'pooled call/s':>13} {'mean ms':>8} {'p95 ms':>8} | saved/call")
+    for concurrency in args.concurrency:
+        old = await run_round(before, args.calls, concurrency)
+        new = await run_round(after, args.calls, concurrency)
+        print(
+            f"{concurrency:>11} | {old['cps']:>15.1f} {old['mean_ms']:>8.1f} {old['p95_ms']:>8.1f} | "
+            f"{new['cps']:>13.1f} {new['mean_ms']:>8.1f} {new['p95_ms']:>8.1f} | {old['mean_ms'] - new['mean_ms']:>7.1f}ms"
+        )
+
+    await close_http_client()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+全文检索基准测试：GET /api/search（FTS5 / tsvector） vs LIKE '%关键词%' 扫描
+
+预置 --rows 条任务和聊天消息（默认100万，约五分之一是任务），平均分给 --users 个用户，
+文本混合中文和英文。之后对其中一个用户执行一组查询，统计接口延迟分位数，并与同一用户上的
+LIKE 子串查询对比（直接执行查询，不含HTTP开销）。同时报告写入时的索引同步开销（每秒写入行数）。
+
+Usage:
+    python benchmarks/bench_search.py [--database-url URL] [--rows 1000000] [--users 100] [--repeat 20]
+
+默认使用临时SQLite文件；传入 postgresql://... 可对PostgreSQL进行测试。
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="数据库URL，默认使用临时SQLite文件")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="预置的任务和消息总数")
+    parser.add_argument("--users", type=int, default=100, help="数据分布的用户数")
+    parser.add_argument("--repeat", type=int, default=20, help="每个查询的重复次数")
+    parser.add_argument("--batch", type=int, default=10_000, help="每次批量写入的行数")
+    return parser.parse_args()
+
+
+args = parse_args()
+if args.database_url:
+    os.environ["DATABASE_URL"] = args.database_url
+else:
+    tmp_dir = tempfile.mkdtemp(prefix="bench_search_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+import httpx  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from app.db.base import Base  # noqa: E402
+from app.db.session import AsyncSessionLocal, async_engine, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services.search_service import SearchService, SEARCH_TYPES  # noqa: E402
+
+PASSWORD = "benchpassword123"
+CHINESE = [
+    "完成", "季度", "报告", "整理", "书桌", "健身", "晨跑", "阅读", "论文", "会议", "预算", "旅行", "计划",
+    "学习", "英语", "复习", "考试", "项目", "设计", "代码", "周末", "购物", "牛奶", "朋友", "生日", "提醒",
+]
+ENGLISH = [
+    "finish", "quarterly", "report", "clean", "desk", "gym", "run", "read", "thesis", "meeting", "budget",
+    "travel", "plan", "study", "review", "exam", "project", "design", "code", "weekend", "groceries", "milk",
+]
+QUERIES = ["报告", "季度报告", "健身计划", "牛", "report", "quarterly rep", "thesis review", "周末 groceries", "不存在的词"]
+
+
+def random_text(rng: random.Random) -> str:
+    words = [rng.choice(CHINESE) for _ in range(rng.randint(2, 6))]
+    words += [rng.choice(ENGLISH) for _ in range(rng.randint(0, 4))]
+    rng.shuffle(words)
+    # 中文词之间通常没有空格
+    return "".join(w if w in CHINESE else f" {w} " for w in words).strip()
+
+
+async def register(client: httpx.AsyncClient):
+    email = f"bench_{time.time_ns()}@example.com"
+    response = await client.post("/api/auth/register", json={"email": email, "password": PASSWORD})
+    response.raise_for_status()
+    user_id = response.json()["id"]
+    response = await client.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+    response.raise_for_status()
+    return user_id, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def seed(user_ids):
+    """批量写入任务和消息，索引由触发器或生成列同步"""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    written = 0
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        while written < args.rows:
+            size = min(args.batch, args.rows - written)
+            tasks, messages = [], []
+            for i in range(size):
+                row = {
+                    "user_id": user_ids[(written + i) % len(user_ids)],
+                    "text": random_text(rng),
+                    "created_at": now - timedelta(minutes=written + i),
+                }
+                (tasks if (written + i) % 5 == 0 else messages).append(row)
+            if tasks:
+                conn.execute(text(
+                    "INSERT INTO tasks (user_id, text, status, type, created_at, updated_at) "
+                    "VALUES (:user_id, :text, 'todo', 'todo', :created_at, :created_at)"
+                ), tasks)
+            if messages:
+                conn.execute(text(
+                    "INSERT INTO chat_messages (user_id, role, content, created_at) "
+                    "VALUES (:user_id, 'user', :text, :created_at)"
+                ), messages)
+            written += size
+    return written / (time.perf_counter() - start)
+
+
+async def fts_search(user_id: int, query: str, limit: int = 20):
+    async with AsyncSessionLocal() as db:
+        return await SearchService.search(db, user_id, query, types=list(SEARCH_TYPES), limit=limit)
+
+
+async def like_search(user_id: int, query: str, limit: int = 20):
+    """基线：对每个词做 LIKE 子串匹配（不排序相关度）"""
+    terms = query.split()
+    conditions = " AND ".join(f"{{column}} LIKE :t{i}" for i in range(len(terms)))
+    params = {f"t{i}": f"%{term}%" for i, term in enumerate(terms)}
+    params.update(user_id=user_id, limit=limit)
+    async with AsyncSessionLocal() as db:
+        rows = []
+        for table, column in (("tasks", "text"), ("chat_messages", "content")):
+            result = await db.execute(text(
+                f"SELECT id FROM {table} WHERE user_id = :user_id AND {conditions.format(column=column)} "
+                f"ORDER BY created_at DESC LIMIT :limit"
+            ), params)
+            rows.extend(result.all())
+    return rows
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)] * 1000
+
+
+async def main():
+    logging.disable(logging.WARNING)
+    Base.metadata.create_all(bind=engine)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        user_id, headers = await register(client)
+        with engine.begin() as conn:
+            first = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM users")).scalar() + 1
+            conn.execute(text("INSERT INTO users (email, password_hash) VALUES (:email, 'x')"), [
+                {"email": f"bench_{time.time_ns()}_{i}@example.com"} for i in range(args.users - 1)
+            ])
+        user_ids = [user_id] + list(range(first, first + args.users - 1))
+
+        print(f"seeding {args.rows} rows for {args.users} users ({args.rows // args.users} per user)...")
+        rate = seed(user_ids)
+        print(f"write throughput with index sync: {rate:,.0f} rows/s")
+
+        print(f"{'query':<16} | {'hits':>5} {'api p50':>8} | {'fts p50':>8} {'fts p95':>8} | {'like p50':>8} {'like p95':>8}")
+        for query in QUERIES:
+            api, fts, like = [], [], []
+            hits = 0
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = await client.get("/api/search", params={"q": query, "limit": 20}, headers=headers)
+                api.append(time.perf_counter() - start)
+                response.raise_for_status()
+                hits = len(response.json())
+                # 直接调用查询，与LIKE基线在相同条件下比较（不含HTTP和认证开销）
+                start = time.perf_counter()
+                await fts_search(user_id, query)
+                fts.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                await like_search(user_id, query)
+                like.append(time.perf_counter() - start)
+            print(
+                f"{query:<16} | {hits:>5} {percentile(api, 0.5):>8.1f} | {percentile(fts, 0.5):>8.1f} "
+                f"{percentile(fts, 0.95):>8.1f} | {percentile(like, 0.5):>8.1f} {percentile(like, 0.95):>8.1f}"
+            )
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+评估本地意图预分类器
+
+在带标签的评估集（默认 scripts/intent_data/eval.jsonl）上运行 IntentClassifier，
+输出本地直接回答的比例（即省下的LLM调用）、每个标签的精确率，以及所有判错的样本。
+未被本地回答的消息会交给LLM，不计入精确率。样本带有 expected 字段时，
+提取出的任务文本、相对截止日期（due_in_days）和查询参数也必须一致才算正确。
+
+Usage:
+    python scripts/evaluate_intent_classifier.py [--eval PATH] [--verbose]
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.intent_classifier import LOCAL_LABELS, intent_classifier  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "intent_data")
+
+
+def matches_expected(task, expected, today):
+    for field, value in expected.items():
+        if field == "due_in_days":
+            due = datetime.combine(today + timedelta(days=value), datetime.min.time()).isoformat()
+            if task.get("due_date") != due:
+                return False
+        elif task.get(field) != value:
+            return False
+    if "due_in_days" not in expected and "text" in expected and task.get("due_date"):
+        return False
+    return True
+
+
+def evaluate(samples, classifier=intent_classifier, today=None):
+    """
+    返回评估结果字典：total、answered、correct、per_label 以及 errors/deferred 样本
+    """
+    today = today or date.today()
+    answered = Counter()
+    correct = Counter()
+    support = Counter(sample["label"] for sample in samples)
+    errors = []
+    deferred = []
+    for sample in samples:
+        text, label = sample["text"], sample["label"]
+        result = classifier.classify(text, today=today)
+        if result is None:
+            deferred.append((text, label))
+            continue
+        answered[result.action] += 1
+        if result.action == label and matches_expected(result.task, sample.get("expected", {}), today):
+            correct[result.action] += 1
+        else:
+            errors.append((text, label, result.action, result.task, result.source))
+    per_label = {
+        label: {
+            "support": support[label],
+            "answered": answered[label],
+            "precision": correct[label] / answered[label] if answered[label] else None,
+        }
+        for label in sorted(support)
+    }
+    total_answered = sum(answered.values())
+    return {
+        "total": len(samples),
+        "answered": total_answered,
+        "correct": sum(correct.values()),
+        "precision": sum(correct.values()) / total_answered if total_answered else None,
+        "llm_calls_avoided": total_answered / len(samples) if samples else 0.0,
+        "per_label": per_label,
+        "errors": errors,
+        "deferred": deferred,
+    }
+
+
+def load_samples(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eval", default=os.path.join(DATA_DIR, "eval.jsonl"), help="评估集路径")
+    parser.add_argument("--verbose", action="store_true", help="同时列出交给LLM的样本")
+    args = parser.parse_args()
+
+    report = evaluate(load_samples(args.eval))
+    print(f"Samples: {report['total']}")
+    print(f"Answered locally (LLM calls avoided): {report['answered']} ({report['llm_calls_avoided']:.1%})")
+    if report["precision"] is not None:
+        print(f"Local precision: {report['correct']}/{report['answered']} ({report['precision']:.1%})")
+    print()
+    print(f"{'label':<12} {'support':>7} {'answered':>8} {'precision':>9}")
+    for label, row in report["per_label"].items():
+        precision = f"{row['precision']:.1%}" if row["precision"] is not None else "-"
+        marker = "" if label in LOCAL_LABELS else "  (always LLM)"
+        print(f"{label:<12} {row['support']:>7} {row['answered']:>8} {precision:>9}{marker}")
+
+    if report["errors"]:
+        print("\nMisclassified:")
+        for text, label, predicted, task, source in report["errors"]:
+            print(f"  [{source}] {text!r}: expected {label}, got {predicted} {task}")
+    if args.verbose and report["deferred"]:
+        print("\nDeferred to LLM:")
+        for text, label in report["deferred"]:
+            print(f"  {text!r} ({label})")
+
+
+if __name__ == "__main__":
+    main()
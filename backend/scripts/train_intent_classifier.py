@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+离线训练本地意图分类模型
+
+读取 scripts/intent_data/train.jsonl（每行 {"text": ..., "label": ...}），
+训练字符n-gram朴素贝叶斯模型并写入 app/services/intent_model.json。
+
+Usage:
+    python scripts/train_intent_classifier.py [--train PATH] [--output PATH] [--alpha A]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.intent_classifier import MODEL_PATH, NaiveBayesIntentModel  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "intent_data")
+
+
+def load_samples(path):
+    with open(path, encoding="utf-8") as f:
+        return [(row["text"], row["label"]) for row in map(json.loads, f) if row]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--train", default=os.path.join(DATA_DIR, "train.jsonl"), help="训练集路径")
+    parser.add_argument("--output", default=str(MODEL_PATH), help="模型输出路径")
+    parser.add_argument("--alpha", type=float, default=0.5, help="拉普拉斯平滑系数")
+    args = parser.parse_args()
+
+    samples = load_samples(args.train)
+    model = NaiveBayesIntentModel.train(samples, alpha=args.alpha)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(model.to_dict(), f, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+    features = sum(len(v) for v in model.log_likelihoods.values())
+    print(f"Trained on {len(samples)} samples, {len(model.labels)} labels, {features} features -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+import os
+
+# 测试默认使用离线的本地模型：不需要真实的API Key，也不会访问网络
+os.environ.setdefault("DEFAULT_AI_MODEL", "local")
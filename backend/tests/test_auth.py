@@ -110,4 +110,76 @@ async def test_create_task_types_and_validation():
         # Longterm task (should succeed)
         longterm_data = {"user_id": user_id, "text": "Longterm Task", "type": "longterm"}
         response = await ac.post("/api/tasks/", json=longterm_data)
-        assert response.status_code == 201 
\ No newline at end of file
+        assert response.status_code == 201 
+
+
+@pytest.mark.asyncio
+async def test_token_verification_cache():
+    from app.db.session import AsyncSessionLocal
+    from app.models.user import User
+    from app.utils.auth import token_cache
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        unique_email = f"tokenuser_{random.randint(10000,99999)}@example.com"
+        response = await ac.post("/api/auth/register", json={"email": unique_email, "password": "testpassword123"})
+        user_id = response.json()["id"]
+        response = await ac.post("/api/auth/login", json={"email": unique_email, "password": "testpassword123"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = await ac.get("/chat-history/", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        hits = token_cache.hits
+        response = await ac.get("/chat-history/", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert token_cache.hits == hits + 1
+
+        # 修改用户后，缓存的令牌必须失效
+        async with AsyncSessionLocal() as db:
+            user = await db.get(User, user_id)
+            user.email = f"renamed_{unique_email}"
+            await db.commit()
+        misses = token_cache.misses
+        response = await ac.get("/chat-history/", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert token_cache.misses == misses + 1
+
+        response = await ac.get("/chat-history/", headers={"Authorization": "Bearer invalid"})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+@pytest.mark.asyncio
+async def test_login_rejected_when_password_hasher_saturated():
+    from app.core.security import password_hasher
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        unique_email = f"busyuser_{random.randint(10000,99999)}@example.com"
+        response = await ac.post("/api/auth/register", json={"email": unique_email, "password": "testpassword123"})
+        assert response.status_code == status.HTTP_201_CREATED
+
+        workers, max_pending = password_hasher.workers, password_hasher.max_pending
+        # 排队上限为0时，所有哈希请求都被视为队列已满
+        password_hasher.configure(workers=0, max_pending=0)
+        try:
+            response = await ac.post("/api/auth/login", json={"email": unique_email, "password": "testpassword123"})
+            assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+            assert response.headers["Retry-After"] == "1"
+            assert password_hasher.stats()["rejected"] >= 1
+        finally:
+            password_hasher.configure(workers=workers, max_pending=max_pending)
+
+        response = await ac.post("/api/auth/login", json={"email": unique_email, "password": "testpassword123"})
+        assert response.status_code == status.HTTP_200_OK
+
+@pytest.mark.asyncio
+async def test_password_hasher_counts_failures_separately():
+    from app.core.security import PasswordHasher, PasswordHasherBusyError
+
+    def boom(value):
+        raise RuntimeError("hash failed")
+
+    hasher = PasswordHasher(workers=0, max_pending=1)
+    assert await hasher._run(str.upper, "ok") == "OK"
+    with pytest.raises(RuntimeError):
+        await hasher._run(boom, "x")
+    hasher.max_pending = 0
+    with pytest.raises(PasswordHasherBusyError):
+        await hasher._run(str.upper, "busy")
+    stats = hasher.stats()
+    assert (stats["submitted"], stats["completed"], stats["failed"], stats["rejected"], stats["pending"]) == (3, 1, 1, 1, 0)
@@ -1,12 +1,22 @@
+import os
 import pytest
 from httpx import AsyncClient
 from fastapi import status
 from app.main import app
 from app.core.config import settings
+from app.db.base import Base
+from app.db.session import engine
+
+# Ensure all tables are created before tests
+Base.metadata.create_all(bind=engine)
+
+# 真实的OpenAI/Gemini接口只在设置了 LLM_LIVE_TESTS=1 时测试，其余测试使用离线的本地模型
+live_llm = pytest.mark.skipif(not os.getenv("LLM_LIVE_TESTS"), reason="Set LLM_LIVE_TESTS=1 to call live LLM APIs")
 
 @pytest.mark.asyncio
-async def test_chat_endpoint_default():
-    """Test chat endpoint with default AI model"""
+async def test_chat_endpoint_default(monkeypatch):
+    """Test chat endpoint with the default AI model (the offline local provider)"""
+    monkeypatch.setattr(settings, "DEFAULT_AI_MODEL", "local")
     async with AsyncClient(app=app, base_url="http://test") as ac:
         data = {"message": "Give me a motivational quote about achieving goals."}
         response = await ac.post("/chat/", json=data)
@@ -14,7 +24,11 @@ async def test_chat_endpoint_default():
         assert "response" in response.json()
         assert isinstance(response.json()["response"], str)
         assert len(response.json()["response"]) > 0
+        # 本地模型的回复由消息内容决定
+        again = await ac.post("/chat/", json=data)
+        assert again.json()["response"] == response.json()["response"]
 
+@live_llm
 @pytest.mark.asyncio
 async def test_chat_endpoint_openai():
     """Test chat endpoint with OpenAI model provider if available"""
@@ -32,6 +46,7 @@ async def test_chat_endpoint_openai():
         assert isinstance(response.json()["response"], str)
         assert len(response.json()["response"]) > 0
 
+@live_llm
 @pytest.mark.asyncio
 async def test_chat_endpoint_gemini():
     """Test chat endpoint with Gemini model provider if available"""
@@ -47,4 +62,667 @@ async def test_chat_endpoint_gemini():
         assert response.status_code == status.HTTP_200_OK
         assert "response" in response.json()
         assert isinstance(response.json()["response"], str)
-        assert len(response.json()["response"]) > 0 
\ No newline at end of file
+        assert len(response.json()["response"]) > 0 
+@pytest.mark.asyncio
+async def test_chat_stream_with_fake_provider(monkeypatch):
+    """Stream chunks in order and persist the full reply, using a local fake provider"""
+    import json
+    import random
+    from app.api.v1.endpoints import chat as chat_endpoint
+    from app.services.provider_limiter import ProviderBusyError
+
+    chunks = ["Keep ", "going, ", "一步", "一步来。"]
+
+    async def fake_chunks():
+        for chunk in chunks:
+            yield chunk
+
+    async def busy_chunks():
+        raise ProviderBusyError("AI provider openai is busy: wait queue is full", retry_after=2)
+        yield
+
+    async def failing_chunks():
+        yield chunks[0]
+        raise Exception("upstream error with internal details")
+
+    source = {"chunks": fake_chunks}
+
+    def fake_stream(messages, model_provider=None, system_prompt=None):
+        assert messages[-1] == {"role": "user", "content": "Motivate me"}
+        return source["chunks"]()
+
+    monkeypatch.setattr(chat_endpoint, "stream_chat_with_ai", fake_stream)
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        email = f"streamuser_{random.randint(10000,99999)}@example.com"
+        await ac.post("/api/auth/register", json={"email": email, "password": "testpassword123"})
+        response = await ac.post("/api/auth/login", json={"email": email, "password": "testpassword123"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = await ac.post("/chat/stream", json={"message": "Motivate me"}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/event-stream")
+
+        events = []
+        for block in response.text.strip().split("\n\n"):
+            event_line, data_line = block.split("\n")
+            events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+        assert [data["content"] for event, data in events if event == "chunk"] == chunks
+        assert events[-1] == ("done", {"response": "".join(chunks), "task_intent": None})
+
+        response = await ac.get("/chat-history/", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        history = response.text
+        assert "Motivate me" in history
+        assert "".join(chunks) in history
+
+        # 排队已满时在流开始前返回 503；流中途出错只发送通用的错误信息
+        source["chunks"] = busy_chunks
+        response = await ac.post("/chat/stream", json={"message": "Motivate me"}, headers=headers)
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers["Retry-After"] == "2"
+
+        source["chunks"] = failing_chunks
+        response = await ac.post("/chat/stream", json={"message": "Motivate me"}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert "event: error" in response.text
+        assert "internal details" not in response.text
+
+@pytest.mark.asyncio
+async def test_chat_speculative_completion(monkeypatch):
+    """Intent analysis and the normal completion run concurrently; the unused one is cancelled"""
+    import asyncio
+    import random
+    from app.api.v1.endpoints import chat as chat_endpoint
+    from app.services.task_intent_service import TaskIntent
+
+    events = []
+
+    async def slow_intent(message, model_provider=None):
+        events.append("intent_start")
+        await asyncio.sleep(0.05)
+        events.append("intent_end")
+        if message.startswith("add"):
+            return TaskIntent("add_task", {"text": "report"}, "是否要添加任务「report」？")
+        return TaskIntent("none", {})
+
+    async def slow_chat(messages, model_provider=None, system_prompt=None):
+        events.append("chat_start")
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            events.append("chat_cancelled")
+            raise
+        events.append("chat_end")
+        return "Keep going!"
+
+    monkeypatch.setattr(chat_endpoint, "parse_user_request", slow_intent)
+    monkeypatch.setattr(chat_endpoint, "chat_with_ai", slow_chat)
+    monkeypatch.setattr(chat_endpoint.settings, "CHAT_SPECULATIVE_COMPLETION", True)
+    monkeypatch.setattr(chat_endpoint.settings, "CHAT_SPECULATIVE_DELAY_MS", 0)
+    stats = chat_endpoint.speculation_stats
+    started, used, wasted = stats.started, stats.used, stats.wasted
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        email = f"specuser_{random.randint(10000,99999)}@example.com"
+        await ac.post("/api/auth/register", json={"email": email, "password": "testpassword123"})
+        response = await ac.post("/api/auth/login", json={"email": email, "password": "testpassword123"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = await ac.post("/chat/", json={"message": "how do I focus", "analyze_task_intent": True}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"response": "Keep going!", "task_intent": None}
+        # 普通回复在意图分析完成之前就已开始
+        assert events.index("chat_start") < events.index("intent_end")
+
+        events.clear()
+        response = await ac.post("/chat/", json={"message": "add report", "analyze_task_intent": True}, headers=headers)
+        assert response.json()["task_intent"]["action"] == "add_task"
+        await asyncio.sleep(0)
+        assert "chat_cancelled" in events and "chat_end" not in events
+
+    assert (stats.started, stats.used, stats.wasted) == (started + 2, used + 1, wasted + 1)
+
+@pytest.mark.asyncio
+async def test_provider_router_hedges_and_opens_circuit(monkeypatch):
+    """A slow primary is hedged to the other provider; repeated failures open its circuit"""
+    import asyncio
+    from app.services import ai_service
+    from app.services.provider_limiter import ProviderBusyError
+    from app.services.provider_router import ProviderRouter
+
+    router = ProviderRouter(hedge_min_samples=3, hedge_max_delay=1.0, failure_threshold=2, cooldown=60)
+    monkeypatch.setattr(ai_service, "provider_router", router)
+    monkeypatch.setattr(ai_service, "get_available_providers", lambda: ["openai", "gemini"])
+    monkeypatch.setattr(ai_service, "resolve_model_provider", lambda provider=None: provider or "openai")
+    calls = []
+    openai_delay = {"value": 0.01}
+    openai_fails = {"value": False}
+
+    async def fake_openai(messages, json_mode=False):
+        calls.append("openai")
+        await asyncio.sleep(openai_delay["value"])
+        if openai_fails["value"]:
+            raise Exception("OpenAI API error")
+        return "from openai"
+
+    async def fake_gemini(messages, json_mode=False):
+        calls.append("gemini")
+        await asyncio.sleep(0.01)
+        return "from gemini"
+
+    monkeypatch.setattr(ai_service, "chat_with_openai", fake_openai)
+    monkeypatch.setattr(ai_service, "chat_with_gemini", fake_gemini)
+    messages = [{"role": "user", "content": "hi"}]
+
+    # 积累延迟样本：p95 约为10ms
+    for _ in range(3):
+        assert await ai_service.chat_with_ai(messages) == "from openai"
+    assert calls == ["openai"] * 3
+
+    # 主提供商变慢，超过p95后对冲到gemini，先返回的结果生效
+    openai_delay["value"] = 0.5
+    calls.clear()
+    assert await ai_service.chat_with_ai(messages) == "from gemini"
+    assert calls == ["openai", "gemini"]
+    assert router.stats("openai").hedges_started == 1
+    assert router.stats("openai").hedge_wins == 1
+    # 被取消的调用不计入失败
+    assert router.stats("openai").failures == 0
+
+    # 明确指定提供商时不对冲
+    openai_delay["value"] = 0.01
+    calls.clear()
+    assert await ai_service.chat_with_ai(messages, model_provider="openai") == "from openai"
+    assert calls == ["openai"]
+
+    # 本地排队已满时也立即切换到gemini，但不计入熔断
+    async def busy_openai(messages, json_mode=False):
+        calls.append("openai")
+        raise ProviderBusyError("AI provider openai is busy: wait queue is full")
+
+    monkeypatch.setattr(ai_service, "chat_with_openai", busy_openai)
+    calls.clear()
+    assert await ai_service.chat_with_ai(messages) == "from gemini"
+    assert calls == ["openai", "gemini"]
+    assert router.breaker("openai").consecutive_failures == 0
+    monkeypatch.setattr(ai_service, "chat_with_openai", fake_openai)
+
+    # 连续失败时立即切换到gemini，达到阈值后熔断，之后不再调用openai
+    openai_fails["value"] = True
+    for _ in range(2):
+        assert await ai_service.chat_with_ai(messages) == "from gemini"
+    assert router.breaker("openai").state == "open"
+    calls.clear()
+    assert await ai_service.chat_with_ai(messages) == "from gemini"
+    assert calls == ["gemini"]
+
+    snapshot = router.snapshot(["openai", "gemini"])
+    assert snapshot["openai"]["state"] == "open"
+    assert snapshot["openai"]["failovers"] == 3
+    assert snapshot["gemini"]["state"] == "closed"
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/health/providers")
+        assert response.status_code == status.HTTP_200_OK
+
+        # 所有提供商都被熔断时返回 503，Retry-After 为最早结束冷却的剩余时间
+        for _ in range(2):
+            router.breaker("gemini").record_failure()
+        response = await ac.post("/chat/", json={"message": "hi", "use_history": False})
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert 1 <= int(response.headers["Retry-After"]) <= 60
+
+@pytest.mark.asyncio
+async def test_chat_context_token_budget_and_summary(monkeypatch):
+    """History is trimmed to the token budget and older turns are folded into the summary row"""
+    import random
+    from app.db.session import AsyncSessionLocal
+    from app.models.chat_message import ChatMessage
+    from app.models.user import User
+    from app.services import chat_context_service
+    from app.services.chat_context_service import ChatContextService, chat_summarizer, count_tokens
+
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"context_{random.randint(10000,99999)}@example.com", password_hash="x")
+        db.add(user)
+        await db.commit()
+        # 每条约100个token
+        db.add_all([
+            ChatMessage(user_id=user.id, role="user" if i % 2 == 0 else "assistant", content=f"message {i} " + "x" * 400)
+            for i in range(10)
+        ])
+        await db.commit()
+
+        context = await ChatContextService.build_context(db, user.id, new_message="hello", token_budget=330)
+        assert [m["content"].split()[1] for m in context.messages] == ["7", "8", "9"]
+        assert context.tokens <= 330
+        assert context.summary is None
+        assert context.fold_before_id is not None
+
+    prompts = []
+
+    async def fake_chat(messages, model_provider=None, system_prompt=None, json_mode=False):
+        prompts.append(messages[-1]["content"])
+        return "User is planning a report; discussed messages 0-6."
+
+    monkeypatch.setattr(chat_context_service, "chat_with_ai", fake_chat)
+    task = chat_summarizer.schedule(user.id, context.fold_before_id)
+    await task
+    assert "message 0" in prompts[0] and "message 6" in prompts[0] and "message 7" not in prompts[0]
+
+    async with AsyncSessionLocal() as db:
+        context = await ChatContextService.build_context(db, user.id, new_message="hello", token_budget=330)
+        assert context.summary == "User is planning a report; discussed messages 0-6."
+        # 摘要也计入预算，因此只剩两条最近消息
+        assert [m["content"].split()[1] for m in context.messages] == ["8", "9"]
+        assert context.tokens == count_tokens(context.summary) + count_tokens("hello") + sum(
+            count_tokens(m["content"]) + 4 for m in context.messages
+        )
+
+    # 下一次折叠只发送旧摘要和新增的消息
+    await chat_summarizer.fold(user.id, context.fold_before_id)
+    assert "Previous summary:\nUser is planning a report" in prompts[1]
+    assert "message 7" in prompts[1] and "message 6" not in prompts[1]
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_llm_calls_are_coalesced(monkeypatch):
+    """Concurrent identical requests share one upstream call, its result, errors and cancellation"""
+    import asyncio
+    from app.services import ai_service
+    from app.services.provider_router import ProviderRouter
+    from app.utils.single_flight import SingleFlight
+
+    flight = SingleFlight()
+    monkeypatch.setattr(ai_service, "llm_single_flight", flight)
+    monkeypatch.setattr(ai_service, "provider_router", ProviderRouter(failure_threshold=100))
+    monkeypatch.setattr(ai_service, "get_available_providers", lambda: ["openai"])
+    monkeypatch.setattr(ai_service, "resolve_model_provider", lambda provider=None: provider or "openai")
+    monkeypatch.setattr(ai_service.settings, "LLM_SINGLE_FLIGHT_ENABLED", True)
+    upstream = {"calls": 0, "cancelled": 0, "fail": False}
+
+    async def fake_openai(messages, json_mode=False):
+        upstream["calls"] += 1
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            upstream["cancelled"] += 1
+            raise
+        if upstream["fail"]:
+            raise Exception("OpenAI API error")
+        return f"reply to {messages[-1]['content']}"
+
+    monkeypatch.setattr(ai_service, "chat_with_openai", fake_openai)
+    same = [{"role": "user", "content": "hi"}]
+
+    results = await asyncio.gather(
+        *(ai_service.chat_with_ai(same) for _ in range(3)),
+        ai_service.chat_with_ai([{"role": "user", "content": "other"}]),
+    )
+    assert results == ["reply to hi"] * 3 + ["reply to other"]
+    assert upstream["calls"] == 2
+    assert (flight.executed, flight.coalesced) == (2, 2)
+
+    # 上游错误传给所有调用者
+    upstream["fail"] = True
+    results = await asyncio.gather(*(ai_service.chat_with_ai(same) for _ in range(2)), return_exceptions=True)
+    assert all(str(r) == "OpenAI API error" for r in results)
+    assert upstream["calls"] == 3
+
+    # 一个调用者取消不影响另一个；全部取消后才取消上游调用
+    upstream["fail"] = False
+    first = asyncio.create_task(ai_service.chat_with_ai(same))
+    second = asyncio.create_task(ai_service.chat_with_ai(same))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    assert await second == "reply to hi"
+    assert upstream["cancelled"] == 0
+
+    lone = asyncio.create_task(ai_service.chat_with_ai(same))
+    await asyncio.sleep(0.01)
+    lone.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await lone
+    await asyncio.sleep(0)
+    assert upstream["cancelled"] == 1
+    assert flight.stats()["in_flight"] == 0 and flight.cancelled == 1
+
+@pytest.mark.asyncio
+async def test_provider_limiter_admission_and_retry(monkeypatch):
+    """Concurrency cap, bounded queue, request bucket and Retry-After aware retries"""
+    import asyncio
+    import time
+    from app.services import provider_limiter
+    from app.services.provider_limiter import ProviderLimiter, ProviderBusyError, TransientProviderError, parse_retry_after
+
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+
+    limiter = ProviderLimiter("fake", max_concurrency=2, max_queue=1, queue_timeout=1.0)
+    active = {"now": 0, "peak": 0}
+
+    async def slow_call():
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.05)
+        active["now"] -= 1
+        return "ok"
+
+    # 两个在调用，一个排队，第四个因队列已满被拒绝
+    results = await asyncio.gather(*(limiter.run(slow_call) for _ in range(4)), return_exceptions=True)
+    assert results.count("ok") == 3
+    assert isinstance(results[3], ProviderBusyError)
+    assert active["peak"] == 2
+    stats = limiter.stats()
+    assert (stats["admitted"], stats["rejected"], stats["max_queue_depth"], stats["in_flight"]) == (3, 1, 1, 0)
+    assert stats["max_wait_seconds"] >= 0.04
+
+    # 每分钟600次 = 每秒补充10个：桶里只有1个令牌时，50ms后的第二次调用还需等待约50ms
+    limiter = ProviderLimiter("fake", rpm=600)
+    limiter._requests.tokens = 1
+    await limiter.run(slow_call)
+    await limiter.run(slow_call)
+    assert limiter.stats()["max_wait_seconds"] >= 0.04
+
+    # 429 按 Retry-After 暂停后重试；不可重试的错误直接抛出
+    limiter = ProviderLimiter("fake", max_retries=2, retry_base_delay=0.01)
+    attempts = []
+
+    async def rate_limited_once():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise TransientProviderError("Too Many Requests", status_code=429, retry_after=0.1)
+        return "ok"
+
+    assert await limiter.run(rate_limited_once) == "ok"
+    assert attempts[1] - attempts[0] >= 0.1
+    assert (limiter.retries, limiter.rate_limited) == (1, 1)
+
+    async def always_503():
+        attempts.append(time.monotonic())
+        raise TransientProviderError("Service Unavailable", status_code=503)
+
+    attempts.clear()
+    with pytest.raises(TransientProviderError):
+        await limiter.run(always_503)
+    assert len(attempts) == 3
+
+    # 排队已满时 /chat 返回 503 和 Retry-After
+    from app.services import ai_service
+
+    async def busy(*args, **kwargs):
+        raise ProviderBusyError("AI provider openai is busy: wait queue is full", retry_after=2.5)
+
+    monkeypatch.setattr(ai_service.provider_router, "call", busy)
+    monkeypatch.setattr(ai_service.settings, "DEFAULT_AI_MODEL", "local")
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/chat/", json={"message": "hello", "use_history": False})
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers["Retry-After"] == "3"
+
+@pytest.mark.asyncio
+async def test_local_provider_intents_streaming_and_errors(monkeypatch):
+    """The local provider returns intent JSON, streams, samples latency and injects errors"""
+    import random
+    from app.services import ai_service, provider_limiter
+    from app.services.local_llm_service import sample_latency
+    from app.services.provider_limiter import TransientProviderError
+    from app.services.task_intent_service import parse_query_intent, parse_user_request
+
+    monkeypatch.setattr(settings, "DEFAULT_AI_MODEL", "local")
+    monkeypatch.setattr(settings, "LOCAL_INTENT_CLASSIFIER_ENABLED", False)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(provider_limiter, "_limiters", {})
+    assert settings.get_available_ai_model() == "local"
+    assert ai_service.get_available_providers() == ["local"]
+
+    intent = await parse_user_request("delete task 12")
+    assert (intent.intent_type, intent.task_data) == ("delete_task", {"id": 12})
+    intent = await parse_user_request("add buy milk")
+    assert intent.intent_type == "add_task" and intent.task_data["text"] == "buy milk"
+    intent = await parse_user_request("what tasks are due this week")
+    assert intent.is_query and intent.query_params["date_filter"] == "this_week"
+    assert (await parse_query_intent("今天的任务"))["date_filter"] == "today"
+
+    messages = [{"role": "user", "content": "how do I stay focused"}]
+    reply = await ai_service.chat_with_ai(messages)
+    chunks = [chunk async for chunk in ai_service.stream_chat_with_ai(messages)]
+    assert len(chunks) > 1 and "".join(chunks) == reply
+
+    # lognormal 分布的中位数等于配置的延迟
+    monkeypatch.setattr(settings, "LOCAL_LLM_LATENCY_MS", 100)
+    rng = random.Random(1)
+    samples = sorted(sample_latency(rng) for _ in range(1001))
+    assert 0.09 < samples[500] < 0.11
+    assert samples[-1] > 0.2
+
+    # 注入的503在准入层重试后仍然失败
+    monkeypatch.setattr(settings, "LOCAL_LLM_LATENCY_MS", 0)
+    monkeypatch.setattr(settings, "LOCAL_LLM_ERROR_RATE", 1.0)
+    monkeypatch.setattr(settings, "LOCAL_LLM_ERROR_STATUS", 503)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.01)
+    with pytest.raises(TransientProviderError):
+        await ai_service.chat_with_ai([{"role": "user", "content": "fail please"}])
+    assert provider_limiter.get_provider_limiter("local").retries == settings.LLM_MAX_RETRIES
+
+@pytest.mark.asyncio
+async def test_chat_messages_bulk_insert_and_write_behind(monkeypatch):
+    """A turn is saved with one INSERT; write-behind group-commits many turns and flushes on shutdown"""
+    import asyncio
+    import random
+    from sqlalchemy import func, select
+    from app.db.session import AsyncSessionLocal
+    from app.models.chat_message import ChatMessage
+    from app.models.user import User
+    from app.services.chat_message_service import ChatMessageService
+    from app.services.chat_message_writer import ChatMessageWriter
+
+    async def roles(user_id):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ChatMessage.role, ChatMessage.content).filter(ChatMessage.user_id == user_id).order_by(ChatMessage.id)
+            )
+            return [tuple(row) for row in result.all()]
+
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"writer_{random.randint(10000,99999)}@example.com", password_hash="x")
+        db.add(user)
+        await db.commit()
+        saved = await ChatMessageService.create_messages(
+            db, user.id, [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}], "local"
+        )
+    assert saved == 2
+    assert await roles(user.id) == [("user", "hi"), ("assistant", "hello")]
+
+    # buffered：入队即返回，后台worker把并发请求的消息合并成少量批次写入
+    writer = ChatMessageWriter(enabled=True, durability="buffered", max_pending=4, batch_size=50, flush_interval=0.05)
+    await asyncio.gather(*(
+        writer.save(user.id, [{"role": "user", "content": f"q{i}"}, {"role": "assistant", "content": f"a{i}"}])
+        for i in range(10)
+    ))
+    assert writer.backpressure_waits > 0
+    await writer.shutdown()
+    rows = await roles(user.id)
+    assert len(rows) == 22
+    assert rows[2:6] == [("user", "q0"), ("assistant", "a0"), ("user", "q1"), ("assistant", "a1")]
+    stats = writer.stats()
+    assert stats["written_messages"] == 20 and stats["batches"] < 10 and stats["pending"] == 0
+
+    # commit：save() 在所在批次提交后才返回
+    writer = ChatMessageWriter(enabled=True, durability="commit", flush_interval=0.01)
+    await writer.save(user.id, [{"role": "assistant", "content": "durable"}])
+    assert (await roles(user.id))[-1] == ("assistant", "durable")
+    await writer.shutdown()
+
+    with pytest.raises(ValueError):
+        ChatMessageWriter(durability="eventually")
+
+@pytest.mark.asyncio
+async def test_chat_history_day_groups_and_cursor():
+    """History is grouped by day in SQL with per-day counts, and older days load through the cursor"""
+    import random
+    from datetime import datetime, timedelta
+    from app.db.session import AsyncSessionLocal
+    from app.models.chat_message import ChatMessage
+    from app.models.user import User
+
+    email = f"history_{random.randint(10000,99999)}@example.com"
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/api/auth/register", json={"email": email, "password": "testpassword123"})
+        user_id = response.json()["id"]
+        response = await ac.post("/api/auth/login", json={"email": email, "password": "testpassword123"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        # 今天3条、昨天2条，20天前和30天前各1条
+        now = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+        async with AsyncSessionLocal() as db:
+            db.add_all(
+                [ChatMessage(user_id=user_id, role="user", content=f"today {i}", created_at=now + timedelta(minutes=i)) for i in range(3)]
+                + [ChatMessage(user_id=user_id, role="user", content=f"yesterday {i}", created_at=now - timedelta(days=1, minutes=-i)) for i in range(2)]
+                + [ChatMessage(user_id=user_id, role="user", content="old", created_at=now - timedelta(days=20)),
+                   ChatMessage(user_id=user_id, role="user", content="older", created_at=now - timedelta(days=30))]
+            )
+            await db.commit()
+
+        response = await ac.get("/chat-history/", params={"days": 7}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        groups = response.json()
+        assert [(g["date"], g["count"]) for g in groups] == [
+            (now.strftime("%Y-%m-%d"), 3), ((now - timedelta(days=1)).strftime("%Y-%m-%d"), 2)
+        ]
+        assert [m["content"] for m in groups[0]["messages"]] == ["today 0", "today 1", "today 2"]
+
+        # 更早的一页跳过空档，从20天前开始
+        response = await ac.get("/chat-history/", params={"days": 7, "cursor": response.headers["X-Next-Cursor"]}, headers=headers)
+        assert [m["content"] for g in response.json() for m in g["messages"]] == ["old"]
+        response = await ac.get("/chat-history/", params={"days": 7, "cursor": response.headers["X-Next-Cursor"]}, headers=headers)
+        assert [m["content"] for g in response.json() for m in g["messages"]] == ["older"]
+        assert "X-Next-Cursor" not in response.headers
+
+        # 一天的消息超过 limit 时跨页返回，count 仍是当天总数
+        response = await ac.get("/chat-history/", params={"days": 7, "limit": 2}, headers=headers)
+        groups = response.json()
+        assert [(g["count"], [m["content"] for m in g["messages"]]) for g in groups] == [(3, ["today 1", "today 2"])]
+        response = await ac.get("/chat-history/", params={"days": 7, "limit": 2, "cursor": response.headers["X-Next-Cursor"]}, headers=headers)
+        assert [[m["content"] for m in g["messages"]] for g in response.json()] == [["today 0"], ["yesterday 1"]]
+
+        response = await ac.get("/chat-history/", params={"cursor": "not-a-cursor"}, headers=headers)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+@pytest.mark.asyncio
+async def test_chat_archive_moves_old_messages_and_history_reads_them():
+    """Messages past retention move to compressed archive segments in chunks and still show up in history"""
+    import random
+    from datetime import datetime, timedelta
+    from sqlalchemy import func, select
+    from app.db.session import AsyncSessionLocal
+    from app.models.chat_message import ChatMessage
+    from app.models.chat_message_archive import ChatMessageArchive
+    from app.services.chat_archive_service import ChatArchiver
+    from app.services.bulk_delete_service import bulk_deleter
+
+    email = f"archive_{random.randint(10000,99999)}@example.com"
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/api/auth/register", json={"email": email, "password": "testpassword123"})
+        user_id = response.json()["id"]
+        response = await ac.post("/api/auth/login", json={"email": email, "password": "testpassword123"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        now = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+        async with AsyncSessionLocal() as db:
+            db.add_all(
+                [ChatMessage(user_id=user_id, role="user", content=f"ancient {i}", created_at=now - timedelta(days=120, minutes=-i)) for i in range(3)]
+                + [ChatMessage(user_id=user_id, role="assistant", content="old 您好", created_at=now - timedelta(days=100))]
+                + [ChatMessage(user_id=user_id, role="user", content="recent", created_at=now)]
+            )
+            await db.commit()
+
+        archiver = ChatArchiver(after_days=90, chunk_size=2)
+        assert await archiver.archive_expired() >= 4
+        assert archiver.stats()["archived_messages"] >= 4
+        async with AsyncSessionLocal() as db:
+            hot = await db.execute(select(ChatMessage.content).filter(ChatMessage.user_id == user_id))
+            assert hot.scalars().all() == ["recent"]
+            segments = await db.execute(
+                select(func.count(ChatMessageArchive.id), func.sum(ChatMessageArchive.message_count))
+                .filter(ChatMessageArchive.user_id == user_id)
+            )
+            # 每批2条：120天前的3条分成两段，100天前的1条一段
+            assert tuple(segments.one()) == (3, 4)
+
+        # 第一页只有近期消息，之后的页面透明地读取归档
+        response = await ac.get("/chat-history/", params={"days": 7}, headers=headers)
+        assert [m["content"] for g in response.json() for m in g["messages"]] == ["recent"]
+        response = await ac.get("/chat-history/", params={"days": 7, "cursor": response.headers["X-Next-Cursor"]}, headers=headers)
+        assert [(g["count"], [m["content"] for m in g["messages"]]) for g in response.json()] == [(1, ["old 您好"])]
+        response = await ac.get("/chat-history/", params={"days": 7, "limit": 2, "cursor": response.headers["X-Next-Cursor"]}, headers=headers)
+        groups = response.json()
+        assert [(g["count"], [m["content"] for m in g["messages"]]) for g in groups] == [(3, ["ancient 1", "ancient 2"])]
+        response = await ac.get("/chat-history/", params={"days": 7, "limit": 2, "cursor": response.headers["X-Next-Cursor"]}, headers=headers)
+        assert [m["content"] for g in response.json() for m in g["messages"]] == ["ancient 0"]
+        assert "X-Next-Cursor" not in response.headers
+
+        # 归档中的消息也可以单独删除，清空历史会删除归档
+        archived_id = groups[0]["messages"][0]["id"]
+        response = await ac.delete(f"/chat-history/{archived_id}", headers=headers)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        response = await ac.delete(f"/chat-history/{archived_id}", headers=headers)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = await ac.delete("/chat-history/", headers=headers)
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        await bulk_deleter.join()
+        async with AsyncSessionLocal() as db:
+            remaining = await db.execute(select(func.count(ChatMessageArchive.id)).filter(ChatMessageArchive.user_id == user_id))
+            assert remaining.scalar() == 0
+
+@pytest.mark.asyncio
+async def test_clear_history_runs_in_batches_in_background(monkeypatch):
+    """Clearing history returns 202 with a job, deletes in bounded batches, and leaves later messages alone"""
+    import random
+    from sqlalchemy import func, select
+    from app.db.session import AsyncSessionLocal
+    from app.models.chat_message import ChatMessage
+    from app.services.bulk_delete_service import bulk_deleter
+
+    monkeypatch.setattr(bulk_deleter, "batch_size", 2)
+    email = f"clear_{random.randint(10000,99999)}@example.com"
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/api/auth/register", json={"email": email, "password": "testpassword123"})
+        user_id = response.json()["id"]
+        response = await ac.post("/api/auth/login", json={"email": email, "password": "testpassword123"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        async with AsyncSessionLocal() as db:
+            db.add_all([ChatMessage(user_id=user_id, role="user", content=f"message {i}") for i in range(5)])
+            await db.commit()
+
+        response = await ac.delete("/chat-history/", headers=headers)
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        job = response.json()
+        assert job["kind"] == "chat_history" and job["total"] == 5
+        assert response.headers["Location"] == f"/chat-history/jobs/{job['id']}"
+        # 完成前重复提交返回同一个任务
+        response = await ac.delete("/chat-history/", headers=headers)
+        assert response.json()["id"] == job["id"]
+
+        # 提交之后写入的消息不会被删除
+        async with AsyncSessionLocal() as db:
+            db.add(ChatMessage(user_id=user_id, role="user", content="after clear"))
+            await db.commit()
+        await bulk_deleter.join()
+
+        response = await ac.get(f"/chat-history/jobs/{job['id']}", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        job = response.json()
+        assert (job["status"], job["deleted"], job["batches"]) == ("done", 5, 3)
+        async with AsyncSessionLocal() as db:
+            remaining = await db.execute(select(ChatMessage.content).filter(ChatMessage.user_id == user_id))
+            assert remaining.scalars().all() == ["after clear"]
+
+        # 其他用户查不到该任务
+        response = await ac.post("/api/auth/register", json={"email": f"other_{email}", "password": "testpassword123"})
+        response = await ac.post("/api/auth/login", json={"email": f"other_{email}", "password": "testpassword123"})
+        other = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = await ac.get(f"/chat-history/jobs/{job['id']}", headers=other)
+        assert response.status_code == status.HTTP_200_OK
+        assert (response.json()["status"], response.json()["deleted"]) == ("unknown", None)
@@ -0,0 +1,123 @@
+import pytest
+from httpx import AsyncClient
+from fastapi import status
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.main import app
+from app.db.base import Base
+from app.db.pool import InstrumentedAsyncQueuePool, get_pool_status
+from app.db.session import AsyncSessionLocal, async_engine, engine, get_async_database_url
+from app.models.chat_message import ChatMessage
+from app.models.task import Task
+from app.models.user import User
+from app.services.chat_message_service import ChatMessageService
+from app.services.task_intent_service import get_tasks_by_query
+
+import random
+
+# Ensure all tables are created before tests
+Base.metadata.create_all(bind=engine)
+
+def test_async_database_url_mapping():
+    assert get_async_database_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+    assert get_async_database_url("postgres://u:p@host/db") == "postgresql+asyncpg://u:p@host/db"
+    assert get_async_database_url("postgresql://u:p@host/db?sslmode=require") == "postgresql+asyncpg://u:p@host/db?ssl=require"
+
+@pytest.mark.asyncio
+async def test_pool_status_tracks_checkouts_and_waits(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.05,
+    )
+    first = await engine.connect()
+    second = await engine.connect()
+    snapshot = get_pool_status(engine.pool)
+    assert snapshot["checked_out"] == 2
+    assert snapshot["overflow"] == 1
+    assert snapshot["acquisitions"] == 2
+    # 连接池已满，第三次获取应超时并被记录
+    with pytest.raises(exc.TimeoutError):
+        await engine.connect()
+    assert get_pool_status(engine.pool)["timeouts"] == 1
+    await first.close()
+    await second.close()
+    snapshot = get_pool_status(engine.pool)
+    assert snapshot["checked_out"] == 0
+    assert snapshot["idle"] == 1
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_db_pool_status_endpoint():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/health/db")
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert "checked_out" in data
+        assert "idle" in data
+        assert "overflow" in data
+        assert "total_wait_seconds" in data
+
+async def explain(conn, statement, parameters):
+    """
+    返回语句的执行计划文本（SQLite 使用 EXPLAIN QUERY PLAN，PostgreSQL 使用 EXPLAIN）
+    """
+    if async_engine.dialect.name == "postgresql":
+        # 测试库数据量很小，关闭顺序扫描以确认索引可被选用
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+        rows = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+        return "\n".join(row[0] for row in rows)
+    rows = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    return "\n".join(row[-1] for row in rows)
+
+@pytest.mark.asyncio
+async def test_hot_queries_use_composite_indexes():
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"explain_{random.randint(10000,99999)}@example.com", password_hash="x")
+        db.add(user)
+        await db.commit()
+        db.add_all([Task(user_id=user.id, text=f"task {i}", status="todo") for i in range(5)])
+        db.add_all([ChatMessage(user_id=user.id, role="user", content=f"hi {i}") for i in range(5)])
+        await db.commit()
+
+        event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            async with AsyncClient(app=app, base_url="http://test") as ac:
+                response = await ac.get(f"/api/tasks/user/{user.id}", params={"status": "todo"})
+                assert response.status_code == status.HTTP_200_OK
+                response = await ac.get(f"/api/tasks/user/{user.id}", params={"limit": 2})
+                assert response.status_code == status.HTTP_200_OK
+            await get_tasks_by_query(user.id, {"status": "todo", "type": "todo", "date_filter": "this_week"}, db)
+            await ChatMessageService.get_messages_for_context(db, user.id)
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+
+    expected = {
+        "ix_tasks_user_id_status_due_date": "tasks.status",
+        "ix_tasks_user_id_due_date_id": "LIMIT",
+        "ix_tasks_user_id_status_type_due_date": "tasks.type",
+        "ix_chat_messages_user_id_created_at": "FROM chat_messages",
+    }
+    plans = {}
+    async with async_engine.connect() as conn:
+        for statement, parameters in captured:
+            if "count(" in statement:
+                continue
+            plans[statement] = await explain(conn, statement, parameters)
+
+    for index_name, marker in expected.items():
+        matching = [plan for statement, plan in plans.items() if marker in statement]
+        assert matching, f"no captured query for {index_name}"
+        assert any(index_name in plan for plan in matching), f"{index_name} not used: {matching}"
+    for statement, plan in plans.items():
+        if "FROM tasks" in statement or "FROM chat_messages" in statement:
+            # 不允许出现全表扫描
+            assert "SCAN tasks" not in plan and "SCAN chat_messages" not in plan and "Seq Scan" not in plan, plan
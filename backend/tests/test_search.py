@@ -0,0 +1,76 @@
+import pytest
+from httpx import AsyncClient
+from fastapi import status
+from app.main import app
+from app.db.base import Base
+from app.db.session import engine
+
+import random
+
+# Ensure all tables are created before tests
+Base.metadata.create_all(bind=engine)
+
+async def login(ac: AsyncClient, prefix: str):
+    email = f"{prefix}_{random.randint(10000,99999)}@example.com"
+    response = await ac.post("/api/auth/register", json={"email": email, "password": "testpassword123"})
+    user_id = response.json()["id"]
+    response = await ac.post("/api/auth/login", json={"email": email, "password": "testpassword123"})
+    return user_id, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.mark.asyncio
+async def test_search_tasks_and_messages():
+    from app.db.session import AsyncSessionLocal
+    from app.services.chat_message_service import ChatMessageService
+    from app.utils.text_search import search_tokens
+
+    assert search_tokens("完成季度报告 Draft2") == "完成 成季 季度 度报 报告 draft2"
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        user_id, headers = await login(ac, "searchuser")
+        other_id, other_headers = await login(ac, "searchother")
+        report = (await ac.post("/api/tasks/", json={"user_id": user_id, "text": "完成季度报告"})).json()
+        gym = (await ac.post("/api/tasks/", json={"user_id": user_id, "text": "Go to the gym 健身"})).json()
+        await ac.post("/api/tasks/", json={"user_id": other_id, "text": "别人的季度报告"})
+        async with AsyncSessionLocal() as db:
+            await ChatMessageService.create_messages(db, user_id, [
+                {"role": "user", "content": "季度报告什么时候交？"},
+                {"role": "assistant", "content": "The quarterly report is due Friday."},
+            ])
+
+        async def search(q, **params):
+            response = await ac.get("/api/search", params={"q": q, **params}, headers=headers)
+            assert response.status_code == status.HTTP_200_OK
+            return response
+
+        # 中文按子串匹配，只返回当前用户的结果
+        results = (await search("季度报告")).json()
+        assert sorted((r["type"], r["text"]) for r in results) == [("message", "季度报告什么时候交？"), ("task", "完成季度报告")]
+        assert all(r["score"] > 0 for r in results)
+        assert [r["id"] for r in (await search("报告", type="task")).json()] == [report["id"]]
+        assert (await search("告完")).json() == []
+        # 英文不区分大小写，最后一个单词按前缀匹配
+        assert [r["role"] for r in (await search("Quarterly rep")).json()] == ["assistant"]
+        assert [r["status"] for r in (await search("GYM")).json()] == ["todo"]
+
+        # 修改和删除任务后索引同步更新
+        await ac.patch(f"/api/tasks/{gym['id']}", json={"text": "晨跑三公里"})
+        assert (await search("gym")).json() == []
+        assert [r["id"] for r in (await search("晨跑")).json()] == [gym["id"]]
+        await ac.delete(f"/api/tasks/{report['id']}")
+        assert [r["type"] for r in (await search("季度")).json()] == ["message"]
+
+        # 分页
+        async with AsyncSessionLocal() as db:
+            await ChatMessageService.create_messages(db, user_id, [
+                {"role": "user", "content": f"plan week {i}"} for i in range(5)
+            ])
+        response = await search("plan week", limit=3)
+        first = response.json()
+        response = await search("plan week", limit=3, cursor=response.headers["X-Next-Cursor"])
+        second = response.json()
+        assert len(first) == 3 and len(second) == 2 and "X-Next-Cursor" not in response.headers
+        assert {r["id"] for r in first}.isdisjoint(r["id"] for r in second)
+
+        assert (await search("！？")).json() == []
+        response = await ac.get("/api/search", params={"q": "报告"})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
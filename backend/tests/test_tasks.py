@@ -0,0 +1,389 @@
+import pytest
+from httpx import AsyncClient
+from fastapi import status
+from app.main import app
+from app.db.base import Base
+from app.db.session import engine
+
+import datetime
+import random
+
+# Ensure all tables are created before tests
+Base.metadata.create_all(bind=engine)
+
+async def register_user(ac: AsyncClient, prefix: str) -> int:
+    unique_email = f"{prefix}_{random.randint(10000,99999)}@example.com"
+    response = await ac.post("/api/auth/register", json={"email": unique_email, "password": "testpassword123"})
+    return response.json()["id"]
+
+@pytest.mark.asyncio
+async def test_user_tasks_keyset_pagination():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        user_id = await register_user(ac, "pageuser")
+        # 两个任务共享同一截止日期，另有一个没有截止日期
+        due_dates = ["2025-01-03T09:00:00", "2025-01-01T09:00:00", None, "2025-01-01T09:00:00", "2025-01-02T09:00:00"]
+        for i, due_date in enumerate(due_dates):
+            await ac.post("/api/tasks/", json={"user_id": user_id, "text": f"task {i}", "due_date": due_date})
+
+        full = (await ac.get(f"/api/tasks/user/{user_id}")).json()
+        assert len(full) == 5
+        assert full[-1]["due_date"] is None
+
+        pages, cursor = [], None
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = await ac.get(f"/api/tasks/user/{user_id}", params=params)
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.json()) <= 2
+            pages.extend(response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert [t["id"] for t in pages] == [t["id"] for t in full]
+
+        response = await ac.get(f"/api/tasks/user/{user_id}", params={"limit": 2, "cursor": "not-a-cursor"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        # 每页有上限，不能一次取出全部任务
+        response = await ac.get(f"/api/tasks/user/{user_id}", params={"limit": 201})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+@pytest.mark.asyncio
+async def test_user_tasks_conditional_get():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        user_id = await register_user(ac, "etaguser")
+        response = await ac.post("/api/tasks/", json={"user_id": user_id, "text": "Write report"})
+        task_id = response.json()["id"]
+
+        response = await ac.get(f"/api/tasks/user/{user_id}")
+        etag = response.headers["ETag"]
+        response = await ac.get(f"/api/tasks/user/{user_id}", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+
+        # 连续两次修改也必须产生不同的ETag
+        await ac.patch(f"/api/tasks/{task_id}", json={"status": "done"})
+        response = await ac.get(f"/api/tasks/user/{user_id}", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        done_etag = response.headers["ETag"]
+        assert done_etag != etag
+        await ac.patch(f"/api/tasks/{task_id}", json={"status": "todo"})
+        response = await ac.get(f"/api/tasks/user/{user_id}", headers={"If-None-Match": done_etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()[0]["status"] == "todo"
+
+@pytest.mark.asyncio
+async def test_batch_task_operations():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        user_id = await register_user(ac, "batchuser")
+        keep = (await ac.post("/api/tasks/", json={"user_id": user_id, "text": "keep"})).json()
+        drop = (await ac.post("/api/tasks/", json={"user_id": user_id, "text": "drop"})).json()
+
+        operations = [
+            {"op": "create", "user_id": user_id, "text": "new todo"},
+            {"op": "create", "user_id": user_id, "text": "bad ddl", "type": "ddl"},
+            {"op": "update", "id": keep["id"], "status": "done"},
+            {"op": "update", "id": keep["id"], "text": "kept"},
+            {"op": "delete", "id": drop["id"]},
+            {"op": "delete", "id": drop["id"]},
+        ]
+        response = await ac.post("/api/tasks/batch", json={"operations": operations})
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["committed"] is True
+        codes = [r["status_code"] for r in data["results"]]
+        assert codes == [201, 422, 200, 200, 204, 404]
+        assert data["results"][0]["task"]["text"] == "new todo"
+        assert data["results"][1]["error"] == "DDL task requires due_date."
+        assert data["results"][3]["task"]["status"] == "done"
+        assert data["results"][3]["task"]["text"] == "kept"
+
+        tasks = (await ac.get(f"/api/tasks/user/{user_id}")).json()
+        assert sorted(t["text"] for t in tasks) == ["kept", "new todo"]
+        assert all(t["updated_at"] for t in tasks)
+
+@pytest.mark.asyncio
+async def test_batch_task_operations_atomic():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        user_id = await register_user(ac, "atomicuser")
+        operations = [
+            {"op": "create", "user_id": user_id, "text": "first"},
+            {"op": "update", "id": 999999999, "status": "done"},
+        ]
+        response = await ac.post("/api/tasks/batch", json={"operations": operations, "atomic": True})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["committed"] is False
+        tasks = (await ac.get(f"/api/tasks/user/{user_id}")).json()
+        assert tasks == []
+
+@pytest.mark.asyncio
+async def test_task_changes_delta_sync():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        user_id = await register_user(ac, "syncuser")
+        first = (await ac.post("/api/tasks/", json={"user_id": user_id, "text": "first"})).json()
+        second = (await ac.post("/api/tasks/", json={"user_id": user_id, "text": "second"})).json()
+
+        response = await ac.get("/api/tasks/changes", params={"user_id": user_id})
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["full_resync"] is True
+        assert {t["id"] for t in data["tasks"]} == {first["id"], second["id"]}
+        token = data["sync_token"]
+
+        await ac.patch(f"/api/tasks/{first['id']}", json={"status": "done"})
+        await ac.delete(f"/api/tasks/{second['id']}")
+        third = (await ac.post("/api/tasks/", json={"user_id": user_id, "text": "third"})).json()
+
+        data = (await ac.get("/api/tasks/changes", params={"user_id": user_id, "since": token})).json()
+        assert data["full_resync"] is False
+        changed = {t["id"]: t for t in data["tasks"]}
+        assert changed[first["id"]]["status"] == "done"
+        assert third["id"] in changed
+        assert second["id"] not in changed
+        assert data["deleted_ids"] == [second["id"]]
+
+        response = await ac.get("/api/tasks/changes", params={"user_id": user_id, "since": "garbage"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+@pytest.mark.asyncio
+async def test_task_list_cache_invalidation():
+    from app.services.task_cache import task_list_cache
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        user_id = await register_user(ac, "cacheuser")
+        task = (await ac.post("/api/tasks/", json={"user_id": user_id, "text": "cached"})).json()
+
+        await ac.get(f"/api/tasks/user/{user_id}")
+        hits = task_list_cache.hits
+        response = await ac.get(f"/api/tasks/user/{user_id}")
+        assert task_list_cache.hits == hits + 1
+        assert [t["text"] for t in response.json()] == ["cached"]
+
+        # 每条写路径都必须让缓存失效
+        await ac.patch(f"/api/tasks/{task['id']}", json={"text": "renamed"})
+        assert [t["text"] for t in (await ac.get(f"/api/tasks/user/{user_id}")).json()] == ["renamed"]
+        await ac.post("/api/tasks/batch", json={"operations": [{"op": "create", "user_id": user_id, "text": "second"}]})
+        assert len((await ac.get(f"/api/tasks/user/{user_id}")).json()) == 2
+        await ac.delete(f"/api/tasks/{task['id']}")
+        assert [t["text"] for t in (await ac.get(f"/api/tasks/user/{user_id}")).json()] == ["second"]
+
+        response = await ac.get("/health/cache")
+        assert response.json()["task_lists"]["invalidations"] >= 3
+
+def test_lru_cache_bounds_and_ttl():
+    from app.utils.cache import LRUCache, MISSING
+    cache = LRUCache(max_entries=2, ttl=60, max_bytes=100)
+    cache.set("a", 1, size=10)
+    cache.set("b", 2, size=10)
+    cache.get("a")
+    cache.set("c", 3, size=10)
+    # b 最久未使用，被淘汰
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    cache.set("big", 4, size=95)
+    assert len(cache) == 1 and cache.stats()["bytes"] == 95
+    cache.set("short", 5, ttl=0.0)
+    assert cache.get("short") is MISSING
+    assert cache.stats()["evictions"] == 3
+
+@pytest.mark.asyncio
+async def test_delete_user_tasks_in_background_batches(monkeypatch):
+    from app.services.bulk_delete_service import bulk_deleter
+
+    async def register_and_login(prefix):
+        email = f"{prefix}_{random.randint(10000,99999)}@example.com"
+        response = await ac.post("/api/auth/register", json={"email": email, "password": "testpassword123"})
+        user_id = response.json()["id"]
+        response = await ac.post("/api/auth/login", json={"email": email, "password": "testpassword123"})
+        return user_id, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    monkeypatch.setattr(bulk_deleter, "batch_size", 2)
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        user_id, headers = await register_and_login("purgeuser")
+        other_id, other_headers = await register_and_login("keepuser")
+        for i in range(3):
+            await ac.post("/api/tasks/", json={"user_id": user_id, "text": f"task {i}"})
+        await ac.post("/api/tasks/", json={"user_id": other_id, "text": "keep me"})
+        sync_token = (await ac.get("/api/tasks/changes", params={"user_id": user_id})).json()["sync_token"]
+        # 先缓存任务列表，删除后应失效
+        assert len((await ac.get(f"/api/tasks/user/{user_id}")).json()) == 3
+
+        # 需要登录，且只能删除自己的任务
+        response = await ac.delete(f"/api/tasks/user/{user_id}")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        response = await ac.delete(f"/api/tasks/user/{user_id}", headers=other_headers)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+        response = await ac.delete(f"/api/tasks/user/{user_id}", headers=headers)
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        job = response.json()
+        assert job["kind"] == "tasks" and job["total"] == 3
+        await bulk_deleter.join()
+
+        location = response.headers["Location"]
+        assert (await ac.get(location)).status_code == status.HTTP_401_UNAUTHORIZED
+        assert (await ac.get(location, headers=other_headers)).json()["status"] == "unknown"
+        response = await ac.get(location, headers=headers)
+        assert (response.json()["status"], response.json()["deleted"], response.json()["batches"]) == ("done", 3, 2)
+        assert (await ac.get(f"/api/tasks/user/{user_id}")).json() == []
+        assert len((await ac.get(f"/api/tasks/user/{other_id}")).json()) == 1
+        # 增量同步的客户端收到全部删除
+        changes = (await ac.get("/api/tasks/changes", params={"user_id": user_id, "since": sync_token})).json()
+        assert len(changes["deleted_ids"]) == 3
+
+        # 本进程中没有的任务（可能由其他worker受理）返回 unknown 而不是404
+        response = await ac.get("/api/tasks/delete-jobs/0123456789abcdef", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["status"] == "unknown"
+
+@pytest.mark.asyncio
+async def test_llm_response_cache(monkeypatch, tmp_path):
+    from app.services import task_intent_service
+    from app.services.llm_cache import LLMResponseCache, SQLiteLLMCacheStore
+
+    calls = []
+    system_prompts = []
+
+    async def fake_chat_with_ai(messages, model_provider=None, system_prompt=None, json_mode=False):
+        calls.append(messages[-1]["content"])
+        system_prompts.append(messages[0]["content"])
+        if "tomorrow" in messages[-1]["content"]:
+            return '{"action": "add_task", "task": {"text": "report", "due_date": "2025-06-15"}, "confirmation_prompt": "ok?"}'
+        if "this week" in messages[-1]["content"]:
+            return '{"action": "add_task", "task": {"text": "review"}, "confirmation_prompt": "ok?"}'
+        return '{"status": "todo", "type": "all", "date_filter": "today"}'
+
+    store = SQLiteLLMCacheStore(str(tmp_path / "llm_cache.db"), max_rows=100)
+    cache = LLMResponseCache(max_entries=100, ttl=3600, store=store)
+    # 只测试LLM缓存，跳过本地意图分类
+    monkeypatch.setattr(task_intent_service.settings, "LOCAL_INTENT_CLASSIFIER_ENABLED", False)
+    monkeypatch.setattr(task_intent_service, "llm_response_cache", cache)
+    monkeypatch.setattr(task_intent_service, "chat_with_ai", fake_chat_with_ai)
+
+    # 空白和大小写不同的同一条消息只调用一次模型
+    first = await task_intent_service.parse_query_intent("Show my tasks  TODAY")
+    second = await task_intent_service.parse_query_intent(" show my tasks today ")
+    assert first == second and len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+    # 持久层在新的缓存实例（模拟重启）中仍然命中
+    restarted = LLMResponseCache(max_entries=100, ttl=3600, store=store)
+    monkeypatch.setattr(task_intent_service, "llm_response_cache", restarted)
+    await task_intent_service.parse_query_intent("show my tasks today")
+    assert len(calls) == 1 and restarted.stats()["persistent_hits"] == 1
+
+    # 意图解析的请求带有当前日期，无论结果是否含具体日期，都只在当天有效
+    await task_intent_service.parse_user_request("add report due tomorrow")
+    await task_intent_service.parse_user_request("add report due tomorrow")
+    await task_intent_service.parse_user_request("add review this week")
+    assert len(calls) == 3
+    # 系统提示中的日期和缓存按天划分都使用UTC日期
+    assert datetime.datetime.utcnow().date().isoformat() in system_prompts[-1]
+    monkeypatch.setattr(task_intent_service, "utc_today", lambda: datetime.date(2099, 1, 1))
+    await task_intent_service.parse_user_request("add report due tomorrow")
+    await task_intent_service.parse_user_request("add review this week")
+    assert len(calls) == 5
+    assert "2099-01-01" in system_prompts[-1]
+    # 查询参数解析不带日期，结果跨天复用
+    await task_intent_service.parse_query_intent("show my tasks today")
+    assert len(calls) == 5
+    store.close()
+
+@pytest.mark.asyncio
+async def test_intent_parsing_fails_over_to_other_provider(monkeypatch):
+    from app.services import ai_service, task_intent_service
+    from app.services.provider_router import ProviderRouter
+
+    monkeypatch.setattr(ai_service, "provider_router", ProviderRouter(failure_threshold=100))
+    monkeypatch.setattr(ai_service, "get_available_providers", lambda: ["openai", "gemini"])
+    monkeypatch.setattr(ai_service, "resolve_model_provider", lambda provider=None: provider or "openai")
+    monkeypatch.setattr(task_intent_service.settings, "LOCAL_INTENT_CLASSIFIER_ENABLED", False)
+    monkeypatch.setattr(task_intent_service.llm_response_cache, "enabled", False)
+    calls = []
+
+    async def failing_openai(messages, json_mode=False):
+        calls.append("openai")
+        raise Exception("OpenAI API error")
+
+    async def fake_gemini(messages, json_mode=False):
+        calls.append("gemini")
+        return '{"action": "delete_task", "task": {"id": 3}, "confirmation_prompt": "ok?"}'
+
+    monkeypatch.setattr(ai_service, "chat_with_openai", failing_openai)
+    monkeypatch.setattr(ai_service, "chat_with_gemini", fake_gemini)
+
+    # 未指定提供商时由路由器选择，主提供商失败后切换到gemini
+    intent = await task_intent_service.parse_user_request("删除任务3")
+    assert intent.is_delete and intent.task_data["id"] == 3
+    assert calls == ["openai", "gemini"]
+
+@pytest.mark.asyncio
+async def test_local_intent_classifier(monkeypatch):
+    import importlib.util
+    import os
+    from app.services import task_intent_service
+
+    calls = []
+
+    async def fake_chat_with_ai(messages, model_provider=None, system_prompt=None, json_mode=False):
+        calls.append(messages[-1]["content"])
+        return '{"action": "delete_task", "task": {"id": 3}, "confirmation_prompt": "ok?"}'
+
+    monkeypatch.setattr(task_intent_service.settings, "LOCAL_INTENT_CLASSIFIER_ENABLED", True)
+    monkeypatch.setattr(task_intent_service, "chat_with_ai", fake_chat_with_ai)
+    monkeypatch.setattr(task_intent_service.llm_response_cache, "enabled", False)
+
+    assert (await task_intent_service.parse_user_request("谢谢")).is_empty
+    intent = await task_intent_service.parse_user_request("提醒我明天交作业")
+    assert intent.is_create and intent.task_data["text"] == "交作业"
+    assert intent.task_data["due_date"] == (datetime.datetime.now().date() + datetime.timedelta(days=1)).isoformat() + "T00:00:00"
+    params = await task_intent_service.parse_query_intent("show my completed tasks")
+    assert params["status"] == "done"
+    assert calls == []
+
+    # 删除需要定位具体任务，交给LLM
+    assert (await task_intent_service.parse_user_request("删除任务3")).is_delete
+    assert calls == ["删除任务3"]
+
+    path = os.path.join(os.path.dirname(__file__), "..", "scripts", "evaluate_intent_classifier.py")
+    spec = importlib.util.spec_from_file_location("evaluate_intent_classifier", path)
+    evaluation = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(evaluation)
+    report = evaluation.evaluate(evaluation.load_samples(os.path.join(os.path.dirname(path), "intent_data", "eval.jsonl")))
+    assert report["precision"] >= 0.95
+    assert report["llm_calls_avoided"] >= 0.5
+
+@pytest.mark.asyncio
+async def test_analyze_query_intent_single_llm_call(monkeypatch):
+    from app.services import task_intent_service
+
+    calls = []
+
+    async def fake_chat_with_ai(messages, model_provider=None, system_prompt=None, json_mode=False):
+        calls.append(json_mode)
+        # 带代码块、别名和非法取值的结构化输出，需要在本地修复
+        return '```json\n{"action": "query", "task": {}, "query": {"status": "Completed", "date_filter": "yesterday"}}\n```'
+
+    monkeypatch.setattr(task_intent_service.settings, "LOCAL_INTENT_CLASSIFIER_ENABLED", False)
+    monkeypatch.setattr(task_intent_service, "chat_with_ai", fake_chat_with_ai)
+    monkeypatch.setattr(task_intent_service.llm_response_cache, "enabled", False)
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        email = f"intentuser_{random.randint(10000,99999)}@example.com"
+        response = await ac.post("/api/auth/register", json={"email": email, "password": "testpassword123"})
+        user_id = response.json()["id"]
+        await ac.post("/api/tasks/", json={"user_id": user_id, "text": "finished one"})
+        response = await ac.get(f"/api/tasks/user/{user_id}")
+        await ac.patch(f"/api/tasks/{response.json()[0]['id']}", json={"status": "done"})
+        await ac.post("/api/tasks/", json={"user_id": user_id, "text": "open one"})
+        response = await ac.post("/api/auth/login", json={"email": email, "password": "testpassword123"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = await ac.post("/api/tasks/intent", json={"message": "which ones did I wrap up"}, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        intent = response.json()["intent"]
+        assert intent["action"] == "query_task"
+        assert intent["query"]["status"] == "done" and intent["query"]["date_filter"] == "all"
+        assert [task["text"] for task in response.json()["tasks"]] == ["finished one"]
+        # 意图和查询条件只需要一次LLM调用
+        assert calls == [True]
@@ -1,8 +1,5 @@
-import 'dart:convert';
 import 'package:flutter_app/src/models/calendar_event.dart';
-import 'package:http/http.dart' as http;
-import '../config.dart';
-import '../models/task.dart';
+import 'task_service.dart';
 import 'package:device_calendar/device_calendar.dart' as device_cal;
 import 'package:add_2_calendar/add_2_calendar.dart';
 
@@ -20,18 +17,12 @@ class CalendarService {
     List<CalendarEvent> events = [];
     
     // Get tasks with due dates and convert them to events
-    final url = Uri.parse('$baseUrl/api/tasks/user/$userId');
-    final response = await http.get(url);
+    final tasks = await TaskService.fetchTasks(userId);
     
-    if (response.statusCode == 200) {
-      final List data = jsonDecode(response.body);
-      final tasks = data.map((e) => Task.fromJson(e)).toList();
-      
-      // Convert tasks with due dates to events
-      for (var task in tasks) {
-        if (task.dueDate != null) {
-          events.add(CalendarEvent.fromTask(task));
-        }
+    // Convert tasks with due dates to events
+    for (var task in tasks) {
+      if (task.dueDate != null) {
+        events.add(CalendarEvent.fromTask(task));
       }
     }
     
@@ -71,7 +71,8 @@ class ChatHistoryService {
         },
       );
       
-      if (response.statusCode != 204) {
+      // 202: history is deleted in the background; the server returns a job to poll
+      if (response.statusCode != 202 && response.statusCode != 204) {
         print('Error response: ${response.body}');
         throw Exception('Failed to clear history: ${response.statusCode}');
       }
@@ -4,12 +4,50 @@ import '../models/task.dart';
 import '../config.dart';
 
 class TaskService {
+  // 服务端每页最多返回的任务数
+  static const int pageSize = 200;
+
+  // 按请求URL缓存上一次的ETag、任务列表和下一页游标，列表未变化时服务端返回304
+  static final Map<String, String> _etags = {};
+  static final Map<String, List<Task>> _cachedTasks = {};
+  static final Map<String, String?> _nextCursors = {};
+
   static Future<List<Task>> fetchTasks(int userId, {String? status}) async {
-    final url = Uri.parse('$baseUrl/api/tasks/user/$userId${status != null ? '?status=$status' : ''}');
-    final response = await http.get(url);
-    if (response.statusCode == 200) {
+    // 按 X-Next-Cursor 逐页拉取，直到没有下一页
+    final tasks = <Task>[];
+    String? cursor;
+    do {
+      final page = await _fetchTaskPage(userId, status: status, cursor: cursor);
+      tasks.addAll(page.tasks);
+      cursor = page.nextCursor;
+    } while (cursor != null);
+    return tasks;
+  }
+
+  static Future<({List<Task> tasks, String? nextCursor})> _fetchTaskPage(int userId, {String? status, String? cursor}) async {
+    final url = Uri.parse('$baseUrl/api/tasks/user/$userId').replace(queryParameters: {
+      'limit': '$pageSize',
+      if (status != null) 'status': status,
+      if (cursor != null) 'cursor': cursor,
+    });
+    final cacheKey = url.toString();
+    final etag = _etags[cacheKey];
+    final response = await http.get(url, headers: {
+      if (etag != null && _cachedTasks.containsKey(cacheKey)) 'If-None-Match': etag,
+    });
+    if (response.statusCode == 304 && _cachedTasks.containsKey(cacheKey)) {
+      return (tasks: List<Task>.from(_cachedTasks[cacheKey]!), nextCursor: _nextCursors[cacheKey]);
+    } else if (response.statusCode == 200) {
       final List data = jsonDecode(response.body);
-      return data.map((e) => Task.fromJson(e)).toList();
+      final tasks = data.map((e) => Task.fromJson(e)).toList();
+      final nextCursor = response.headers['x-next-cursor'];
+      final newEtag = response.headers['etag'];
+      if (newEtag != null) {
+        _etags[cacheKey] = newEtag;
+        _cachedTasks[cacheKey] = tasks;
+        _nextCursors[cacheKey] = nextCursor;
+      }
+      return (tasks: List<Task>.from(tasks), nextCursor: nextCursor);
     } else {
       throw Exception('Failed to load tasks');
     }